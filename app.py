@@ -1,16 +1,22 @@
 import streamlit as st
-import os
-from dotenv import load_dotenv
-from src.agent import create_ollama_agent, create_chat_prompt, process_message
-from db.model import init_vector_store, init_retriever, init_memory, generate_encryption_key, save_message_to_vectorstore
-from utils.utils import ChatUI, get_env
-from src.exceptions import EncryptionError
+from src.agent import create_ollama_agent, stream_process_message
+from db.model import init_vector_store, init_knowledge_store, init_shard_router, init_retriever, save_message_to_vectorstore
+from utils.utils import ChatUI
+from utils.profiling import phase, profile_rerun
+from src.exceptions import GenerationCancelled, UpstreamUnavailableError
+from src.cancellation import start_generation
+from src.pipeline import prepare_turn
+from src.tokens import TurnStats, preload_tokenizer
+from src.sessions import SessionManager, load_memory
+from src.settings import SettingsWatcher, get_settings, on_reload
 import logging.config
 from datetime import datetime
-from langchain.memory import ConversationBufferMemory
-import time
-from typing import Iterator
-from cryptography.fernet import Fernet
+from typing import TYPE_CHECKING
+
+# Heavy dependencies (LangChain, Chroma, cryptography) are only imported when
+# first used; see utils/importtime.py for the cold-start import profile.
+if TYPE_CHECKING:
+    from cryptography.fernet import Fernet
 
 # Configure logging
 logging_config = {
@@ -48,22 +54,38 @@ logging_config = {
 logging.config.dictConfig(logging_config)
 logger = logging.getLogger(__name__)
 
-# Load environment variables
-load_dotenv()
+# Load .env and db/config.json once per process; see src/settings.py
+get_settings()
+
+@st.cache_resource
+def get_settings_watcher() -> SettingsWatcher:
+    """Get the process-wide watcher that hot-reloads .env and db/config.json."""
+    return SettingsWatcher.from_env().start()
+
+@st.cache_resource
+def start_tokenizer_load():
+    """Load the token counter off the request path, once per process."""
+    return preload_tokenizer(get_settings().ollama_model)
 
 def initialize_session_state():
-    """Initialize session state variables."""
+    """Initialize session state variables and return this session's state."""
     try:
         if 'chat_ui' not in st.session_state:
-            st.session_state.chat_ui = ChatUI()
+            with phase("chat_ui"):
+                st.session_state.chat_ui = ChatUI()
         if 'cipher_suite' not in st.session_state:
-            # Generate and store Fernet cipher suite
-            key = Fernet.generate_key()
-            st.session_state.cipher_suite = Fernet(key)
+            from cryptography.fernet import Fernet
+            from src.records import get_cipher
+
+            # Use the shared key when configured (so pre-seeded records and
+            # batch results are readable), else a per-session key
+            key = get_settings().encryption_key or Fernet.generate_key()
+            st.session_state.cipher_suite = get_cipher(key)
         if 'start_time' not in st.session_state:
             st.session_state.start_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        if 'total_tokens' not in st.session_state:
-            st.session_state.total_tokens = 0
+        session = get_session()
+        session.state.setdefault('total_tokens', 0)
+        return session
     except Exception as e:
         logger.error(f"Error initializing session state: {str(e)}")
         raise
@@ -76,8 +98,9 @@ def display_sidebar_info():
         
         # Model information
         st.subheader("🤖 Model Information")
-        st.write(f"Model: {get_env('OLLAMA_MODEL')}")
-        st.write(f"Temperature: {get_env('TEMPERATURE')}")
+        settings = get_settings()
+        st.write(f"Model: {settings.ollama_model}")
+        st.write(f"Temperature: {settings.temperature}")
         
         # Chat statistics
         st.subheader("📊 Chat Statistics")
@@ -101,11 +124,81 @@ def display_sidebar_info():
         if st.button("Export Chat"):
             export_chat_history()
 
-def initialize_chat_components():
+def get_session_id() -> str:
+    """Stable id of this browser session (model host affinity)."""
+    if 'session_id' not in st.session_state:
+        import uuid
+        st.session_state.session_id = str(uuid.uuid4())
+    return st.session_state.session_id
+
+@st.cache_resource
+def get_session_manager() -> SessionManager:
+    """Get the process-wide session manager with its sweeper running."""
+    manager = SessionManager.from_env().start()
+
+    @on_reload
+    def _reconfigure(old, new, changed):
+        manager.configure(new.session_max_active, new.session_max_bytes, new.session_idle_timeout, new.session_sweep_interval)
+
+    return manager
+
+def get_session():
+    """This session's evictable state, rehydrated if it was spilled to disk.
+
+    Chat history, the agent and token counters live here rather than in
+    st.session_state so idle browser tabs can be evicted.
+    """
+    session = get_session_manager().acquire(get_session_id())
+    st.session_state.chat_ui.bind(session.state)
+    return session
+
+@st.cache_resource
+def get_vector_store():
+    """Get the process-wide vector store so its index is loaded only once."""
+    return init_vector_store()
+
+@st.cache_resource
+def get_knowledge_store():
+    """Get the ingested documents collection (see db/ingest.py), if usable.
+
+    Documents are encrypted with ENCRYPTION_KEY, so sessions can only read
+    them when the app uses that key too. The collection is only opened once
+    KNOWLEDGE_K is above 0, which can be changed without a restart.
+    """
+    if not get_settings().encryption_key:
+        return None
+    return init_knowledge_store()[0]
+
+@st.cache_resource
+def get_shard_router():
+    """Get the process-wide shard router (None when sharding is disabled)."""
+    return init_shard_router()
+
+def get_tenant_id() -> str:
+    """Tenant whose shards this session may read and write.
+
+    The signed-in user when Streamlit authentication is configured, else
+    TENANT_ID from the server settings. Never taken from the URL, which any
+    visitor can edit to reach another tenant's shard.
+    """
+    user = getattr(st, "user", None)
+    if user is not None and user.get("is_logged_in"):
+        identity = user.get("email") or user.get("sub")
+        if identity:
+            return identity
+    return get_settings().tenant_id
+
+def initialize_chat_components(session):
     """Initialize all chat components."""
     try:
         # Initialize vector store and get embeddings
-        vectorstore, embeddings = init_vector_store()
+        router = get_shard_router()
+        if router is not None:
+            # Route this session to its tenant's shards only
+            vectorstore = router.for_tenant(get_tenant_id())
+            embeddings = router.embeddings
+        else:
+            vectorstore, embeddings = get_vector_store()
         logger.info("Vector store initialized successfully")
         
         # Initialize retriever - pass only vectorstore from tuple
@@ -116,9 +209,15 @@ def initialize_chat_components():
         st.session_state['vectorstore'] = vectorstore
         st.session_state['embeddings'] = embeddings
         
-        # Create agent with retriever
-        agent = create_ollama_agent(retriever)
-        logger.info("Chat agent created successfully")
+        # Create agent with retriever once per session so its conversation
+        # memory survives reruns; a rehydrated session restores its memory
+        if 'agent' not in session.state:
+            agent = create_ollama_agent(retriever, session_id=get_session_id())
+            if 'memory' in session.state:
+                load_memory(agent, session.state.pop('memory'))
+            session.state['agent'] = agent
+            logger.info("Chat agent created successfully")
+        agent = session.state['agent']
         
         return agent
         
@@ -126,33 +225,7 @@ def initialize_chat_components():
         logger.error(f"Failed to initialize chat components: {str(e)}")
         raise
 
-def process_streamed_response(agent_response: str) -> str:
-    """Process the agent response for streaming."""
-    try:
-        words = agent_response.split()
-        response_text = ""
-        for i in range(0, len(words), 3):
-            chunk = " ".join(words[i:i+3]) + " "
-            response_text += chunk
-            yield chunk
-            time.sleep(0.05)
-            
-        # Save assistant response to chat history
-        if 'chat_history' not in st.session_state:
-            st.session_state.chat_history = []
-            
-        st.session_state.chat_history.append({
-            'role': 'assistant',
-            'content': response_text.strip(),
-            'timestamp': datetime.now().isoformat(),
-            'encrypted': True
-        })
-        
-    except Exception as e:
-        logger.error(f"Error processing streamed response: {str(e)}")
-        yield agent_response  # Fallback to returning full response
-
-def save_to_vectorstore(message: str, cipher_suite: Fernet):
+def save_to_vectorstore(message: str, cipher_suite: "Fernet", cancel_token=None):
     """Save message to vector store with proper error handling."""
     try:
         # Save to vector store
@@ -160,22 +233,11 @@ def save_to_vectorstore(message: str, cipher_suite: Fernet):
             st.session_state.get('vectorstore'),
             st.session_state.get('embeddings'),
             message,
-            cipher_suite
+            cipher_suite,
+            cancel_token=cancel_token
         )
         logger.debug("Message saved to vector store successfully")
         
-        # Ensure message is added to chat history
-        if 'chat_history' not in st.session_state:
-            st.session_state.chat_history = []
-            
-        # Add message with timestamp
-        st.session_state.chat_history.append({
-            'role': 'user',
-            'content': message,
-            'timestamp': datetime.now().isoformat(),
-            'encrypted': True
-        })
-        
     except Exception as e:
         logger.error(f"Failed to save message to vector store: {str(e)}")
         raise
@@ -191,22 +253,45 @@ def main():
             initial_sidebar_state="expanded"
         )
         
-        # Initialize components
-        initialize_session_state()
-        agent = initialize_chat_components()
+        get_settings_watcher()
+        start_tokenizer_load()
+        settings = get_settings()
+        
+        # Initialize components; the agent and vector store are only built
+        # once there is a message to answer so the first render stays fast
+        with phase("session_state"):
+            session = initialize_session_state()
         
         # Sidebar
-        with st.sidebar:
+        with phase("sidebar"), st.sidebar:
             st.title("Settings & Info")
             
             # Model info
             with st.expander("🤖 Model Information", expanded=True):
-                st.write(f"Model: {get_env('OLLAMA_MODEL')}")
-                st.write(f"Temperature: {get_env('TEMPERATURE')}")
-                st.metric("Total Tokens", st.session_state.total_tokens)
+                st.write(f"Model: {settings.ollama_model}")
+                st.write(f"Temperature: {settings.temperature}")
+                st.metric("Total Tokens", session.state.get('total_tokens', 0))
+                last_turn = session.state.get('last_turn_stats')
+                if last_turn:
+                    st.caption(
+                        f"Last turn: {last_turn['prompt_tokens']} prompt / "
+                        f"{last_turn['completion_tokens']} completion tokens · "
+                        f"prefill {last_turn['prefill_tokens_per_second']} tok/s · "
+                        f"decode {last_turn['decode_tokens_per_second']} tok/s"
+                    )
+                    if last_turn.get('renders'):
+                        st.caption(
+                            f"Rendered {last_turn['chunks']} chunks in {last_turn['renders']} updates "
+                            f"({last_turn['bytes_sent'] / 1024:.0f} KiB sent)"
+                        )
+                    if last_turn.get('cached_prompt_tokens'):
+                        st.caption(
+                            f"Prompt cache: {last_turn['cached_prompt_tokens']} tokens reused, "
+                            f"~{last_turn['prefill_seconds_saved']}s prefill saved"
+                        )
             
             # Chat stats and history
-            with st.expander("📊 Chat Overview", expanded=True):
+            with phase("chat_stats"), st.expander("📊 Chat Overview", expanded=True):
                 display_chat_stats()
             
             # Recent conversations
@@ -225,10 +310,20 @@ def main():
             with st.expander("🎮 Controls", expanded=True):
                 if st.button("Clear History", use_container_width=True):
                     st.session_state.chat_ui.clear_chat_history()
-                    st.session_state.total_tokens = 0
+                    session.state['total_tokens'] = 0
                     st.experimental_rerun()
                 if st.button("Export Chat", use_container_width=True):
                     export_chat_history()
+            
+            # Per-process session memory report (operators only)
+            if settings.session_report:
+                with st.expander("🧠 Session Memory", expanded=False):
+                    report = get_session_manager().report()
+                    st.write(
+                        f"{report['live_sessions']} live ({report['live_bytes'] / 1024:.0f} KiB), "
+                        f"{report['spilled_sessions']} spilled, {report['evictions']} evictions"
+                    )
+                    st.dataframe(report['largest'], use_container_width=True)
         
         # Main chat area
         st.title("🔒 Secure Local Chatbot")
@@ -236,56 +331,96 @@ def main():
         
         # Chat container with messages
         chat_container = st.container()
-        with chat_container:
+        with phase("history"), chat_container:
             st.session_state.chat_ui.display_chat_history()
         
         # Input area at bottom
         with st.container():
             if user_input := st.chat_input("Type your message here..."):
-                process_user_input(user_input, agent)
+                with phase("chat_components"):
+                    agent = initialize_chat_components(session)
+                process_user_input(user_input, agent, session)
                 
+    except UpstreamUnavailableError as e:
+        logger.warning(f"Model server unavailable: {str(e)}")
+        st.warning("The assistant is temporarily unavailable. Please try again in a moment.")
     except Exception as e:
         logger.error(f"Application error: {str(e)}")
         st.error("An error occurred. Please try again.")
         if st.checkbox("Show error details"):
             st.exception(e)
 
-def process_user_input(user_input: str, agent):
+def process_user_input(user_input: str, agent, session):
     """Process user input and generate response."""
+    # Keep the session resident while the turn runs
+    get_session_manager().pin(session)
+    # A new message cancels the session's previous generation; the token is
+    # also cancelled when this run ends early (navigation, rerun, deadline)
+    settings = get_settings()
+    cancel_token = start_generation(
+        st.session_state,
+        deadline=settings.generation_deadline
+    )
     try:
         # Add user message first
         st.session_state.chat_ui.add_message("user", user_input)
         
-        # Process message and get response
-        with st.spinner("Assistant is thinking..."):
-            response, encrypted_response = process_message(
+        # Load memory and retrieve/decrypt context concurrently; the user
+        # message is encrypted and persisted in the background meanwhile
+        with phase("prepare_turn"):
+            prepared = prepare_turn(
                 agent,
                 user_input,
-                st.session_state.cipher_suite
+                st.session_state.get('vectorstore'),
+                st.session_state.get('embeddings'),
+                st.session_state.cipher_suite,
+                cancel_token=cancel_token,
+                knowledge_store=get_knowledge_store() if settings.knowledge_k > 0 else None
             )
         
-        if response:
-            # Stream the assistant's response
-            st.session_state.chat_ui.stream_message(
+        stats = TurnStats()
+        
+        # Stream the reply; reasoning is shown collapsed (or hidden) and only
+        # the answer is kept in history, memory and the vector store. A
+        # stream that fails midway raises after showing what arrived, so a
+        # truncated answer is reported below and never saved
+        with phase("generation"):
+            response = st.session_state.chat_ui.stream_reasoned_message(
                 "assistant",
-                process_streamed_response(response)
+                stream_process_message(agent, user_input, cancel_token=cancel_token, prepared=prepared, stats=stats),
+                show_reasoning=settings.reasoning_display != 'hidden'
             )
-            
-            # Only try to save to vector store if encryption was successful
-            if encrypted_response:
-                try:
-                    save_to_vectorstore(response, st.session_state.cipher_suite)
-                except Exception as e:
-                    logger.error(f"Failed to save to vector store: {str(e)}")
+        
+        session.state['total_tokens'] = session.state.get('total_tokens', 0) + stats.total_tokens
+        session.state['last_turn_stats'] = {**stats.as_dict(), **st.session_state.chat_ui.last_render_stats}
+        
+        if response:
+            try:
+                with phase("save"):
+                    save_to_vectorstore(response, st.session_state.cipher_suite, cancel_token=cancel_token)
+            except Exception as e:
+                logger.error(f"Failed to save to vector store: {str(e)}")
+            cancel_token.finish()
             
             # Rerun to update UI
             st.rerun()  # Updated from experimental_rerun
             
+    except GenerationCancelled as e:
+        logger.info(f"Generation stopped: {str(e)}")
+        if cancel_token.reason == "deadline exceeded":
+            st.warning("The response took too long and was stopped. Please try again.")
+    except UpstreamUnavailableError as e:
+        logger.warning(f"Model server unavailable: {str(e)}")
+        st.warning("The assistant is temporarily unavailable. Please try again in a moment.")
     except Exception as e:
         logger.error(f"Error processing user input: {str(e)}")
         st.error("Failed to process your message. Please try again.")
         if st.checkbox("Show error details"):
             st.exception(e)
+    finally:
+        # Covers Streamlit stopping the script mid-stream (rerun/navigation)
+        cancel_token.cancel("script run ended")
+        get_session_manager().unpin(session)
 
 def export_chat_history():
     """Export chat history as downloadable encrypted JSON."""
@@ -342,5 +477,7 @@ def display_chat_stats():
         st.error("Failed to display chat statistics")
 
 if __name__ == "__main__":
-    main()
+    # Opt-in per-rerun profiling (PROFILE_RERUNS, or ?profile=sample with PROFILE_TOKEN)
+    with profile_rerun(st.query_params):
+        main()
 
@@ -0,0 +1,353 @@
+"""Batch/offline entry point for the secure chat agent.
+
+Runs the same agent, retrieval and vector-store code as the Streamlit app,
+without the browser:
+
+    # Answer a file of prompts with 8 parallel conversations
+    python cli.py ask prompts.jsonl --output answers.enc --workers 8
+
+    # Seed the knowledge store with documents, 64 per embedding batch
+    python cli.py ingest docs.jsonl --batch-size 64
+
+    # Read an encrypted results file
+    python cli.py decrypt answers.enc
+
+Input files are JSONL (``{"id", "conversation_id", "content"}``; ``text``,
+``prompt`` and ``body`` are accepted too) or plain text with one item per
+line. Results are written as one encrypted record per line, keyed by
+ENCRYPTION_KEY (or --key-file). Both commands keep a checkpoint file next to
+their output and skip finished work when re-run. A conversation with a
+failed turn is answered again for context, but only its failed turns are
+written and saved again; stored answers have stable ids, so a retry
+overwrites them instead of adding duplicates.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List
+
+from src.settings import get_settings
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+logger = logging.getLogger("cli")
+
+TEXT_FIELDS = ("content", "text", "prompt", "body", "message")
+
+
+def load_cipher(key_file: str = None):
+    """Load the record cipher from --key-file or ENCRYPTION_KEY."""
+    from src.records import get_cipher
+
+    if key_file:
+        with open(key_file, "rb") as f:
+            key = f.read().strip()
+    else:
+        key = get_settings().encryption_key
+    if not key:
+        raise SystemExit("No encryption key: set ENCRYPTION_KEY or pass --key-file "
+                         "(create one with: python -c 'from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())')")
+    return get_cipher(key)
+
+
+def read_items(path: str) -> Iterator[Dict]:
+    """Yield {"id", "conversation_id", "content"} items from a JSONL or text file."""
+    is_jsonl = path.endswith((".jsonl", ".json"))
+    with open(path) as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if not is_jsonl:
+                yield {"id": str(line_no), "conversation_id": str(line_no), "content": line}
+                continue
+            record = json.loads(line)
+            content = next((record[name] for name in TEXT_FIELDS if record.get(name)), None)
+            if content is None:
+                logger.warning(f"Skipping line {line_no}: no text field")
+                continue
+            item_id = str(record.get("id") or record.get("request_id") or line_no)
+            yield {
+                "id": item_id,
+                "conversation_id": str(record.get("conversation_id") or item_id),
+                "content": str(content),
+                "metadata": record.get("metadata") or {},
+            }
+
+
+class Checkpoint:
+    """Append-only set of finished ids, safe to share between workers."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.done = set()
+        if os.path.exists(path):
+            with open(path) as f:
+                self.done = {line.strip() for line in f if line.strip()}
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self.done
+
+    def mark(self, item_ids: List[str]) -> None:
+        with self._lock:
+            with open(self.path, "a") as f:
+                for item_id in item_ids:
+                    f.write(item_id + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.done.update(item_ids)
+
+
+class EncryptedWriter:
+    """Appends one encrypted JSON record per line, flushed as it goes."""
+
+    def __init__(self, path: str, cipher_suite):
+        self.cipher_suite = cipher_suite
+        self._lock = threading.Lock()
+        self._file = open(path, "ab")
+
+    def write(self, records: List[Dict]) -> None:
+        tokens = [self.cipher_suite.encrypt(json.dumps(record).encode()) for record in records]
+        with self._lock:
+            for token in tokens:
+                self._file.write(token + b"\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+# ----------------------------------------------------------------------
+# ask
+# ----------------------------------------------------------------------
+def answer_turn(agent, message: str, cipher_suite, vectorstore=None, embeddings=None, knowledge_store=None, persist_message: bool = False) -> str:
+    """Answer one turn the way the app does: prepare_turn, then stream the reply.
+
+    Only the answer is returned and kept in the agent's memory; reasoning is
+    dropped. Raises on failure, including a reply past GENERATION_DEADLINE.
+    """
+    from src.agent import ANSWER, stream_process_message
+    from src.cancellation import CancelToken
+    from src.pipeline import prepare_turn
+
+    settings = get_settings()
+    cancel_token = CancelToken(deadline=settings.generation_deadline)
+    prepared = prepare_turn(
+        agent,
+        message,
+        vectorstore,
+        embeddings,
+        cipher_suite,
+        persist_message=persist_message,
+        cancel_token=cancel_token,
+        knowledge_store=knowledge_store if settings.knowledge_k > 0 else None,
+    )
+    try:
+        answer = "".join(
+            text for kind, text in stream_process_message(agent, message, cancel_token=cancel_token, prepared=prepared)
+            if kind == ANSWER
+        ).strip()
+        cancel_token.finish()
+    finally:
+        cancel_token.cancel("turn ended")
+    if prepared.persist is not None:
+        try:
+            prepared.persist.result()
+        except Exception:
+            # Already logged by the pipeline; the answer itself is fine
+            pass
+    return answer
+
+
+def run_conversation(conversation_id: str, turns: List[Dict], cipher_suite, vectorstore=None, embeddings=None, knowledge_store=None, persist_messages: bool = False) -> List[Dict]:
+    """Answer the turns of one conversation with its own agent and memory."""
+    from src.agent import create_ollama_agent
+
+    agent = create_ollama_agent(None, session_id=conversation_id)
+    records = []
+    for turn in turns:
+        start = time.perf_counter()
+        try:
+            response = answer_turn(
+                agent, turn["content"], cipher_suite, vectorstore, embeddings, knowledge_store,
+                persist_message=persist_messages,
+            )
+        except Exception as e:
+            logger.error(f"Turn {turn['id']} of conversation {conversation_id} failed: {str(e)}")
+            response = None
+        records.append({
+            "id": turn["id"],
+            "conversation_id": conversation_id,
+            "prompt": turn["content"],
+            "response": response,
+            "ok": bool(response),
+            "latency": round(time.perf_counter() - start, 3),
+        })
+    return records
+
+
+def turn_key(conversation_id: str, index: int) -> str:
+    """Checkpoint entry of one answered turn (conversations use their bare id)."""
+    return f"{conversation_id}#{index}"
+
+
+def turn_store_id(conversation_id: str, index: int) -> str:
+    """Stable vector-store id of a turn's answer, so re-saving overwrites it."""
+    return hashlib.sha256(turn_key(conversation_id, index).encode()).hexdigest()
+
+
+def cmd_ask(args) -> int:
+    cipher_suite = load_cipher(args.key_file)
+    checkpoint = Checkpoint(args.checkpoint or args.output + ".ckpt")
+
+    conversations: Dict[str, List[Dict]] = {}
+    for item in read_items(args.input):
+        conversations.setdefault(item["conversation_id"], []).append(item)
+    pending = {cid: turns for cid, turns in conversations.items() if cid not in checkpoint}
+    logger.info(f"{len(conversations)} conversations, {len(conversations) - len(pending)} already done")
+
+    from db.model import init_chat_stores
+
+    vectorstore, embeddings, knowledge_store = init_chat_stores()
+
+    writer = EncryptedWriter(args.output, cipher_suite)
+    failures = 0
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="ask") as pool:
+            futures = {
+                pool.submit(
+                    run_conversation, cid, turns, cipher_suite, vectorstore, embeddings, knowledge_store,
+                    persist_messages=args.save_to_store,
+                ): cid
+                for cid, turns in pending.items()
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                cid = futures[future]
+                try:
+                    records = future.result()
+                except Exception as e:
+                    failures += 1
+                    logger.error(f"Conversation {cid} failed: {str(e)}")
+                    continue
+                # Turns written by an earlier run were only re-answered to
+                # rebuild the conversation's memory
+                fresh = [(i, r) for i, r in enumerate(records) if turn_key(cid, i) not in checkpoint]
+                # Output first, then checkpoint: a crash in between re-runs
+                # the conversation rather than losing it
+                writer.write([r for _, r in fresh])
+                answered = [(i, r) for i, r in fresh if r["ok"]]
+                if args.save_to_store and answered:
+                    from db.model import save_messages_to_vectorstore
+                    save_messages_to_vectorstore(
+                        vectorstore, embeddings, [r["response"] for _, r in answered], cipher_suite,
+                        ids=[turn_store_id(cid, i) for i, _ in answered],
+                    )
+                if answered:
+                    checkpoint.mark([turn_key(cid, i) for i, _ in answered])
+                failed_turns = sum(1 for r in records if not r["ok"])
+                if failed_turns:
+                    # Not checkpointed, so the next run answers it again
+                    failures += failed_turns
+                    logger.warning(f"[{done}/{len(pending)}] conversation {cid}: {failed_turns} turns failed")
+                    continue
+                checkpoint.mark([cid])
+                logger.info(f"[{done}/{len(pending)}] conversation {cid} done")
+    finally:
+        writer.close()
+    return 1 if failures else 0
+
+
+# ----------------------------------------------------------------------
+# ingest
+# ----------------------------------------------------------------------
+def batched(items: List[Dict], size: int) -> Iterator[List[Dict]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def cmd_ingest(args) -> int:
+    from db.model import init_knowledge_store, save_messages_to_vectorstore
+
+    cipher_suite = load_cipher(args.key_file)
+    checkpoint = Checkpoint(args.checkpoint or args.input + ".ingest.ckpt")
+    items = [item for item in read_items(args.input) if item["id"] not in checkpoint]
+    logger.info(f"{len(items)} documents to ingest ({len(checkpoint.done)} already done)")
+    # The collection the app searches for KNOWLEDGE_K context, not chat history
+    vectorstore, embeddings = init_knowledge_store()
+
+    def ingest_batch(batch: List[Dict]) -> List[str]:
+        save_messages_to_vectorstore(
+            vectorstore,
+            embeddings,
+            [item["content"] for item in batch],
+            cipher_suite,
+            # Stable ids make a re-run after a crash overwrite, not duplicate
+            ids=[hashlib.sha256(item["id"].encode()).hexdigest() for item in batch],
+            metadatas=[{"source_id": item["id"], **item.get("metadata", {})} for item in batch],
+        )
+        return [item["id"] for item in batch]
+
+    failures = 0
+    with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="ingest") as pool:
+        futures = [pool.submit(ingest_batch, batch) for batch in batched(items, args.batch_size)]
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                checkpoint.mark(future.result())
+            except Exception as e:
+                failures += 1
+                logger.error(f"Batch failed: {str(e)}")
+            logger.info(f"[{done}/{len(futures)}] batches done")
+    return 1 if failures else 0
+
+
+# ----------------------------------------------------------------------
+# decrypt
+# ----------------------------------------------------------------------
+def cmd_decrypt(args) -> int:
+    cipher_suite = load_cipher(args.key_file)
+    with open(args.input, "rb") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                print(cipher_suite.decrypt(line).decode())
+    return 0
+
+
+def main(argv=None) -> int:
+    # Load .env and db/config.json before any component reads its settings
+    get_settings()
+    parser = argparse.ArgumentParser(description="Batch question answering and ingestion")
+    parser.add_argument("--key-file", help="File with the Fernet key (default: ENCRYPTION_KEY)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    ask = sub.add_parser("ask", help="Answer a file of prompts")
+    ask.add_argument("input")
+    ask.add_argument("--output", required=True, help="Encrypted JSONL results file (appended)")
+    ask.add_argument("--workers", type=int, default=4, help="Conversations processed in parallel")
+    ask.add_argument("--checkpoint", help="Checkpoint file (default: <output>.ckpt)")
+    ask.add_argument("--save-to-store", action="store_true", help="Also save prompts and answers to the vector store")
+    ask.set_defaults(func=cmd_ask)
+
+    ingest = sub.add_parser("ingest", help="Embed, encrypt and store documents")
+    ingest.add_argument("input")
+    ingest.add_argument("--batch-size", type=int, default=32, help="Documents per embedding call")
+    ingest.add_argument("--workers", type=int, default=2, help="Batches embedded in parallel")
+    ingest.add_argument("--checkpoint", help="Checkpoint file (default: <input>.ingest.ckpt)")
+    ingest.set_defaults(func=cmd_ingest)
+
+    decrypt = sub.add_parser("decrypt", help="Print an encrypted results file")
+    decrypt.add_argument("input")
+    decrypt.set_defaults(func=cmd_decrypt)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
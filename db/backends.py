@@ -0,0 +1,285 @@
+"""Vector-store backends.
+
+By default every process opens Chroma embedded on VECTOR_DB_PATH, which is
+fine for a single worker. With CHROMA_SERVER_HOST set, all collections live
+in a shared Chroma server instead, so N app workers behind a load balancer
+load the index once and never contend on the same SQLite file.
+CHROMA_BACKEND=memory gives an in-process, ephemeral stand-in for tests and
+benchmarks.
+
+Collections returned by ``open_store`` are wrapped in ``ManagedCollection``:
+calls are retried on transient errors, and concurrent upserts from many
+sessions are group-committed into one request.
+"""
+import os
+import time
+import logging
+import threading
+import weakref
+from concurrent.futures import Future
+from itertools import cycle
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.settings import Settings, get_settings, on_reload
+
+logger = logging.getLogger(__name__)
+
+# Collection methods that are safe to retry
+RETRIED_METHODS = ("add", "upsert", "update", "delete", "get", "query", "count", "peek")
+
+
+def get_backend() -> str:
+    """Backend from CHROMA_BACKEND, or "http" when CHROMA_SERVER_HOST is set."""
+    settings = get_settings()
+    return settings.chroma_backend or ("http" if settings.chroma_server_host else "persistent")
+
+
+def is_transient(error: Exception) -> bool:
+    """True for connection-level failures worth retrying."""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    name = type(error).__name__
+    return any(marker in name for marker in ("Connect", "Timeout", "RemoteProtocol", "ReadError", "WriteError"))
+
+
+def with_retry(fn: Callable, attempts: int = 3, backoff: float = 0.2, what: str = "vector store call"):
+    """Call ``fn`` and retry transient failures with exponential backoff."""
+    for attempt in range(1, attempts + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == attempts or not is_transient(e):
+                raise
+            delay = backoff * 2 ** (attempt - 1)
+            logger.warning(f"{what} failed ({type(e).__name__}), retry {attempt}/{attempts - 1} in {delay:.2f}s")
+            time.sleep(delay)
+
+
+class ClientPool:
+    """Round-robin pool of Chroma clients shared by the whole process."""
+
+    def __init__(self, factory: Callable[[], object], size: int = 1):
+        self.clients = [factory() for _ in range(max(1, size))]
+        self._cycle = cycle(self.clients)
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            return next(self._cycle)
+
+
+_pool: Optional[ClientPool] = None
+_pool_lock = threading.Lock()
+
+
+def _http_client():
+    import chromadb
+
+    settings = get_settings()
+    headers = {}
+    if settings.chroma_server_token:
+        headers["Authorization"] = f"Bearer {settings.chroma_server_token}"
+    return chromadb.HttpClient(
+        host=settings.chroma_server_host or "localhost",
+        port=settings.chroma_server_port,
+        ssl=settings.chroma_server_ssl,
+        headers=headers or None,
+    )
+
+
+def get_client_pool() -> Optional[ClientPool]:
+    """Process-wide client pool for the shared server or in-memory backend.
+
+    Returns None for the embedded backend, where each persist directory
+    gets its own client.
+    """
+    global _pool
+    backend = get_backend()
+    if backend == "persistent":
+        return None
+    with _pool_lock:
+        if _pool is None:
+            if backend == "http":
+                settings = get_settings()
+                _pool = ClientPool(_http_client, settings.chroma_pool_size)
+                with_retry(_pool.get().heartbeat, attempts=5, backoff=1.0, what="Chroma server heartbeat")
+                logger.info(f"Connected to Chroma server at {settings.chroma_server_host}")
+            else:
+                import chromadb
+
+                client = chromadb.EphemeralClient()
+                _pool = ClientPool(lambda: client, 1)
+        return _pool
+
+
+def list_collections(prefix: str = "") -> List[str]:
+    """Names of the collections on the shared backend starting with ``prefix``."""
+    pool = get_client_pool()
+    if pool is None:
+        return []
+    names = [getattr(c, "name", c) for c in with_retry(pool.get().list_collections, what="list collections")]
+    return sorted(name for name in names if name.startswith(prefix))
+
+
+class ManagedCollection:
+    """Chroma collection proxy with retries and group-committed upserts.
+
+    Upserts arriving within ``batch_delay`` seconds of each other (from
+    different sessions/threads) are merged into one request of at most
+    ``batch_size`` records; each caller still blocks until its own records
+    are written, so semantics do not change.
+    """
+
+    def __init__(self, collection, attempts: int = 3, backoff: float = 0.2, batch_size: int = 1, batch_delay: float = 0.02):
+        self._collection = collection
+        self.attempts = attempts
+        self.backoff = backoff
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self._pending: List[Tuple[Dict, Future]] = []
+        self._pending_lock = threading.Lock()
+        self._flush_timer: Optional[threading.Timer] = None
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name not in RETRIED_METHODS or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            return with_retry(lambda: attr(*args, **kwargs), self.attempts, self.backoff, f"Chroma {name}")
+        return call
+
+    def upsert(self, ids, embeddings=None, metadatas=None, documents=None, **kwargs):
+        if self.batch_size <= 1 or embeddings is None or kwargs:
+            return with_retry(
+                lambda: self._collection.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents, **kwargs),
+                self.attempts, self.backoff, "Chroma upsert",
+            )
+        future: Future = Future()
+        request = {"ids": list(ids), "embeddings": list(embeddings), "metadatas": metadatas, "documents": documents}
+        with self._pending_lock:
+            self._pending.append((request, future))
+            size = sum(len(r["ids"]) for r, _ in self._pending)
+            if size >= self.batch_size:
+                self._schedule_flush(0)
+            elif self._flush_timer is None:
+                self._schedule_flush(self.batch_delay)
+        return future.result()
+
+    def _schedule_flush(self, delay: float) -> None:
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+        self._flush_timer = threading.Timer(delay, self.flush)
+        self._flush_timer.daemon = True
+        self._flush_timer.start()
+
+    def flush(self) -> None:
+        """Write every pending upsert, one request per compatible group."""
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+            self._flush_timer = None
+        # Requests can only be merged when they carry the same optional fields
+        groups: Dict[Tuple[bool, bool], List[Tuple[Dict, Future]]] = {}
+        for request, future in pending:
+            shape = (request["metadatas"] is not None, request["documents"] is not None)
+            groups.setdefault(shape, []).append((request, future))
+        for (has_metadatas, has_documents), items in groups.items():
+            # Keyed by id: a later write of the same id wins, as it would
+            # have unbatched (Chroma rejects duplicate ids in one request)
+            records: Dict[str, Tuple] = {}
+            for request, _ in items:
+                for i, record_id in enumerate(request["ids"]):
+                    records[record_id] = (
+                        request["embeddings"][i],
+                        request["metadatas"][i] if has_metadatas else None,
+                        request["documents"][i] if has_documents else None,
+                    )
+            merged = {
+                "ids": list(records),
+                "embeddings": [r[0] for r in records.values()],
+                "metadatas": [r[1] for r in records.values()] if has_metadatas else None,
+                "documents": [r[2] for r in records.values()] if has_documents else None,
+            }
+            try:
+                with_retry(lambda: self._collection.upsert(**merged), self.attempts, self.backoff, "Chroma upsert")
+                for _, future in items:
+                    future.set_result(None)
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+
+
+def open_store(collection_name: str, embeddings, persist_directory: Optional[str] = None):
+    """Open a LangChain Chroma store on the configured backend.
+
+    Args:
+        collection_name (str): Collection to open (created if missing)
+        embeddings: Embedding function of the store
+        persist_directory (str): Directory of the embedded backend; ignored
+            by the shared server and in-memory backends
+
+    Returns:
+        Chroma: The store, with its collection wrapped in ManagedCollection
+    """
+    from langchain_community.vectorstores import Chroma
+
+    settings = get_settings()
+    pool = get_client_pool()
+    if pool is None:
+        os.makedirs(persist_directory, exist_ok=True)
+        store = Chroma(collection_name=collection_name, embedding_function=embeddings, persist_directory=persist_directory)
+        batch_size = 1
+    else:
+        store = with_retry(
+            lambda: Chroma(collection_name=collection_name, embedding_function=embeddings, client=pool.get()),
+            what=f"open collection {collection_name}",
+        )
+        batch_size = settings.chroma_write_batch
+    store._collection = ManagedCollection(
+        store._collection,
+        attempts=settings.chroma_retries,
+        batch_size=batch_size,
+        batch_delay=settings.chroma_write_delay_ms / 1000,
+    )
+    if pool is not None:
+        _group_committed.add(store._collection)
+    return store
+
+
+def close_store(store) -> None:
+    """Release the embedded Chroma client behind a store from ``open_store``.
+
+    chromadb caches one System (SQLite connection, HNSW segments) per persist
+    directory for the life of the process, so dropping the store frees
+    nothing. Stopping the system and removing it from that cache does, and
+    the next ``open_store`` of the directory starts a fresh one. Pooled
+    clients (server and in-memory backends) are shared and left open.
+    """
+    if get_backend() != "persistent":
+        return
+    client = getattr(store, "_client", None)
+    system = getattr(client, "_system", None)
+    if system is None:
+        return
+    try:
+        system.stop()
+    except Exception as e:
+        logger.warning(f"Failed to stop Chroma client: {str(e)}")
+    # The cache is a class attribute, spelled "_identifer_to_system" before chromadb 0.5
+    for cls in type(client).__mro__:
+        cache = cls.__dict__.get("_identifier_to_system", cls.__dict__.get("_identifer_to_system"))
+        if isinstance(cache, dict):
+            cache.pop(getattr(client, "_identifier", None), None)
+            break
+
+
+# Shared-backend collections, retuned in place when the settings change
+_group_committed: "weakref.WeakSet[ManagedCollection]" = weakref.WeakSet()
+
+
+@on_reload
+def _reconfigure_collections(old: Settings, new: Settings, changed: List[str]) -> None:
+    for collection in list(_group_committed):
+        collection.attempts = new.chroma_retries
+        collection.batch_size = new.chroma_write_batch
+        collection.batch_delay = new.chroma_write_delay_ms / 1000
@@ -0,0 +1,387 @@
+"""Document ingestion into the encrypted knowledge store.
+
+Streams local files (text, markdown, HTML, PDF) through parsing and
+chunking in a process pool, then embeds the chunks in batches, encrypts
+them and upserts them into the knowledge collection. A manifest keyed by
+path records each file's size, mtime and sha256, so re-runs skip
+unchanged files and only re-embed the ones that changed.
+
+Usage:
+    python -m db.ingest ./runbooks --workers 4 --batch-size 64 --prune
+
+PDFs are converted with ``docling`` when it is installed, else ``pypdf``.
+Chunks are encrypted with ENCRYPTION_KEY, which the app must share to read
+them back. Their plaintext metadata only identifies the source file by a
+hash of its path, so file names don't leak next to the ciphertext.
+"""
+import os
+import sys
+import json
+import hashlib
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from html.parser import HTMLParser
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TEXT_EXTENSIONS = (".txt", ".md", ".markdown", ".rst", ".log")
+HTML_EXTENSIONS = (".html", ".htm")
+PDF_EXTENSIONS = (".pdf",)
+SUPPORTED_EXTENSIONS = TEXT_EXTENSIONS + HTML_EXTENSIONS + PDF_EXTENSIONS
+MANIFEST_NAME = "knowledge_manifest.json"
+
+
+# ----------------------------------------------------------------------
+# Parsing
+# ----------------------------------------------------------------------
+class _TextExtractor(HTMLParser):
+    """Collects the visible text of an HTML document."""
+
+    SKIP = {"script", "style", "noscript", "template"}
+    BLOCK = {"p", "div", "li", "br", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "pre", "section", "article"}
+
+    def __init__(self):
+        super().__init__()
+        self.parts: List[str] = []
+        self._skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skipping += 1
+        elif tag in self.BLOCK:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self._skipping = max(0, self._skipping - 1)
+        elif tag in self.BLOCK:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skipping:
+            self.parts.append(data)
+
+    def text(self) -> str:
+        lines = (" ".join(line.split()) for line in "".join(self.parts).splitlines())
+        return "\n".join(line for line in lines if line)
+
+
+def parse_html(html: str) -> str:
+    extractor = _TextExtractor()
+    extractor.feed(html)
+    return extractor.text()
+
+
+# docling converter of this process; it loads layout models, so it is built
+# once per worker process rather than once per PDF
+_pdf_converter = None
+
+
+def _get_pdf_converter():
+    global _pdf_converter
+    if _pdf_converter is None:
+        from docling.document_converter import DocumentConverter
+
+        _pdf_converter = DocumentConverter()
+    return _pdf_converter
+
+
+def parse_pdf(path: str) -> str:
+    try:
+        return _get_pdf_converter().convert(path).document.export_to_markdown()
+    except ImportError:
+        pass
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise ImportError("PDF ingestion needs docling or pypdf: pip install docling")
+    return "\n\n".join(page.extract_text() or "" for page in PdfReader(path).pages)
+
+
+def parse_file(path: str) -> str:
+    """Return the plain text of a supported document."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in PDF_EXTENSIONS:
+        return parse_pdf(path)
+    with open(path, encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    if extension in HTML_EXTENSIONS:
+        return parse_html(text)
+    return text
+
+
+# ----------------------------------------------------------------------
+# Chunking
+# ----------------------------------------------------------------------
+def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
+    """Split text into chunks of at most ``chunk_size`` characters.
+
+    Consecutive chunks share ``overlap`` characters. Each cut is moved back
+    to the nearest paragraph, line, sentence or word boundary in the second
+    half of the chunk, so chunks rarely end mid-sentence.
+    """
+    if overlap >= chunk_size:
+        raise ValueError("overlap must be smaller than chunk_size")
+    text = text.strip()
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + chunk_size)
+        if end < len(text):
+            floor = start + chunk_size // 2
+            for separator in ("\n\n", "\n", ". ", " "):
+                cut = text.rfind(separator, floor, end)
+                if cut != -1:
+                    end = cut + len(separator)
+                    break
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(start + 1, end - overlap)
+        # Start the overlap on a word boundary
+        if not text[start - 1].isspace():
+            boundary = text.find(" ", start, end)
+            if boundary != -1:
+                start = boundary + 1
+    return chunks
+
+
+def parse_and_chunk(path: str, chunk_size: int, overlap: int) -> Tuple[str, List[str]]:
+    """Process-pool task: parse one file and chunk it."""
+    return path, chunk_text(parse_file(path), chunk_size, overlap)
+
+
+# ----------------------------------------------------------------------
+# Manifest
+# ----------------------------------------------------------------------
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_id(path: str) -> str:
+    """Opaque id of a source file, stored instead of its path."""
+    return hashlib.sha256(path.encode()).hexdigest()[:24]
+
+
+def chunk_ids(path: str, count: int, start: int = 0) -> List[str]:
+    """Stable chunk ids: a re-ingested file overwrites its own chunks."""
+    prefix = source_id(path)
+    return [f"{prefix}-{i}" for i in range(start, count)]
+
+
+class Manifest:
+    """Ingestion state per file: size, mtime, sha256 and chunk count."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.files: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.files = json.load(f)
+
+    def save(self) -> None:
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(self.files, f, indent=2, sort_keys=True)
+        os.replace(self.path + ".tmp", self.path)
+
+    def needs_ingest(self, path: str) -> bool:
+        """True when a file is new or its content changed.
+
+        Size and mtime are checked first; the file is only hashed when they
+        differ, and a touched but identical file just gets its mtime updated.
+        """
+        entry = self.files.get(path)
+        stat = os.stat(path)
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            return False
+        if entry and entry["sha256"] == file_sha256(path):
+            entry["mtime"] = stat.st_mtime
+            return False
+        return True
+
+    def record(self, path: str, chunks: int) -> None:
+        stat = os.stat(path)
+        self.files[path] = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "sha256": file_sha256(path),
+            "chunks": chunks,
+        }
+
+
+def under_roots(path: str, paths: List[str]) -> bool:
+    """True when ``path`` is one of the given files or lies under one of the directories."""
+    for root_path in paths:
+        root_path = os.path.abspath(root_path)
+        if path == root_path or path.startswith(root_path.rstrip(os.sep) + os.sep):
+            return True
+    return False
+
+
+def discover_files(paths: List[str]) -> Iterator[str]:
+    """Yield the supported files under the given files and directories."""
+    for root_path in paths:
+        if os.path.isfile(root_path):
+            yield os.path.abspath(root_path)
+            continue
+        for directory, _, names in os.walk(root_path):
+            for name in sorted(names):
+                if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                    yield os.path.abspath(os.path.join(directory, name))
+
+
+# ----------------------------------------------------------------------
+# Ingestion
+# ----------------------------------------------------------------------
+def _delete_ids(vectorstore, ids: List[str]) -> None:
+    if ids:
+        vectorstore._collection.delete(ids=ids)
+
+
+def ingest(
+    paths: List[str],
+    vectorstore,
+    embeddings,
+    cipher_suite,
+    manifest: Manifest,
+    chunk_size: int = 1000,
+    overlap: int = 200,
+    batch_size: int = 64,
+    workers: Optional[int] = None,
+    prune: bool = False,
+) -> Dict[str, int]:
+    """Ingest new and changed files into ``vectorstore``.
+
+    Files are parsed and chunked in a process pool; chunks from finished
+    files are embedded and written in batches of ``batch_size`` while the
+    remaining files are still being parsed. A file is recorded in the
+    manifest only once all its chunks are stored. With ``prune``, chunks
+    of files that were ingested from under ``paths`` but no longer exist
+    are removed; files ingested from other roots are left alone.
+
+    Returns:
+        dict: Counts of ingested, skipped, failed and removed files and of chunks written
+    """
+    from db.model import save_messages_to_vectorstore
+
+    stats = {"ingested": 0, "skipped": 0, "failed": 0, "removed": 0, "chunks": 0}
+    files = list(discover_files(paths))
+    todo = []
+    for path in files:
+        if manifest.needs_ingest(path):
+            todo.append(path)
+        else:
+            stats["skipped"] += 1
+    logger.info(f"{len(todo)} of {len(files)} files need ingestion")
+
+    buffer: List[Tuple[str, str, str, Dict]] = []
+    remaining: Dict[str, int] = {}
+    chunk_counts: Dict[str, int] = {}
+
+    def flush() -> None:
+        if not buffer:
+            return
+        batch = buffer[:]
+        buffer.clear()
+        save_messages_to_vectorstore(
+            vectorstore,
+            embeddings,
+            [text for _, text, _, _ in batch],
+            cipher_suite,
+            ids=[chunk_id for _, _, chunk_id, _ in batch],
+            metadatas=[metadata for _, _, _, metadata in batch],
+        )
+        stats["chunks"] += len(batch)
+        for path, _, _, _ in batch:
+            remaining[path] -= 1
+            if remaining[path] == 0:
+                commit(path)
+        manifest.save()
+
+    def commit(path: str) -> None:
+        # Drop trailing chunks of a previous, longer version of the file
+        previous = manifest.files.get(path, {}).get("chunks", 0)
+        _delete_ids(vectorstore, chunk_ids(path, previous, start=chunk_counts[path]))
+        manifest.record(path, chunk_counts[path])
+        stats["ingested"] += 1
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(parse_and_chunk, path, chunk_size, overlap) for path in todo]
+        for future in as_completed(futures):
+            try:
+                path, chunks = future.result()
+            except Exception as e:
+                stats["failed"] += 1
+                logger.error(f"Failed to parse document: {str(e)}")
+                continue
+            chunk_counts[path] = len(chunks)
+            if not chunks:
+                remaining[path] = 0
+                commit(path)
+                continue
+            remaining[path] = len(chunks)
+            metadata = {"source_id": source_id(path)}
+            for index, (chunk, chunk_id) in enumerate(zip(chunks, chunk_ids(path, len(chunks)))):
+                buffer.append((path, chunk, chunk_id, {**metadata, "chunk": index}))
+                if len(buffer) >= batch_size:
+                    flush()
+        flush()
+
+    if prune:
+        present = set(files)
+        for path in [p for p in manifest.files if p not in present and under_roots(p, paths)]:
+            _delete_ids(vectorstore, chunk_ids(path, manifest.files.pop(path)["chunks"]))
+            stats["removed"] += 1
+    manifest.save()
+    return stats
+
+
+def main(argv=None) -> int:
+    from db.model import init_knowledge_store
+    from src.records import get_cipher
+    from src.settings import get_settings
+
+    settings = get_settings()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+
+    parser = argparse.ArgumentParser(description="Ingest documents into the encrypted knowledge store")
+    parser.add_argument("paths", nargs="+", help="Files or directories to ingest")
+    parser.add_argument("--chunk-size", type=int, default=settings.ingest_chunk_chars)
+    parser.add_argument("--overlap", type=int, default=settings.ingest_chunk_overlap)
+    parser.add_argument("--batch-size", type=int, default=settings.ingest_batch_size)
+    parser.add_argument("--workers", type=int, default=None, help="Parsing processes (default: CPU count)")
+    parser.add_argument("--prune", action="store_true", help="Remove chunks of files under the given paths that no longer exist")
+    args = parser.parse_args(argv)
+
+    key = settings.encryption_key
+    if not key:
+        logger.error("ENCRYPTION_KEY must be set so the app can decrypt ingested documents")
+        return 1
+    vectorstore, embeddings = init_knowledge_store()
+    manifest = Manifest(os.path.join(settings.vector_db_path, MANIFEST_NAME))
+    stats = ingest(
+        args.paths,
+        vectorstore,
+        embeddings,
+        get_cipher(key),
+        manifest,
+        chunk_size=args.chunk_size,
+        overlap=args.overlap,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        prune=args.prune,
+    )
+    logger.info(f"Ingestion finished: {stats}")
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
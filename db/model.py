@@ -1,40 +1,50 @@
 import os
-from langchain_community.embeddings import OllamaEmbeddings
-from langchain_community.vectorstores import Chroma
-from langchain.memory import VectorStoreRetrieverMemory
-from cryptography.fernet import Fernet
 from src.encypt import encrypt_message, generate_key
 from src.decypt import decrypt_message, is_encrypted
 import logging
-from langchain.memory import ConversationBufferMemory
+from typing import Optional, TYPE_CHECKING
+from db.sharding import ShardRouter
+from db.backends import open_store
+from src.records import KEY_ID_FIELD
+from src.settings import get_settings
+
+# LangChain / Chroma are imported inside the functions that need them to keep
+# module import cheap on cold start.
+if TYPE_CHECKING:
+    from cryptography.fernet import Fernet
+    from langchain_community.embeddings import OllamaEmbeddings
+    from langchain_community.vectorstores import Chroma
 
 logger = logging.getLogger(__name__)
 
+def key_metadata(cipher_suite: "Fernet") -> dict:
+    """Metadata identifying the key of ``cipher_suite``; empty for plain Fernet."""
+    key_id = getattr(cipher_suite, "key_id", None)
+    return {KEY_ID_FIELD: key_id} if key_id else {}
+
 def generate_encryption_key():
     """Generate a new encryption key."""
     return generate_key()
 
 def init_vector_store():
-    """Initialize the vector store with embeddings."""
+    """Initialize the vector store with embeddings.
+
+    The store is embedded on VECTOR_DB_PATH, or on the shared Chroma server
+    when CHROMA_SERVER_HOST is set (see db/backends.py).
+    """
     try:
-        vector_db_path = os.getenv("VECTOR_DB_PATH", "./vector_db")
-        os.makedirs(vector_db_path, exist_ok=True)
-        
-        # Fix the API endpoint URL format - remove /v1 suffix
-        base_url = os.getenv("OLLAMA_HOST", "http://localhost:11434").rstrip('/v1')
+        from langchain_community.embeddings import OllamaEmbeddings
+
+        settings = get_settings()
         
-        # Initialize embeddings with correct API endpoint
+        # Embeddings use the native API root (OLLAMA_HOST without /v1)
         embeddings = OllamaEmbeddings(
-            base_url=base_url,
-            model=os.getenv("OLLAMA_MODEL", "deepseek-r1:1.5b")
+            base_url=settings.ollama_host,
+            model=settings.ollama_model
         )
         
-        # Initialize Chroma with correct settings
-        vectorstore = Chroma(
-            collection_name="encrypted_chat_history",
-            embedding_function=embeddings,
-            persist_directory=vector_db_path
-        )
+        # Initialize Chroma on the configured backend
+        vectorstore = open_store("encrypted_chat_history", embeddings, settings.vector_db_path)
         
         logger.info("Vector store initialized with embeddings")
         return vectorstore, embeddings
@@ -43,7 +53,84 @@ def init_vector_store():
         logger.error(f"Failed to initialize vector store: {str(e)}")
         raise
 
-def init_retriever(vectorstore: Chroma):
+def init_knowledge_store():
+    """Initialize the knowledge collection filled by db/ingest.py.
+
+    It lives next to the chat history (VECTOR_DB_PATH) in its own
+    collection, KNOWLEDGE_COLLECTION, and uses the same embedding model.
+    """
+    try:
+        from langchain_community.embeddings import OllamaEmbeddings
+
+        settings = get_settings()
+        embeddings = OllamaEmbeddings(
+            base_url=settings.ollama_host,
+            model=settings.ollama_model
+        )
+        vectorstore = open_store(settings.knowledge_collection, embeddings, settings.vector_db_path)
+        logger.info("Knowledge store initialized")
+        return vectorstore, embeddings
+        
+    except Exception as e:
+        logger.error(f"Failed to initialize knowledge store: {str(e)}")
+        raise
+
+def init_shard_router() -> Optional[ShardRouter]:
+    """Initialize the sharded vector store when VECTOR_DB_SHARDING is set.
+
+    Returns:
+        ShardRouter: Router over per-tenant and/or per-time-bucket collections,
+        or None when sharding is disabled
+    """
+    settings = get_settings()
+    strategy = settings.vector_db_sharding
+    if not strategy:
+        return None
+    try:
+        from langchain_community.embeddings import OllamaEmbeddings
+
+        embeddings = OllamaEmbeddings(
+            base_url=settings.ollama_host,
+            model=settings.ollama_model
+        )
+        router = ShardRouter(
+            embeddings,
+            persist_root=settings.vector_db_path,
+            strategy=strategy,
+            granularity=settings.vector_db_shard_bucket,
+            cold_root=settings.vector_db_cold_path,
+            max_open_shards=settings.vector_db_max_open_shards,
+            max_workers=settings.vector_db_shard_workers,
+        )
+        logger.info(f"Sharded vector store initialized with '{strategy}' strategy")
+        return router
+    except Exception as e:
+        logger.error(f"Failed to initialize shard router: {str(e)}")
+        raise
+
+def init_chat_stores(tenant_id: Optional[str] = None):
+    """Open the stores a chat turn reads, as the app does, outside Streamlit.
+
+    Args:
+        tenant_id: Tenant whose shards to use when sharding is on
+            (default TENANT_ID)
+
+    Returns:
+        tuple: Chat history store, embeddings and the knowledge store (None
+        when KNOWLEDGE_K is 0 or ENCRYPTION_KEY is unset)
+    """
+    settings = get_settings()
+    router = init_shard_router()
+    if router is not None:
+        vectorstore, embeddings = router.for_tenant(tenant_id or settings.tenant_id), router.embeddings
+    else:
+        vectorstore, embeddings = init_vector_store()
+    knowledge_store = None
+    if settings.knowledge_k > 0 and settings.encryption_key:
+        knowledge_store = init_knowledge_store()[0]
+    return vectorstore, embeddings, knowledge_store
+
+def init_retriever(vectorstore: "Chroma"):
     """Initialize the vector store retriever."""
     try:
         return vectorstore.as_retriever(
@@ -57,6 +144,8 @@ def init_retriever(vectorstore: Chroma):
 def init_memory(retriever):
     """Initialize the conversation memory."""
     try:
+        from langchain.memory import ConversationBufferMemory
+
         memory = ConversationBufferMemory(
             memory_key="history",
             input_key="input",
@@ -86,7 +175,6 @@ def store_encrypted_message_to_vector_db(vectorstore, message, encryption_key):
             
         # Store in vector database
         save_encrypted_message(vectorstore, encrypted_message)
-        vectorstore.persist()
         
     except Exception as e:
         raise Exception(f"Failed to store encrypted message: {str(e)}")
@@ -140,79 +228,138 @@ def save_encrypted_message(vectorstore, encrypted_message, embedding):
         vectorstore.add_texts(
             texts=[encrypted_message.decode() if isinstance(encrypted_message, bytes) else encrypted_message],
         )
-        vectorstore.persist()
     except Exception as e:
         raise Exception(f"Failed to save encrypted message: {str(e)}")
 
-def save_message_to_vectorstore(vectorstore: Chroma, embeddings: OllamaEmbeddings, message: str, cipher_suite: Fernet):
-    """Save encrypted message to vector store."""
+def save_message_to_vectorstore(vectorstore: "Chroma", embeddings: "OllamaEmbeddings", message: str, cipher_suite: "Fernet", cancel_token=None):
+    """Save encrypted message to vector store.
+
+    When ``cancel_token`` is cancelled before the write, nothing is embedded
+    or persisted and GenerationCancelled is raised.
+    """
     try:
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+
         # Log original message
-        logger.info("\n=== Starting Message Encryption ===")
-        logger.info(f"Original Message: '{message}'")
-        logger.info(f"Original Length: {len(message)} chars")
+        logger.debug("\n=== Starting Message Encryption ===")
+        logger.debug(f"Original Message: '{message}'")
+        logger.debug(f"Original Length: {len(message)} chars")
         
         # Encrypt message
         encrypted_message = cipher_suite.encrypt(message.encode())
         encrypted_text = encrypted_message.decode()
         
         # Log encrypted result
-        logger.info(f"Encrypted Message: '{encrypted_text}'")
-        logger.info(f"Encrypted Length: {len(encrypted_text)} chars")
-        logger.info(f"Encryption Ratio: {len(encrypted_text)/len(message):.2f}x")
-        logger.info("=== Encryption Complete ===\n")
+        logger.debug(f"Encrypted Message: '{encrypted_text}'")
+        logger.debug(f"Encrypted Length: {len(encrypted_text)} chars")
+        logger.debug(f"Encryption Ratio: {len(encrypted_text)/len(message):.2f}x")
+        logger.debug("=== Encryption Complete ===\n")
         
         # Generate embeddings
         embedding = embeddings.embed_query(message)
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
         
-        # Save to vector store
+        # Save to vector store, tagged with the key so searches by other
+        # sessions skip it
+        metadata = key_metadata(cipher_suite)
         vectorstore.add_texts(
             texts=[encrypted_text],
-            embeddings=[embedding]
+            embeddings=[embedding],
+            metadatas=[metadata] if metadata else None
         )
-        vectorstore.persist()
         logger.info("Successfully saved encrypted message to vector store")
         
     except Exception as e:
         logger.error(f"Failed to save message to vector store: {str(e)}")
         raise
 
-def retrieve_messages(vectorstore: Chroma, embeddings: OllamaEmbeddings, query: str, cipher_suite: Fernet, k: int = 5):
-    """Retrieve and decrypt relevant messages."""
+def save_messages_to_vectorstore(vectorstore: "Chroma", embeddings: "OllamaEmbeddings", messages: list, cipher_suite: "Fernet", ids: list = None, metadatas: list = None):
+    """Encrypt and save a batch of messages with a single embedding call.
+
+    Args:
+        vectorstore: The vector store instance (Chroma or a tenant view)
+        embeddings: Embedding model, used once for the whole batch
+        messages (list): Plaintext messages
+        cipher_suite (Fernet): Cipher used to encrypt the stored text
+        ids (list): Optional stable ids; re-saving the same id overwrites it
+        metadatas (list): Optional metadata per message; the key_id is added
+    """
+    try:
+        # Embed the plaintext; only ciphertext is stored
+        vectors = embeddings.embed_documents(messages)
+        encrypted_texts = [cipher_suite.encrypt(message.encode()).decode() for message in messages]
+        key_meta = key_metadata(cipher_suite)
+        if key_meta:
+            metadatas = [{**(metadata or {}), **key_meta} for metadata in metadatas or [None] * len(messages)]
+        collection = getattr(vectorstore, "_collection", None)
+        if collection is not None:
+            import uuid
+            collection.upsert(
+                ids=ids or [str(uuid.uuid4()) for _ in messages],
+                embeddings=vectors,
+                documents=encrypted_texts,
+                metadatas=metadatas
+            )
+        else:
+            vectorstore.add_texts(texts=encrypted_texts, embeddings=vectors, metadatas=metadatas)
+        logger.info(f"Saved batch of {len(messages)} encrypted messages to vector store")
+        
+    except Exception as e:
+        logger.error(f"Failed to save message batch to vector store: {str(e)}")
+        raise
+
+def retrieve_messages(vectorstore: "Chroma", embeddings: "OllamaEmbeddings", query: str, cipher_suite: "Fernet", k: int = 5, query_embedding: list = None):
+    """Retrieve and decrypt relevant messages.
+
+    Pass ``query_embedding`` to search several stores with one embedding.
+    Only records tagged with the key of ``cipher_suite`` are searched, so the
+    ``k`` results aren't taken up by other sessions' records.
+    """
     try:
-        logger.info("\n=== Starting Message Retrieval ===")
-        logger.info(f"Search Query: '{query}'")
+        logger.debug("\n=== Starting Message Retrieval ===")
+        logger.debug(f"Search Query: '{query}'")
         
         # Generate query embedding
-        query_embedding = embeddings.embed_query(query)
+        if query_embedding is None:
+            query_embedding = embeddings.embed_query(query)
         
         # Search vector store
+        key_filter = key_metadata(cipher_suite)
+        search_kwargs = {"filter": key_filter} if key_filter else {}
         results = vectorstore.similarity_search_by_vector(
             embedding=query_embedding,
-            k=k
+            k=k,
+            **search_kwargs
         )
         logger.info(f"Found {len(results)} matching messages")
         
         # Decrypt results
         messages = []
+        undecryptable = 0
         for i, doc in enumerate(results, 1):
             try:
                 encrypted_text = doc.page_content
-                logger.info(f"\n--- Decrypting Message {i}/{len(results)} ---")
-                logger.info(f"Encrypted Message: '{encrypted_text}'")
+                logger.debug(f"\n--- Decrypting Message {i}/{len(results)} ---")
+                logger.debug(f"Encrypted Message: '{encrypted_text}'")
                 
                 decrypted_text = cipher_suite.decrypt(encrypted_text.encode()).decode()
-                logger.info(f"Decrypted Message: '{decrypted_text}'")
-                logger.info(f"Decryption Length: {len(decrypted_text)} chars")
+                logger.debug(f"Decrypted Message: '{decrypted_text}'")
+                logger.debug(f"Decryption Length: {len(decrypted_text)} chars")
                 
                 messages.append(decrypted_text)
-                logger.info(f"Successfully decrypted message {i}")
+                logger.debug(f"Successfully decrypted message {i}")
             except Exception as e:
-                logger.error(f"Failed to decrypt message {i}: {str(e)}")
+                # Untagged records written with another key; expected, not an error
+                logger.debug(f"Failed to decrypt message {i}: {str(e)}")
+                undecryptable += 1
                 continue
         
+        if undecryptable:
+            logger.info(f"Skipped {undecryptable} of {len(results)} messages encrypted with another key")
         logger.info(f"\nSuccessfully retrieved and decrypted {len(messages)} messages")
-        logger.info("=== Retrieval Complete ===\n")
+        logger.debug("=== Retrieval Complete ===\n")
         return messages
         
     except Exception as e:
@@ -0,0 +1,279 @@
+import os
+import re
+import shutil
+import hashlib
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from db.backends import close_store, get_backend, list_collections, open_store
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_PREFIX = "encrypted_chat_history"
+SHARD_STRATEGIES = ("tenant", "time", "tenant_time")
+DEFAULT_TENANT = "default"
+
+# Keys produced by shard_key(): tenant hash, time bucket, or both
+SHARD_KEY_PATTERN = re.compile(r"^(t[0-9a-f]{16}|m\d{6}|w\d{6}|d\d{8}|t[0-9a-f]{16}-(m\d{6}|w\d{6}|d\d{8}))$")
+
+
+def tenant_shard_id(tenant_id: str) -> str:
+    """Map a tenant/user id to a stable, collection-safe shard id.
+
+    Tenant ids are hashed so raw user identifiers never end up in directory
+    or collection names on disk.
+    """
+    digest = hashlib.sha256(str(tenant_id or DEFAULT_TENANT).encode()).hexdigest()
+    return f"t{digest[:16]}"
+
+
+def time_bucket(timestamp: Optional[datetime] = None, granularity: str = "month") -> str:
+    """Return the time bucket label for a timestamp."""
+    timestamp = timestamp or datetime.now()
+    if granularity == "day":
+        return timestamp.strftime("d%Y%m%d")
+    if granularity == "week":
+        year, week, _ = timestamp.isocalendar()
+        return f"w{year}{week:02d}"
+    return timestamp.strftime("m%Y%m")
+
+
+class ShardRouter:
+    """Routes each tenant and/or time bucket to its own Chroma collection.
+
+    Every shard lives in its own persist directory under ``persist_root`` so
+    that cold shards can be moved to ``cold_root`` (cheaper storage) without
+    touching the others. Open collection handles are kept in a bounded LRU
+    cache and queries fan out concurrently to the shards they need only;
+    an evicted shard's embedded client is closed, so ``max_open_shards``
+    bounds the open SQLite files and HNSW indexes.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        persist_root: str,
+        strategy: str = "tenant",
+        granularity: str = "month",
+        cold_root: Optional[str] = None,
+        max_open_shards: int = 16,
+        max_workers: int = 4,
+        max_buckets: int = 6,
+    ):
+        if strategy not in SHARD_STRATEGIES:
+            raise ValueError(f"Unknown sharding strategy '{strategy}', expected one of {SHARD_STRATEGIES}")
+        self.embeddings = embeddings
+        self.persist_root = persist_root
+        self.strategy = strategy
+        self.granularity = granularity
+        self.cold_root = cold_root
+        self.max_open_shards = max(1, max_open_shards)
+        self.max_buckets = max(1, max_buckets)
+        self._handles: "OrderedDict[str, object]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="shard-query")
+        os.makedirs(persist_root, exist_ok=True)
+        if cold_root:
+            os.makedirs(cold_root, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # Shard naming and discovery
+    # ------------------------------------------------------------------
+    def shard_key(self, tenant_id: Optional[str] = None, timestamp: Optional[datetime] = None) -> str:
+        """Return the shard key a write for this tenant/time should go to."""
+        if self.strategy == "tenant":
+            return tenant_shard_id(tenant_id)
+        if self.strategy == "time":
+            return time_bucket(timestamp, self.granularity)
+        return f"{tenant_shard_id(tenant_id)}-{time_bucket(timestamp, self.granularity)}"
+
+    def _shard_path(self, shard_key: str) -> str:
+        """Return the persist directory of a shard, preferring the hot tier."""
+        hot_path = os.path.join(self.persist_root, shard_key)
+        if self.cold_root and not os.path.isdir(hot_path):
+            cold_path = os.path.join(self.cold_root, shard_key)
+            if os.path.isdir(cold_path):
+                return cold_path
+        return hot_path
+
+    def list_shards(self) -> List[str]:
+        """List every shard key present in the hot and cold tiers.
+
+        Entries that don't look like a shard key, such as the segment
+        directories of an unsharded store under the same path, are ignored.
+        """
+        if get_backend() != "persistent":
+            # Shards are collections on the shared server, not directories
+            prefix = f"{COLLECTION_PREFIX}-"
+            keys = {name[len(prefix):] for name in list_collections(prefix)}
+        else:
+            keys = set()
+            for root in filter(None, (self.persist_root, self.cold_root)):
+                if os.path.isdir(root):
+                    keys.update(name for name in os.listdir(root) if os.path.isdir(os.path.join(root, name)))
+        return sorted(key for key in keys if SHARD_KEY_PATTERN.match(key))
+
+    def shards_for(self, tenant_id: Optional[str] = None) -> List[str]:
+        """Return the shards a query for ``tenant_id`` has to fan out to.
+
+        For time-bucketed strategies only the ``max_buckets`` most recent
+        buckets are searched.
+        """
+        if self.strategy == "tenant":
+            return [tenant_shard_id(tenant_id)]
+        existing = self.list_shards()
+        if self.strategy == "tenant_time":
+            prefix = f"{tenant_shard_id(tenant_id)}-"
+            existing = [key for key in existing if key.startswith(prefix)]
+        # Bucket labels sort chronologically, newest last
+        return existing[-self.max_buckets:]
+
+    # ------------------------------------------------------------------
+    # Handle cache
+    # ------------------------------------------------------------------
+    def get_store(self, shard_key: str):
+        """Return an open Chroma collection for a shard, opening it if needed."""
+        with self._lock:
+            store = self._handles.get(shard_key)
+            if store is not None:
+                self._handles.move_to_end(shard_key)
+                return store
+
+        store = open_store(
+            f"{COLLECTION_PREFIX}-{shard_key}",
+            self.embeddings,
+            persist_directory=self._shard_path(shard_key),
+        )
+        evicted = []
+        with self._lock:
+            # Another thread may have opened the same shard meanwhile
+            existing = self._handles.get(shard_key)
+            if existing is not None:
+                self._handles.move_to_end(shard_key)
+                return existing
+            self._handles[shard_key] = store
+            while len(self._handles) > self.max_open_shards:
+                evicted.append(self._handles.popitem(last=False))
+        for key, handle in evicted:
+            close_store(handle)
+            logger.debug(f"Evicted and closed shard {key}")
+        logger.info(f"Opened vector store shard {shard_key}")
+        return store
+
+    def close_shard(self, shard_key: str) -> None:
+        """Drop the cached handle of a shard and close its client."""
+        with self._lock:
+            store = self._handles.pop(shard_key, None)
+        if store is not None:
+            close_store(store)
+
+    def move_to_cold(self, shard_key: str) -> str:
+        """Move a shard's persist directory to the cold tier.
+
+        The shard is closed first so no cached client still has its SQLite
+        file open while it moves.
+
+        Returns:
+            str: The new location of the shard
+        """
+        if not self.cold_root:
+            raise ValueError("No cold storage root configured")
+        if get_backend() != "persistent":
+            raise ValueError("Cold storage tiers only apply to the embedded backend")
+        source = os.path.join(self.persist_root, shard_key)
+        if not os.path.isdir(source):
+            raise FileNotFoundError(f"Shard {shard_key} is not in the hot tier")
+        self.close_shard(shard_key)
+        target = os.path.join(self.cold_root, shard_key)
+        shutil.move(source, target)
+        logger.info(f"Moved shard {shard_key} to cold storage")
+        return target
+
+    # ------------------------------------------------------------------
+    # Reads and writes
+    # ------------------------------------------------------------------
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        tenant_id: Optional[str] = None,
+        embeddings: Optional[List[List[float]]] = None,
+        metadatas: Optional[List[Dict]] = None,
+        timestamp: Optional[datetime] = None,
+    ) -> List[str]:
+        """Add texts to the shard of ``tenant_id`` for the given time."""
+        texts = list(texts)
+        timestamp = timestamp or datetime.now()
+        store = self.get_store(self.shard_key(tenant_id, timestamp))
+        metadatas = metadatas or [{} for _ in texts]
+        for metadata in metadatas:
+            metadata.setdefault("timestamp", timestamp.isoformat())
+        if embeddings is None:
+            return store.add_texts(texts=texts, metadatas=metadatas)
+        # Use the precomputed embeddings instead of re-embedding the texts
+        ids = [str(uuid.uuid4()) for _ in texts]
+        store._collection.upsert(ids=ids, embeddings=embeddings, documents=texts, metadatas=metadatas)
+        return ids
+
+    def _search_shard(self, shard_key: str, embedding: List[float], k: int, filter: Optional[Dict] = None) -> List[Tuple[object, float]]:
+        try:
+            store = self.get_store(shard_key)
+            return store.similarity_search_by_vector_with_relevance_scores(embedding=embedding, k=k, filter=filter)
+        except Exception as e:
+            logger.error(f"Failed to search shard {shard_key}: {str(e)}")
+            return []
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 5, tenant_id: Optional[str] = None, filter: Optional[Dict] = None):
+        """Search the shards of a tenant concurrently and merge the top ``k``."""
+        shards = self.shards_for(tenant_id)
+        if not shards:
+            return []
+        if len(shards) == 1:
+            hits = self._search_shard(shards[0], embedding, k, filter)
+        else:
+            futures = [self._executor.submit(self._search_shard, key, embedding, k, filter) for key in shards]
+            hits = [hit for future in futures for hit in future.result()]
+        # Chroma scores are distances, lower is closer
+        hits.sort(key=lambda hit: hit[1])
+        return [doc for doc, _ in hits[:k]]
+
+    def for_tenant(self, tenant_id: Optional[str] = None) -> "TenantVectorStore":
+        """Return a vector-store view scoped to a single tenant."""
+        return TenantVectorStore(self, tenant_id or DEFAULT_TENANT)
+
+    def shutdown(self) -> None:
+        """Close all shards and stop the query pool."""
+        with self._lock:
+            handles = list(self._handles.values())
+            self._handles.clear()
+        for store in handles:
+            close_store(store)
+        self._executor.shutdown(wait=False)
+
+
+class TenantVectorStore:
+    """Tenant-scoped view over a ShardRouter.
+
+    Exposes the subset of the Chroma interface used by ``db.model`` so the
+    existing save/retrieve helpers work unchanged on a sharded store.
+    """
+
+    def __init__(self, router: ShardRouter, tenant_id: str):
+        self.router = router
+        self.tenant_id = tenant_id
+
+    def add_texts(self, texts, metadatas=None, embeddings=None, **kwargs):
+        return self.router.add_texts(texts, tenant_id=self.tenant_id, embeddings=embeddings, metadatas=metadatas)
+
+    def similarity_search_by_vector(self, embedding, k: int = 5, filter=None, **kwargs):
+        return self.router.similarity_search_by_vector(embedding, k=k, tenant_id=self.tenant_id, filter=filter)
+
+    def persist(self) -> None:
+        """No-op: shards are persisted by the Chroma client on write."""
+
+    def as_retriever(self, **kwargs):
+        return self.router.get_store(self.router.shard_key(self.tenant_id)).as_retriever(**kwargs)
@@ -1,20 +1,18 @@
-import os
 import logging
-from dotenv import load_dotenv
-from langchain_core.callbacks import StreamingStdOutCallbackHandler
-from langchain_community.chat_models import ChatOpenAI
-from langchain_core.messages import HumanMessage, SystemMessage
-from langchain.chains import ConversationChain
-from langchain.memory import ConversationBufferMemory
-from langchain_core.prompts import PromptTemplate
-from langgraph.checkpoint.memory import MemorySaver
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Tuple
 from pydantic import BaseModel, Field
-from src.encypt import encrypt_message
-from src.decypt import decrypt_message
-from cryptography.fernet import Fernet
+from src.exceptions import GenerationCancelled
+from src.settings import get_settings
+from src.tokens import TurnStats, count_message_tokens, fit_history, get_tokenizer
 
-# Load environment variables
-load_dotenv()
+# LangChain and cryptography are imported lazily inside the functions that use
+# them so importing this module (and app.py) stays cheap on cold start.
+if TYPE_CHECKING:
+    from cryptography.fernet import Fernet
+    from src.cancellation import CancelToken
+    from src.pipeline import PreparedTurn
+    from langchain.chains import ConversationChain
+    from langchain_community.chat_models import ChatOpenAI
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -28,11 +26,31 @@ class OllamaConfig(BaseModel):
     streaming: bool = Field(default=True)
     verbose: bool = Field(default=True)
 
-def test_ollama_connection(base_url: str) -> bool:
+SYSTEM_PROMPT = "You are a helpful AI assistant focused on security and privacy."
+
+def get_chat_options(temperature: float) -> dict:
+    """Ollama model options sent with every request.
+
+    They must not change between requests (or between warm-up and chat):
+    a different ``num_ctx`` makes Ollama reload the model and drop its cache.
+    """
+    settings = get_settings()
+    return {
+        "temperature": temperature,
+        "num_ctx": settings.ollama_num_ctx,
+        "num_predict": settings.max_completion_tokens,
+    }
+
+def get_native_base_url(base_url: str) -> str:
+    """Return the native Ollama API root for an OpenAI-compatible base URL."""
+    base_url = base_url.rstrip("/")
+    return base_url[:-len("/v1")] if base_url.endswith("/v1") else base_url
+
+def test_ollama_connection(base_url: str, timeout: float = 5.0) -> bool:
     """Test connection to Ollama server."""
     try:
         import requests
-        response = requests.get(f"{base_url}/models")
+        response = requests.get(f"{base_url}/models", timeout=timeout)
         if response.status_code != 200:
             logger.error(f"Failed to connect to Ollama: {response.status_code}")
             return False
@@ -41,25 +59,61 @@ def test_ollama_connection(base_url: str) -> bool:
         logger.error(f"Error testing Ollama connection: {str(e)}")
         return False
 
-def init_ollama_model() -> ChatOpenAI:
-    """Initialize ChatOpenAI with configuration for Ollama compatibility."""
+def init_ollama_model(session_id: str = None) -> "ChatOpenAI":
+    """Initialize the chat model.
+
+    Uses Ollama's native chat API (keep_alive, fixed options, per-session
+    host affinity) by default, the provider router when MODEL_BACKENDS is
+    set, and the OpenAI-compatible endpoint when OLLAMA_NATIVE_CHAT=0.
+    """
     try:
+        from langchain_community.chat_models import ChatOpenAI
+        from langchain_core.callbacks import StreamingStdOutCallbackHandler
+
         # Load configuration
+        settings = get_settings()
         config = OllamaConfig(
-            model=os.getenv("OLLAMA_MODEL", "deepseek-r1:1.5b"),
-            base_url=os.getenv("OLLAMA_HOST", "http://localhost:11434/v1"),
-            temperature=float(os.getenv("TEMPERATURE", "0.7"))
+            model=settings.ollama_model,
+            base_url=settings.openai_base_url,
+            temperature=settings.temperature
         )
         
-        # Test connection first
-        if not test_ollama_connection(config.base_url):
-            logger.error("Unable to connect to Ollama server")
-            raise ConnectionError("Unable to connect to Ollama server")
+        # Several model hosts configured: route across them with fallback.
+        # The routed and native models read TEMPERATURE per request and
+        # stream_process_message passes it to ChatOpenAI, so a settings
+        # reload applies without rebuilding session agents.
+        if settings.model_backends:
+            from src.router import get_provider_router
+            from src.routed_llm import RoutedChatModel
+
+            logger.info("Initializing routed chat model over MODEL_BACKENDS")
+            return RoutedChatModel(
+                router=get_provider_router(),
+                streaming=config.streaming,
+                verbose=config.verbose,
+            )
+
+        if settings.ollama_native_chat:
+            from src.ollama_chat import OllamaChatModel
+
+            hosts = settings.ollama_hosts or config.base_url
+            logger.info(f"Initializing native Ollama chat for model {config.model}")
+            return OllamaChatModel(
+                hosts=[get_native_base_url(host.strip()) for host in hosts.split(",") if host.strip()],
+                model=config.model,
+                keep_alive=settings.ollama_keep_alive,
+                session_id=session_id,
+                circuit_breaker=True,
+                verbose=config.verbose,
+            )
         
         logger.info(f"Initializing ChatOpenAI for model {config.model}")
         
-        # Configure callbacks
-        callbacks = [StreamingStdOutCallbackHandler()]
+        # Configure callbacks; the health handler fails fast from the cached
+        # circuit state and records each request's outcome
+        from src.ollama_chat import HealthCallbackHandler
+
+        callbacks = [StreamingStdOutCallbackHandler(), HealthCallbackHandler(config.base_url)]
         
         # Initialize ChatOpenAI with Ollama configuration
         chat = ChatOpenAI(
@@ -72,29 +126,31 @@ def init_ollama_model() -> ChatOpenAI:
             callbacks=callbacks
         )
         
-        # Test the model
-        test_message = HumanMessage(content="Test connection")
-        test_response = chat.invoke([test_message])
-        logger.info("Successfully tested Ollama model connection")
-        
+        # The model is loaded and kept resident by the start-up warm-up
+        # (src/warmup.py) instead of a test generation on every request
         return chat
         
     except Exception as e:
         logger.error(f"Failed to initialize ChatOpenAI model: {str(e)}")
         raise
 
-def create_ollama_agent(retriever) -> ConversationChain:
+def create_ollama_agent(retriever, session_id: str = None) -> "ConversationChain":
     """Create an Ollama-based chat agent with memory.
     
     Args:
         retriever: Vector store retriever for conversation history
+        session_id: Session the agent serves, used for model host affinity
         
     Returns:
         ConversationChain: Configured conversation chain with memory
     """
     try:
+        from langchain.chains import ConversationChain
+        from langchain.memory import ConversationBufferMemory
+        from langchain_core.prompts import PromptTemplate
+
         # Initialize Ollama model
-        llm = init_ollama_model()
+        llm = init_ollama_model(session_id)
         
         # Initialize conversation memory
         memory = ConversationBufferMemory(
@@ -106,12 +162,12 @@ def create_ollama_agent(retriever) -> ConversationChain:
         # Create prompt template
         prompt = PromptTemplate(
             input_variables=["history", "input"],
-            template="""
-            System: You are a helpful AI assistant focused on security and privacy.
+            template=f"""
+            System: {SYSTEM_PROMPT}
             
             Current conversation:
-            {history}
-            Human: {input}
+            {{history}}
+            Human: {{input}}
             Assistant:"""
         )
         
@@ -130,9 +186,169 @@ def create_ollama_agent(retriever) -> ConversationChain:
         logger.error(f"Failed to create Ollama agent: {str(e)}")
         raise
 
+REASONING = "reasoning"
+ANSWER = "answer"
+
+class ReasoningStreamParser:
+    """Incrementally split deepseek-r1 style output into reasoning and answer.
+
+    Text between ``<think>`` and ``</think>`` is reasoning, everything else is
+    answer. Tags may be split across chunks, so a possible partial tag at the
+    end of a chunk is held back until the next chunk arrives.
+    """
+
+    def __init__(self, open_tag: str = "<think>", close_tag: str = "</think>"):
+        self.open_tag = open_tag
+        self.close_tag = close_tag
+        self.in_reasoning = False
+        self._pending = ""
+
+    def _partial_tag_length(self, text: str, tag: str) -> int:
+        """Length of the longest suffix of ``text`` that is a prefix of ``tag``."""
+        for length in range(min(len(tag) - 1, len(text)), 0, -1):
+            if text.endswith(tag[:length]):
+                return length
+        return 0
+
+    def feed(self, chunk: str) -> List[Tuple[str, str]]:
+        """Consume a chunk and return the (kind, text) events it completes."""
+        text = self._pending + chunk
+        self._pending = ""
+        events = []
+        while text:
+            tag = self.close_tag if self.in_reasoning else self.open_tag
+            index = text.find(tag)
+            if index >= 0:
+                if index:
+                    events.append((REASONING if self.in_reasoning else ANSWER, text[:index]))
+                self.in_reasoning = not self.in_reasoning
+                text = text[index + len(tag):]
+                continue
+            hold = self._partial_tag_length(text, tag)
+            if hold:
+                self._pending = text[-hold:]
+                text = text[:-hold]
+            if text:
+                events.append((REASONING if self.in_reasoning else ANSWER, text))
+            break
+        return events
+
+    def finish(self) -> List[Tuple[str, str]]:
+        """Flush any held-back text at the end of the stream."""
+        text, self._pending = self._pending, ""
+        return [(REASONING if self.in_reasoning else ANSWER, text)] if text else []
+
+    def parse(self, chunks: Iterable[str]) -> Iterator[Tuple[str, str]]:
+        """Parse a whole chunk stream, yielding (kind, text) events."""
+        for chunk in chunks:
+            yield from self.feed(chunk)
+        yield from self.finish()
+
+def split_reasoning(text: str) -> Tuple[str, str]:
+    """Split a complete response into (reasoning, answer)."""
+    parts = {REASONING: [], ANSWER: []}
+    for kind, piece in ReasoningStreamParser().parse([text]):
+        parts[kind].append(piece)
+    return "".join(parts[REASONING]).strip(), "".join(parts[ANSWER]).strip()
+
+def stream_process_message(agent: "ConversationChain", message: str, cancel_token: "CancelToken" = None, prepared: "PreparedTurn" = None, stats: "TurnStats" = None) -> Iterator[Tuple[str, str]]:
+    """Stream a reply as (kind, text) events, separating reasoning from answer.
+
+    Runs the chain's prompt and LLM directly so tokens arrive as they are
+    generated, and saves only the answer to the conversation memory so
+    reasoning never grows later prompts.
+
+    Args:
+        agent: Conversation chain built by create_ollama_agent
+        message: User message
+        cancel_token: Optional CancelToken; on cancel the upstream stream is
+            closed and nothing is saved to memory
+        prepared: Optional PreparedTurn from src.pipeline.prepare_turn with
+            the already loaded history and retrieved context
+        stats: Optional TurnStats filled with token counts and prefill/decode
+            timings; history is trimmed to the context budget either way
+
+    Raises:
+        GenerationCancelled: If the token is cancelled or its deadline passes
+    """
+    if prepared is not None:
+        inputs = {agent.memory.memory_key: prepared.history, "input": prepared.prompt_input()}
+    else:
+        inputs = agent.prep_inputs({"input": message})
+
+    # Trim history so the prompt fits the model's context window instead of
+    # being silently truncated by the server
+    stats = stats if stats is not None else TurnStats()
+    tokenizer = get_tokenizer(get_settings().ollama_model)
+    history_key = agent.memory.memory_key
+    fixed_tokens = tokenizer.count(agent.prompt.template) + tokenizer.count(inputs["input"])
+    history = fit_history(inputs[history_key], fixed_tokens, tokenizer)
+    if isinstance(history, list):
+        stats.trimmed_messages = len(inputs[history_key]) - len(history)
+    inputs[history_key] = history
+    if getattr(agent.llm, "supports_chat_messages", False) and isinstance(history, list):
+        from langchain_core.messages import HumanMessage, SystemMessage
+
+        # Stable prefix for the server's prompt cache: the system prompt and
+        # earlier turns are sent unchanged, only the new turn is appended
+        prompt = [SystemMessage(content=SYSTEM_PROMPT)] + history + [HumanMessage(content=inputs["input"])]
+        stats.prompt_tokens = count_message_tokens(prompt, tokenizer)
+    else:
+        prompt = agent.prompt.format_prompt(**{k: inputs[k] for k in agent.prompt.input_variables})
+        stats.prompt_tokens = tokenizer.count(prompt.to_string())
+    stream_kwargs = {}
+    if cancel_token is not None and getattr(agent.llm, "supports_cancel_token", False):
+        stream_kwargs["cancel_token"] = cancel_token
+    if not getattr(agent.llm, "reads_settings_per_request", False):
+        # ChatOpenAI keeps the temperature it was built with; pass the current
+        # one so a settings reload applies to cached session agents too
+        stream_kwargs["temperature"] = get_settings().temperature
+    llm_stream = agent.llm.stream(prompt, **stream_kwargs)
+    parser = ReasoningStreamParser()
+    answer = []
+    generated = []
+
+    def _chunks():
+        for chunk in llm_stream:
+            text = getattr(chunk, "content", chunk)
+            stats.mark_token()
+            generated.append(text)
+            yield text
+
+    stats.start()
+    try:
+        for kind, text in parser.parse(_chunks()):
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            if kind == ANSWER:
+                answer.append(text)
+            yield kind, text
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+    except Exception as e:
+        if cancel_token is not None and cancel_token.cancelled and not isinstance(e, GenerationCancelled):
+            # Closing the connection on cancel surfaces as a transport error
+            raise GenerationCancelled(cancel_token.reason) from e
+        raise
+    finally:
+        # Closing the generator closes the upstream streaming connection
+        llm_stream.close()
+        stats.finish()
+        stats.completion_tokens = tokenizer.count("".join(generated))
+        stats.record_server_metrics(getattr(agent.llm, "last_metrics", None))
+        logger.info(f"Turn tokens: {stats.as_dict()}")
+        if get_settings().ollama_prefix_metrics:
+            logger.info(
+                f"Prefix cache: {stats.cached_prompt_tokens}/{stats.prompt_tokens} prompt tokens reused, "
+                f"~{stats.prefill_seconds_saved:.2f}s prefill saved"
+            )
+    agent.memory.save_context({"input": message}, {"response": "".join(answer).strip()})
+
 def create_chat_prompt():
     """Create the chat prompt template with system message."""
     try:
+        from langchain_core.messages import SystemMessage
+
         system_message = SystemMessage(content="""You are a helpful AI assistant. 
         Your responses should be informative, engaging, and safe.""")
         
@@ -150,7 +366,7 @@ def create_chat_prompt():
         logger.error(f"Failed to create chat prompt: {str(e)}")
         raise
 
-def process_message(agent: ConversationChain, message: str, cipher_suite: Fernet) -> tuple[str, bytes]:
+def process_message(agent: "ConversationChain", message: str, cipher_suite: "Fernet") -> tuple[str, bytes]:
     """Process a message through the agent with encryption."""
     try:
         logger.info("Processing new message")
@@ -158,6 +374,12 @@ def process_message(agent: ConversationChain, message: str, cipher_suite: Fernet
         # Get response from agent first
         response = agent.predict(input=message)
         logger.debug("Received response from agent")
+
+        # Keep only the answer; reasoning is neither returned nor remembered
+        _, response = split_reasoning(response)
+        history = agent.memory.chat_memory.messages
+        if history and history[-1].type == "ai":
+            history[-1].content = response
         
         # Encrypt using Fernet
         try:
@@ -0,0 +1,88 @@
+import time
+import logging
+import threading
+from typing import Callable, List, Optional
+
+from src.exceptions import GenerationCancelled
+
+logger = logging.getLogger(__name__)
+
+
+class CancelToken:
+    """Cooperative cancellation handle for one generation.
+
+    Work checks ``cancelled``/``raise_if_cancelled`` between steps, and
+    resources that block (e.g. an upstream streaming response) register a
+    callback with ``on_cancel`` so they are closed immediately on cancel or
+    when the deadline passes.
+    """
+
+    def __init__(self, deadline: Optional[float] = None):
+        self.reason: Optional[str] = None
+        self.done = False
+        self.deadline_at = time.monotonic() + deadline if deadline else None
+        self._event = threading.Event()
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self._timer = None
+        if deadline:
+            self._timer = threading.Timer(deadline, self.cancel, args=("deadline exceeded",))
+            self._timer.daemon = True
+            self._timer.start()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left until the deadline, or None without a deadline."""
+        if self.deadline_at is None:
+            return None
+        return max(0.0, self.deadline_at - time.monotonic())
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        """Cancel the generation and run the registered callbacks once."""
+        with self._lock:
+            if self._event.is_set() or self.done:
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        if self._timer is not None:
+            self._timer.cancel()
+        logger.info(f"Generation cancelled: {reason}")
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.debug(f"Cancel callback failed: {str(e)}")
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        """Register ``callback`` to run on cancel (immediately if already cancelled)."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise GenerationCancelled(self.reason)
+
+    def finish(self) -> None:
+        """Mark the generation as done: later cancels become no-ops."""
+        if self._timer is not None:
+            self._timer.cancel()
+        with self._lock:
+            self.done = True
+            self._callbacks = []
+
+
+def start_generation(session_state, deadline: Optional[float] = None, key: str = "cancel_token") -> CancelToken:
+    """Cancel the session's in-flight generation and start a new token for it."""
+    previous = session_state.get(key)
+    if previous is not None:
+        previous.cancel("superseded by a new message")
+    token = CancelToken(deadline)
+    session_state[key] = token
+    return token
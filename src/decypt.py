@@ -1,9 +1,10 @@
 from cryptography.fernet import Fernet, InvalidToken
 from src.encypt import validate_key
+from src.records import RecordCipher, is_record
 import base64
 
 def decrypt_message(encrypted_message, key):
-    """Decrypt a message using Fernet symmetric encryption.
+    """Decrypt a Fernet token or a compact record (see src/records.py).
     
     Args:
         encrypted_message (bytes): The encrypted message
@@ -22,6 +23,8 @@ def decrypt_message(encrypted_message, key):
             raise TypeError("Encrypted message must be bytes")
             
         key = validate_key(key)
+        if is_record(encrypted_message):
+            return RecordCipher(key).decrypt(encrypted_message).decode()
         fernet = Fernet(key)
         decrypted_message = fernet.decrypt(encrypted_message).decode()
         return decrypted_message
@@ -42,6 +45,8 @@ def is_encrypted(message):
     try:
         if not isinstance(message, bytes):
             return False
+        if is_record(message):
+            return True
         base64.b64decode(message)
         return True
     except Exception:
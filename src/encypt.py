@@ -7,8 +7,8 @@ def validate_key(key):
     try:
         if isinstance(key, str):
             key = key.encode()
-        # Ensure key is valid base64
-        base64.b64decode(key)
+        # Ensure key is valid base64 (Fernet keys use the URL-safe alphabet)
+        base64.urlsafe_b64decode(key)
         return key
     except Exception:
         raise ValueError("Invalid encryption key format")
@@ -38,6 +38,27 @@ def encrypt_message(message, key):
     except Exception as e:
         raise Exception(f"Encryption failed: {str(e)}")
 
+def encrypt_record(message, key, codec=None):
+    """Encrypt a message as a compact record (compressed, AES-GCM, base64).
+    
+    Args:
+        message (str): The message to encrypt
+        key (bytes): The encryption key (a Fernet key)
+        codec (int): Compression codec from src.records, defaults to zstd/zlib
+        
+    Returns:
+        bytes: The text-safe record, readable with decrypt_message
+    """
+    from src.records import RecordCipher
+
+    try:
+        if not isinstance(message, str):
+            raise TypeError("Message must be a string")
+            
+        return RecordCipher(validate_key(key), codec=codec).encrypt(message.encode())
+    except Exception as e:
+        raise Exception(f"Encryption failed: {str(e)}")
+
 def generate_key():
     """Generate a new Fernet encryption key."""
     return Fernet.generate_key()
\ No newline at end of file
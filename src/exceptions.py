@@ -12,4 +12,12 @@ class AgentError(Exception):
 
 class EncryptionError(Exception):
     """Raised when there's an error with encryption/decryption."""
-    pass 
\ No newline at end of file
+    pass 
+
+class UpstreamUnavailableError(ConnectionError):
+    """Raised when the model server is known to be down (circuit open)."""
+    pass
+
+class GenerationCancelled(Exception):
+    """Raised when a generation is cancelled or runs past its deadline."""
+    pass
@@ -0,0 +1,216 @@
+import time
+import logging
+import threading
+from typing import Callable, Dict, Optional
+
+from src.exceptions import UpstreamUnavailableError
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class HealthMonitor:
+    """Cached upstream health with a circuit breaker.
+
+    A single background thread probes the upstream every ``interval``
+    seconds; request paths only read the cached status, so an upstream
+    restart no longer triggers a blocking probe from every session. After
+    ``failure_threshold`` consecutive failures the circuit opens and
+    requests fail fast. Once ``reset_timeout`` has passed one half-open
+    probe is let through, and a success closes the circuit again.
+    """
+
+    def __init__(
+        self,
+        probe: Callable[[], bool],
+        name: str = "upstream",
+        ttl: float = 5.0,
+        interval: float = 5.0,
+        failure_threshold: int = 3,
+        reset_timeout: float = 30.0,
+    ):
+        self.probe = probe
+        self.name = name
+        self.ttl = ttl
+        self.interval = interval
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.last_checked = 0.0
+        self.last_ok: Optional[bool] = None
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+        self._probe_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------
+    # State transitions
+    # ------------------------------------------------------------------
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info(f"Circuit for {self.name} closed")
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self.last_ok = True
+            self.last_checked = time.monotonic()
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            self.last_ok = False
+            self.last_checked = time.monotonic()
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    logger.warning(f"Circuit for {self.name} opened after {self.consecutive_failures} failures")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def release_probe(self) -> None:
+        """Give back a half-open trial that ended without an outcome.
+
+        A cancelled or abandoned trial request says nothing about the
+        upstream, so the circuit goes back to open with a fresh cooldown
+        instead of staying half-open and rejecting every later request.
+        """
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def _run_probe(self, wait: bool = False) -> Optional[bool]:
+        """Run one probe unless another thread is already probing.
+
+        With ``wait`` the caller blocks on an in-flight probe and reuses its
+        result; this is only used before the very first status is known.
+        """
+        if not self._probe_lock.acquire(blocking=wait):
+            return None
+        try:
+            if wait and self.last_ok is not None:
+                return self.last_ok
+            try:
+                ok = bool(self.probe())
+            except Exception as e:
+                logger.error(f"Health probe for {self.name} failed: {str(e)}")
+                ok = False
+            if ok:
+                self.record_success()
+            else:
+                self.record_failure()
+            return ok
+        finally:
+            self._probe_lock.release()
+
+    # ------------------------------------------------------------------
+    # Request path
+    # ------------------------------------------------------------------
+    def is_available(self) -> bool:
+        """Return the cached status, probing only when it is stale.
+
+        While the circuit is open this never probes until ``reset_timeout``
+        has elapsed; then exactly one caller runs the half-open probe.
+        """
+        now = time.monotonic()
+        with self._lock:
+            state = self.state
+            fresh = self.last_ok is not None and now - self.last_checked < self.ttl
+            if state == OPEN:
+                if now - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = HALF_OPEN
+                logger.info(f"Circuit for {self.name} half-open, probing")
+            elif fresh:
+                return self.last_ok
+        result = self._run_probe(wait=self.last_ok is None)
+        if result is None:
+            # Another caller is probing; answer from the cache
+            with self._lock:
+                return self.state == CLOSED and bool(self.last_ok)
+        return result
+
+    def allow_request(self) -> bool:
+        """Passive circuit-breaker gate that never probes.
+
+        Used when real requests report their own outcome through
+        ``record_success``/``record_failure``: closed lets everything
+        through, open rejects until ``reset_timeout`` has passed, and then a
+        single half-open trial request is allowed.
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                return True
+            return False
+
+    def ensure_available(self) -> None:
+        """Raise UpstreamUnavailableError when the upstream is down."""
+        if not self.is_available():
+            raise UpstreamUnavailableError(f"{self.name} is currently unavailable")
+
+    def status(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "name": self.name,
+                "state": self.state,
+                "ok": self.last_ok,
+                "consecutive_failures": self.consecutive_failures,
+                "age": time.monotonic() - self.last_checked if self.last_checked else None,
+            }
+
+    # ------------------------------------------------------------------
+    # Background monitoring
+    # ------------------------------------------------------------------
+    def start(self) -> "HealthMonitor":
+        """Start the background probing thread (idempotent)."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name=f"health-{self.name}", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            with self._lock:
+                waiting = self.state == OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+                if self.state == OPEN and not waiting:
+                    self.state = HALF_OPEN
+            if not waiting:
+                self._run_probe()
+            self._stop.wait(self.interval)
+
+
+_monitors: Dict[str, HealthMonitor] = {}
+_monitors_lock = threading.Lock()
+
+
+def get_ollama_monitor(base_url: str) -> HealthMonitor:
+    """Return the process-wide, already running monitor for an Ollama URL."""
+    with _monitors_lock:
+        monitor = _monitors.get(base_url)
+        if monitor is None:
+            from src.agent import test_ollama_connection
+            from src.settings import get_settings
+
+            settings = get_settings()
+            probe_timeout = settings.ollama_health_timeout
+            monitor = HealthMonitor(
+                probe=lambda: test_ollama_connection(base_url, timeout=probe_timeout),
+                name=f"Ollama at {base_url}",
+                ttl=settings.ollama_health_ttl,
+                interval=settings.ollama_health_interval,
+                failure_threshold=settings.ollama_circuit_failures,
+                reset_timeout=settings.ollama_circuit_reset,
+            )
+            _monitors[base_url] = monitor.start()
+        return monitor
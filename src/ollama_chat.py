@@ -0,0 +1,188 @@
+import json
+import hashlib
+import logging
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from src.agent import get_chat_options
+from src.exceptions import UpstreamUnavailableError
+from src.health import get_ollama_monitor
+from src.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+ROLES = {"human": "user", "ai": "assistant", "system": "system"}
+
+
+def pick_host(hosts: List[str], session_id: Optional[str]) -> str:
+    """Pin a session to one host so its prompt prefix stays in that host's cache."""
+    if len(hosts) == 1 or not session_id:
+        return hosts[0]
+    digest = int(hashlib.sha1(session_id.encode()).hexdigest(), 16)
+    return hosts[digest % len(hosts)]
+
+
+class OllamaChatModel(BaseChatModel):
+    """Chat model on Ollama's native /api/chat endpoint.
+
+    Messages are sent as a list (stable system prompt, then history, then the
+    new turn) with a fixed ``keep_alive`` and fixed options, so consecutive
+    turns of a session share a byte-identical prefix and Ollama can reuse the
+    KV cache instead of re-running prefill over the whole history.
+    """
+
+    hosts: List[str]
+    model: str
+    # None reads TEMPERATURE from the current settings on every request
+    temperature: Optional[float] = None
+    reads_settings_per_request: bool = True
+    keep_alive: str = "30m"
+    session_id: Optional[str] = None
+    timeout: float = 300.0
+    connect_timeout: float = 10.0
+    # Gate and record requests on the circuit breaker of the host they go to
+    circuit_breaker: bool = False
+    # Accepts a ``cancel_token`` keyword and a message list (see src/agent.py)
+    supports_cancel_token: bool = True
+    supports_chat_messages: bool = True
+    last_metrics: Dict[str, Any] = {}
+
+    @property
+    def _llm_type(self) -> str:
+        return "ollama-native-chat"
+
+    @property
+    def host(self) -> str:
+        return pick_host(self.hosts, self.session_id)
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        import requests
+
+        cancel_token = kwargs.pop("cancel_token", None)
+        temperature = self.temperature if self.temperature is not None else get_settings().temperature
+        options = get_chat_options(temperature)
+        if stop:
+            options["stop"] = stop
+        payload = {
+            "model": self.model,
+            "messages": [{"role": ROLES.get(m.type, "user"), "content": m.content} for m in messages],
+            "stream": True,
+            "keep_alive": self.keep_alive,
+            "options": options,
+        }
+        # The cancel callback is only registered once headers arrive, so the
+        # wait for them is bounded by the deadline rather than the full timeout
+        read_timeout = self.timeout
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+            remaining = cancel_token.remaining()
+            if remaining is not None:
+                read_timeout = min(read_timeout, max(remaining, 0.1))
+        timeout = (self.connect_timeout, read_timeout)
+        host = self.host
+        # One breaker per host, so a failing host doesn't open the circuit for
+        # sessions pinned to healthy ones
+        monitor = get_ollama_monitor(f"{host}/v1") if self.circuit_breaker else None
+        if monitor is not None and not monitor.allow_request():
+            raise UpstreamUnavailableError(f"{monitor.name} is currently unavailable")
+        recorded = False
+        try:
+            with requests.post(f"{host}/api/chat", json=payload, stream=True, timeout=timeout) as response:
+                if cancel_token is not None:
+                    cancel_token.on_cancel(response.close)
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if data.get("error"):
+                        raise RuntimeError(data["error"])
+                    token = (data.get("message") or {}).get("content")
+                    if token:
+                        chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+                        if run_manager:
+                            run_manager.on_llm_new_token(token, chunk=chunk)
+                        yield chunk
+                    if data.get("done"):
+                        self._record_metrics(data)
+                        break
+            if monitor is not None and not (cancel_token is not None and cancel_token.cancelled):
+                monitor.record_success()
+                recorded = True
+        except Exception:
+            if monitor is not None and not (cancel_token is not None and cancel_token.cancelled):
+                monitor.record_failure()
+                recorded = True
+            raise
+        finally:
+            if monitor is not None and not recorded:
+                # Cancelled or abandoned: no verdict on the server's health
+                monitor.release_probe()
+
+    def _record_metrics(self, data: Dict[str, Any]) -> None:
+        """Keep Ollama's counters from the final chunk of a response.
+
+        ``prompt_eval_count`` only counts prompt tokens that were actually
+        evaluated, so the gap to the full prompt size is what the prefix
+        cache saved (see stream_process_message's measurement mode).
+        """
+        self.last_metrics = {
+            "host": self.host,
+            "prompt_eval_count": data.get("prompt_eval_count", 0),
+            "prompt_eval_seconds": data.get("prompt_eval_duration", 0) / 1e9,
+            "eval_count": data.get("eval_count", 0),
+            "eval_seconds": data.get("eval_duration", 0) / 1e9,
+            "load_seconds": data.get("load_duration", 0) / 1e9,
+        }
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        text = "".join(chunk.text for chunk in self._stream(messages, stop, run_manager, **kwargs))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+
+class HealthCallbackHandler(BaseCallbackHandler):
+    """Circuit breaker for chat models that can't report health themselves.
+
+    Attached to the OpenAI-compatible ``ChatOpenAI`` model: each request is
+    gated by ``allow_request`` and its outcome recorded on the monitor.
+    """
+
+    # Let the UpstreamUnavailableError from on_chat_model_start reach the caller
+    raise_error = True
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+
+    @property
+    def monitor(self):
+        return get_ollama_monitor(self.base_url)
+
+    def on_chat_model_start(self, serialized, messages, **kwargs: Any) -> None:
+        if not self.monitor.allow_request():
+            raise UpstreamUnavailableError(f"{self.monitor.name} is currently unavailable")
+
+    def on_llm_end(self, response, **kwargs: Any) -> None:
+        self.monitor.record_success()
+
+    def on_llm_error(self, error: BaseException, **kwargs: Any) -> None:
+        if isinstance(error, (GeneratorExit, UpstreamUnavailableError)):
+            # Abandoned stream, or rejected by this handler before it started
+            self.monitor.release_probe()
+        else:
+            self.monitor.record_failure()
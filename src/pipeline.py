@@ -0,0 +1,144 @@
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from src.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_HEADER = "Relevant earlier messages:"
+KNOWLEDGE_HEADER = "Relevant documentation:"
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Process-wide pool for the pre-generation stages (PIPELINE_WORKERS)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_settings().pipeline_workers,
+                thread_name_prefix="turn-pipeline",
+            )
+        return _executor
+
+
+@dataclass
+class PreparedTurn:
+    """Inputs of one turn, resolved concurrently before generation."""
+    message: str
+    history: object = None
+    context: List[str] = field(default_factory=list)
+    knowledge: List[str] = field(default_factory=list)
+    persist: Optional[Future] = None
+
+    def prompt_input(self) -> str:
+        """The user input as sent to the model, with retrieved context prepended."""
+        sections = []
+        if self.knowledge:
+            sections.append(KNOWLEDGE_HEADER + "\n" + "\n\n".join(self.knowledge))
+        if self.context:
+            sections.append(CONTEXT_HEADER + "\n" + "\n".join(f"- {text}" for text in self.context))
+        if not sections:
+            return self.message
+        return "\n\n".join(sections + [self.message])
+
+
+def _history_texts(history) -> set:
+    if isinstance(history, str):
+        return {history}
+    return {getattr(message, "content", "") for message in history or []}
+
+
+def prepare_turn(
+    agent,
+    message: str,
+    vectorstore=None,
+    embeddings=None,
+    cipher_suite=None,
+    k: Optional[int] = None,
+    persist_message: bool = True,
+    cancel_token=None,
+    executor: Optional[ThreadPoolExecutor] = None,
+    knowledge_store=None,
+    knowledge_k: Optional[int] = None,
+    reranker=None,
+) -> PreparedTurn:
+    """Run the pre-generation stages of a turn concurrently.
+
+    Retrieval (query embedding, vector search, decryption of hits) and
+    memory loading run in parallel. Once retrieval is done the user message
+    is encrypted, embedded and persisted in the background so it overlaps
+    with generation; persisting after retrieval keeps the new message out of
+    its own search results. When ``knowledge_store`` is given, the same
+    query embedding also searches the ingested documents. With a reranker
+    (``reranker`` or RERANK=1) each search over-fetches candidates and keeps
+    the ``k`` best by cross-encoder score.
+
+    Returns:
+        PreparedTurn: History, retrieved context and the pending persist future
+    """
+    from db.model import retrieve_messages, save_message_to_vectorstore
+    from src.rerank import get_reranker
+
+    settings = get_settings()
+    executor = executor or get_executor()
+    k = k if k is not None else settings.retrieval_k
+    knowledge_k = knowledge_k if knowledge_k is not None else settings.knowledge_k
+    can_retrieve = vectorstore is not None and embeddings is not None and cipher_suite is not None
+    search_knowledge = can_retrieve and knowledge_store is not None and knowledge_k > 0
+    reranker = reranker if reranker is not None else get_reranker()
+
+    def _search(store, top_k: int, query_embedding) -> List[str]:
+        fetch_k = reranker.fetch_size(top_k) if reranker is not None else top_k
+        texts = retrieve_messages(store, embeddings, message, cipher_suite, fetch_k, query_embedding=query_embedding)
+        return reranker.rerank(message, texts, top_k) if reranker is not None else texts
+
+    def _retrieve():
+        query_embedding = embeddings.embed_query(message)
+        context = _search(vectorstore, k, query_embedding) if k > 0 else []
+        knowledge = []
+        if search_knowledge:
+            try:
+                knowledge = _search(knowledge_store, knowledge_k, query_embedding)
+            except Exception as e:
+                logger.error(f"Knowledge retrieval failed: {str(e)}")
+        return context, knowledge
+
+    memory_future = executor.submit(agent.memory.load_memory_variables, {})
+    context_future = None
+    if can_retrieve and (k > 0 or search_knowledge):
+        context_future = executor.submit(_retrieve)
+
+    prepared = PreparedTurn(message=message)
+    if can_retrieve and persist_message:
+        persist_future: Future = Future()
+
+        def _persist(_=None):
+            try:
+                persist_future.set_result(save_message_to_vectorstore(
+                    vectorstore, embeddings, message, cipher_suite, cancel_token=cancel_token
+                ))
+            except BaseException as e:
+                logger.error(f"Failed to persist user message: {str(e)}")
+                persist_future.set_exception(e)
+
+        if context_future is not None:
+            context_future.add_done_callback(lambda _: executor.submit(_persist))
+        else:
+            executor.submit(_persist)
+        prepared.persist = persist_future
+
+    prepared.history = memory_future.result()[agent.memory.memory_key]
+    if context_future is not None:
+        try:
+            seen = _history_texts(prepared.history)
+            context, prepared.knowledge = context_future.result()
+            prepared.context = [text for text in context if text not in seen]
+        except Exception as e:
+            logger.error(f"Retrieval failed, continuing without context: {str(e)}")
+    return prepared
@@ -0,0 +1,380 @@
+"""Compact encrypted record format.
+
+A record is the compressed plaintext encrypted with AES-256-GCM::
+
+    b"SR" | version (1) | codec (1) | nonce (12) | ciphertext + tag (16)
+
+The 4-byte header is authenticated as associated data. The codec is
+zstd when ``zstandard`` is installed, otherwise zlib; it is "none" when
+compressing does not make the text smaller. Chroma documents must be text,
+so records are stored base64-encoded behind a ``sr:`` prefix (base85 would
+be ~6% smaller but CPython's encoder is pure Python and ~50x slower).
+``RecordCipher`` reads those, raw binary records and legacy Fernet tokens,
+so old and new records can be mixed in one collection.
+
+The AES key is derived with HKDF from the existing Fernet key
+(ENCRYPTION_KEY), so no new secret is needed. A second, independent HKDF
+output is the cipher's ``key_id``; it is stored as record metadata
+(KEY_ID_FIELD) so searches only return records the reader can decrypt.
+Migration also stamps it on records written before it existed.
+
+Usage:
+    # Rewrite Fernet records in place (embeddings are kept)
+    python -m src.records migrate --collection encrypted_chat_history
+
+    # Compare size and throughput with Fernet
+    python -m src.records benchmark --sizes 200,2000,20000
+"""
+import os
+import sys
+import zlib
+import base64
+import logging
+import argparse
+from typing import Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SR"
+VERSION = 1
+TEXT_PREFIX = b"sr:"
+HEADER_SIZE = 4
+NONCE_SIZE = 12
+# Metadata field holding the key_id of the key that encrypted a record
+KEY_ID_FIELD = "key_id"
+
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+CODEC_NAMES = {"none": CODEC_NONE, "zlib": CODEC_ZLIB, "zstd": CODEC_ZSTD}
+
+# Shorter plaintexts are rarely worth compressing
+MIN_COMPRESS_SIZE = 64
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def default_codec() -> int:
+    return CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+
+
+def compress(data: bytes, codec: int) -> bytes:
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    if codec == CODEC_ZLIB:
+        return zlib.compress(data, 6)
+    return data
+
+
+def decompress(data: bytes, codec: int) -> bytes:
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError("Record is zstd-compressed but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(data)
+    if codec == CODEC_NONE:
+        return data
+    raise ValueError(f"Unknown record codec {codec}")
+
+
+def derive_record_key(fernet_key: Union[str, bytes]) -> bytes:
+    """Derive the 256-bit AES-GCM key from a Fernet key."""
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+    if isinstance(fernet_key, str):
+        fernet_key = fernet_key.encode()
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=b"sec-convagent record v1",
+    ).derive(base64.urlsafe_b64decode(fernet_key))
+
+
+def derive_key_id(fernet_key: Union[str, bytes]) -> str:
+    """Public identifier of a Fernet key; reveals nothing about the key."""
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+    if isinstance(fernet_key, str):
+        fernet_key = fernet_key.encode()
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=8,
+        salt=None,
+        info=b"sec-convagent key id",
+    ).derive(base64.urlsafe_b64decode(fernet_key)).hex()
+
+
+def is_record(data: Union[str, bytes]) -> bool:
+    """True for records in this format (text or binary), False for Fernet tokens."""
+    if isinstance(data, str):
+        data = data.encode()
+    return data.startswith(TEXT_PREFIX) or data.startswith(MAGIC)
+
+
+class RecordCipher:
+    """Drop-in replacement for ``Fernet`` writing compact records.
+
+    ``encrypt`` returns text-safe (base64) records, ``encrypt_binary`` raw
+    ones; ``decrypt`` accepts either and legacy Fernet tokens. With
+    ``write_format="fernet"`` new records stay Fernet tokens, for rolling
+    upgrades where older replicas still read the store.
+    """
+
+    def __init__(self, key: Union[str, bytes], codec: Optional[int] = None, write_format: str = "v1"):
+        from cryptography.fernet import Fernet
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+        if write_format not in ("v1", "fernet"):
+            raise ValueError(f"Unknown record format {write_format!r}")
+        self.fernet = Fernet(key)
+        self.aead = AESGCM(derive_record_key(key))
+        self.codec = default_codec() if codec is None else codec
+        self.write_format = write_format
+        self.key_id = derive_key_id(key)
+
+    @classmethod
+    def from_env(cls, key: Union[str, bytes]) -> "RecordCipher":
+        """Cipher configured by RECORD_FORMAT (v1|fernet) and RECORD_CODEC (zstd|zlib|none)."""
+        from src.settings import get_settings
+
+        settings = get_settings()
+        return cls(
+            key,
+            codec=CODEC_NAMES[settings.record_codec] if settings.record_codec else None,
+            write_format=settings.record_format,
+        )
+
+    def encrypt_binary(self, data: bytes) -> bytes:
+        codec = self.codec if len(data) >= MIN_COMPRESS_SIZE else CODEC_NONE
+        payload = compress(data, codec)
+        if codec != CODEC_NONE and len(payload) >= len(data):
+            codec, payload = CODEC_NONE, data
+        header = MAGIC + bytes((VERSION, codec))
+        nonce = os.urandom(NONCE_SIZE)
+        return header + nonce + self.aead.encrypt(nonce, payload, header)
+
+    def encrypt(self, data: bytes) -> bytes:
+        if self.write_format == "fernet":
+            return self.fernet.encrypt(data)
+        return TEXT_PREFIX + base64.b64encode(self.encrypt_binary(data))
+
+    def decrypt(self, token: Union[str, bytes]) -> bytes:
+        """Decrypt a text record, binary record or Fernet token.
+
+        Raises:
+            cryptography.fernet.InvalidToken: If the data is corrupted or
+                was encrypted with another key
+        """
+        from cryptography.exceptions import InvalidTag
+        from cryptography.fernet import InvalidToken
+
+        if isinstance(token, str):
+            token = token.encode()
+        if token.startswith(TEXT_PREFIX):
+            try:
+                token = base64.b64decode(token[len(TEXT_PREFIX):], validate=True)
+            except ValueError:
+                raise InvalidToken
+        if not token.startswith(MAGIC):
+            return self.fernet.decrypt(token)
+        header, nonce = token[:HEADER_SIZE], token[HEADER_SIZE:HEADER_SIZE + NONCE_SIZE]
+        if len(token) < HEADER_SIZE + NONCE_SIZE + 16 or header[2] != VERSION:
+            raise InvalidToken
+        try:
+            payload = self.aead.decrypt(nonce, token[HEADER_SIZE + NONCE_SIZE:], header)
+        except InvalidTag:
+            raise InvalidToken
+        return decompress(payload, header[3])
+
+
+def get_cipher(key: Union[str, bytes]) -> RecordCipher:
+    """The cipher the app, CLI and ingestion use for stored records."""
+    return RecordCipher.from_env(key)
+
+
+# ----------------------------------------------------------------------
+# Migration
+# ----------------------------------------------------------------------
+def migrate_collection(collection, cipher: RecordCipher, batch_size: int = 256, dry_run: bool = False) -> Dict[str, int]:
+    """Rewrite the Fernet documents of a Chroma collection as v1 records.
+
+    Only documents and the key_id metadata change. The stored embeddings and
+    metadata are written back with each update: a collection opened without
+    an embedding function would otherwise re-embed the new (ciphertext)
+    documents with Chroma's default model. v1 records without this cipher's
+    key_id are only tagged; tagged records are skipped and documents the
+    cipher can't decrypt are counted as failed.
+
+    Returns:
+        dict: Counts of migrated/tagged/skipped/failed documents and bytes before/after
+    """
+    stats = {"migrated": 0, "tagged": 0, "skipped": 0, "failed": 0, "bytes_before": 0, "bytes_after": 0}
+    offset = 0
+    while True:
+        page = collection.get(include=["documents", "embeddings", "metadatas"], limit=batch_size, offset=offset)
+        ids, documents = page["ids"], page["documents"]
+        if not ids:
+            break
+        offset += len(ids)
+        embeddings = page.get("embeddings")
+        metadatas = page.get("metadatas") or [None] * len(ids)
+        update_ids, update_docs, update_embeddings, update_metadatas = [], [], [], []
+        for i, (doc_id, document) in enumerate(zip(ids, documents)):
+            metadata = metadatas[i] or {}
+            if not document or (is_record(document) and metadata.get(KEY_ID_FIELD) == cipher.key_id):
+                stats["skipped"] += 1
+                continue
+            try:
+                plaintext = cipher.decrypt(document.encode())
+            except Exception:
+                stats["failed"] += 1
+                continue
+            if is_record(document):
+                record = document
+                stats["tagged"] += 1
+            else:
+                record = cipher.encrypt(plaintext).decode()
+                stats["migrated"] += 1
+                stats["bytes_before"] += len(document)
+                stats["bytes_after"] += len(record)
+            update_ids.append(doc_id)
+            update_docs.append(record)
+            update_embeddings.append(list(embeddings[i]) if embeddings is not None else None)
+            update_metadatas.append({**metadata, KEY_ID_FIELD: cipher.key_id})
+        if update_ids and not dry_run:
+            update = {"ids": update_ids, "documents": update_docs, "metadatas": update_metadatas}
+            if embeddings is not None:
+                update["embeddings"] = update_embeddings
+            collection.update(**update)
+        logger.info(f"Migrated {stats['migrated']} documents so far")
+    return stats
+
+
+# ----------------------------------------------------------------------
+# Benchmark
+# ----------------------------------------------------------------------
+BENCHMARK_WORDS = (
+    "the model server returned a streaming response with reasoning tokens before the final "
+    "answer and the vector store keeps encrypted history for retrieval so prompts stay small "
+    "check the firewall rules rotate credentials review access logs isolate the affected host "
+    "escalate to the incident commander and document every step in the runbook"
+).split()
+
+
+def sample_text(size: int, seed: int = 0) -> str:
+    """Assistant-like text of about ``size`` characters."""
+    import random
+
+    rng = random.Random(seed)
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(BENCHMARK_WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:size]
+
+
+def benchmark(sizes: List[int], iterations: int = 200, texts: Optional[List[str]] = None) -> List[Dict]:
+    """Compare Fernet with v1 records (each available codec) on size and speed."""
+    import time
+    from cryptography.fernet import Fernet
+
+    key = Fernet.generate_key()
+    ciphers = {"fernet": Fernet(key)}
+    for name, codec in CODEC_NAMES.items():
+        if codec != CODEC_ZSTD or zstandard is not None:
+            ciphers[f"v1-{name}"] = RecordCipher(key, codec=codec)
+
+    samples = [(f"{len(text)}B corpus", [text.encode()]) for text in texts or []] or [
+        (f"{size}B", [sample_text(size, seed).encode() for seed in range(8)]) for size in sizes
+    ]
+    rows = []
+    for label, plaintexts in samples:
+        plain_bytes = sum(len(p) for p in plaintexts)
+        for name, cipher in ciphers.items():
+            tokens = [cipher.encrypt(p) for p in plaintexts]
+            start = time.perf_counter()
+            for _ in range(iterations):
+                for p in plaintexts:
+                    cipher.encrypt(p)
+            encrypt_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            for _ in range(iterations):
+                for t in tokens:
+                    cipher.decrypt(t)
+            decrypt_seconds = time.perf_counter() - start
+            total = plain_bytes * iterations / 1e6
+            rows.append({
+                "size": label,
+                "format": name,
+                "ratio": round(sum(len(t) for t in tokens) / plain_bytes, 3),
+                "encrypt_mb_s": round(total / encrypt_seconds, 1),
+                "decrypt_mb_s": round(total / decrypt_seconds, 1),
+            })
+    return rows
+
+
+def main(argv=None) -> int:
+    from src.settings import get_settings
+
+    settings = get_settings()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+    parser = argparse.ArgumentParser(description="Compact encrypted record format tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    migrate = sub.add_parser("migrate", help="Rewrite Fernet records of a collection as v1 records")
+    migrate.add_argument("--collection", action="append",
+                         help="Collection name (repeatable; default: chat history and knowledge base)")
+    migrate.add_argument("--batch-size", type=int, default=256)
+    migrate.add_argument("--dry-run", action="store_true", help="Report sizes without writing")
+
+    bench = sub.add_parser("benchmark", help="Compare size and throughput with Fernet")
+    bench.add_argument("--sizes", default="200,2000,20000", help="Plaintext sizes in characters")
+    bench.add_argument("--iterations", type=int, default=200)
+    bench.add_argument("--file", action="append", help="Benchmark on the text of this file instead")
+    args = parser.parse_args(argv)
+
+    if args.command == "benchmark":
+        texts = [open(path, encoding="utf-8", errors="replace").read() for path in args.file or []]
+        rows = benchmark([int(s) for s in args.sizes.split(",")], args.iterations, texts)
+        print(f"{'size':>14} {'format':>10} {'ratio':>7} {'enc MB/s':>9} {'dec MB/s':>9}")
+        for row in rows:
+            print(f"{row['size']:>14} {row['format']:>10} {row['ratio']:>7} "
+                  f"{row['encrypt_mb_s']:>9} {row['decrypt_mb_s']:>9}")
+        return 0
+
+    key = settings.encryption_key
+    if not key:
+        logger.error("ENCRYPTION_KEY must be set to migrate records")
+        return 1
+    import chromadb
+    from db.backends import get_client_pool
+
+    pool = get_client_pool()
+    client = pool.get() if pool is not None else chromadb.PersistentClient(path=settings.vector_db_path)
+    names = args.collection or ["encrypted_chat_history", settings.knowledge_collection]
+    cipher = RecordCipher(key)
+    failed = 0
+    for name in names:
+        try:
+            collection = client.get_collection(name)
+        except Exception as e:
+            logger.warning(f"Skipping collection {name}: {str(e)}")
+            continue
+        stats = migrate_collection(collection, cipher, args.batch_size, args.dry_run)
+        failed += stats["failed"]
+        saved = stats["bytes_before"] - stats["bytes_after"]
+        logger.info(f"{name}: {stats} ({saved / 1024:.0f} KiB saved)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from src.settings import Settings, get_settings, on_reload
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+# Searches that skip over-fetching after scoring ran out of budget
+BUDGET_COOLDOWN_SEARCHES = 10
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class ScoreCache:
+    """Bounded LRU of cross-encoder scores keyed by (query hash, doc hash)."""
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._scores: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str]) -> Optional[float]:
+        with self._lock:
+            score = self._scores.get(key)
+            if score is not None:
+                self._scores.move_to_end(key)
+            return score
+
+    def put(self, key: Tuple[str, str], score: float) -> None:
+        with self._lock:
+            self._scores[key] = score
+            self._scores.move_to_end(key)
+            while len(self._scores) > self.max_size:
+                self._scores.popitem(last=False)
+
+    def resize(self, max_size: int) -> None:
+        """Change the capacity, dropping the least recently used scores if needed."""
+        with self._lock:
+            self.max_size = max_size
+            while len(self._scores) > self.max_size:
+                self._scores.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+
+class Reranker:
+    """Second-stage reranking of retrieved texts with a CPU cross-encoder.
+
+    Retrieval over-fetches ``fetch_k`` candidates; the cross-encoder scores
+    (query, text) pairs in batches of ``batch_size`` and the best ``k`` are
+    kept. Scores are cached, so texts that come back turn after turn are
+    only scored once per query. When scoring would exceed ``budget``
+    seconds, or the model is still loading, the candidates pass through in
+    their retrieval order.
+    """
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_RERANK_MODEL,
+        fetch_k: int = 50,
+        batch_size: int = 16,
+        cache_size: int = 10000,
+        budget: Optional[float] = 0.3,
+        max_length: int = 512,
+    ):
+        self.model_name = model_name
+        self.fetch_k = fetch_k
+        self.batch_size = max(1, batch_size)
+        self.budget = budget
+        self.max_length = max_length
+        self.cache = ScoreCache(cache_size)
+        self.model = None
+        self.stats = {"reranked": 0, "passthrough": 0, "cache_hits": 0, "scored": 0}
+        # Moving average of one batch's scoring time, to stop before a
+        # batch that would overrun the budget
+        self._batch_seconds = 0.0
+        self._load_lock = threading.Lock()
+        self._loading: Optional[threading.Thread] = None
+        # Searches left that fetch only k after the budget ran out
+        self._cooldown = 0
+
+    # ------------------------------------------------------------------
+    # Model loading
+    # ------------------------------------------------------------------
+    def load(self) -> None:
+        """Load the cross-encoder (blocking, idempotent)."""
+        with self._load_lock:
+            if self.model is not None:
+                return
+            from sentence_transformers import CrossEncoder
+
+            start = time.perf_counter()
+            self.model = CrossEncoder(self.model_name, device="cpu", max_length=self.max_length)
+            logger.info(f"Loaded reranker {self.model_name} in {time.perf_counter() - start:.2f}s")
+
+    def load_in_background(self) -> None:
+        """Start loading the model without blocking the request path."""
+        if self.model is None and (self._loading is None or not self._loading.is_alive()):
+            self._loading = threading.Thread(target=self._load_quietly, name="reranker-load", daemon=True)
+            self._loading.start()
+
+    def _load_quietly(self) -> None:
+        try:
+            self.load()
+        except Exception as e:
+            logger.error(f"Failed to load reranker {self.model_name}: {str(e)}")
+
+    # ------------------------------------------------------------------
+    # Scoring
+    # ------------------------------------------------------------------
+    def score(self, query: str, texts: List[str]) -> Optional[List[float]]:
+        """Score every text against the query, or None if the budget ran out."""
+        deadline = time.monotonic() + self.budget if self.budget else None
+        query_hash = _digest(query)
+        keys = [(query_hash, _digest(text)) for text in texts]
+        scores: List[Optional[float]] = [self.cache.get(key) for key in keys]
+        missing = [i for i, score in enumerate(scores) if score is None]
+        self.stats["cache_hits"] += len(texts) - len(missing)
+
+        for start in range(0, len(missing), self.batch_size):
+            # The first batch always runs so the batch-time estimate stays fresh
+            if start and deadline is not None and time.monotonic() + self._batch_seconds >= deadline:
+                logger.warning(f"Rerank budget of {self.budget * 1000:.0f}ms exceeded, passing through")
+                self._cooldown = BUDGET_COOLDOWN_SEARCHES
+                return None
+            batch = missing[start:start + self.batch_size]
+            batch_start = time.perf_counter()
+            predicted = self.model.predict([(query, texts[i]) for i in batch], batch_size=self.batch_size)
+            elapsed = time.perf_counter() - batch_start
+            self._batch_seconds = elapsed if not self._batch_seconds else 0.8 * self._batch_seconds + 0.2 * elapsed
+            for i, score in zip(batch, predicted):
+                scores[i] = float(score)
+                self.cache.put(keys[i], scores[i])
+            self.stats["scored"] += len(batch)
+        return scores
+
+    def fetch_size(self, k: int) -> int:
+        """Number of candidates retrieval should fetch for the ``k`` best.
+
+        Over-fetches ``fetch_k`` only when the candidates can actually be
+        scored. While the model is loading, or for a few searches after the
+        budget ran out, the extra hits would pass through unranked and only
+        cost decryption, so just ``k`` are fetched.
+        """
+        if self.model is None:
+            self.load_in_background()
+            return k
+        if self._cooldown > 0:
+            self._cooldown -= 1
+            return k
+        return max(k, self.fetch_k)
+
+    def rerank(self, query: str, texts: List[str], k: int) -> List[str]:
+        """Return the ``k`` best texts for the query.
+
+        Falls back to the first ``k`` in retrieval order when the model is
+        not loaded yet, scoring fails or the latency budget is exceeded.
+        """
+        if len(texts) <= 1:
+            return texts[:k]
+        if self.model is None:
+            self.load_in_background()
+            self.stats["passthrough"] += 1
+            return texts[:k]
+        try:
+            scores = self.score(query, texts)
+        except Exception as e:
+            logger.error(f"Rerank failed, passing through: {str(e)}")
+            scores = None
+        if scores is None:
+            self.stats["passthrough"] += 1
+            return texts[:k]
+        self.stats["reranked"] += 1
+        ranked = sorted(range(len(texts)), key=lambda i: scores[i], reverse=True)
+        return [texts[i] for i in ranked[:k]]
+
+    def configure(self, fetch_k: int, batch_size: int, cache_size: int, budget: Optional[float]) -> None:
+        """Apply new tunables without reloading the model or dropping cached scores."""
+        self.fetch_k = fetch_k
+        self.batch_size = max(1, batch_size)
+        self.budget = budget
+        self.cache.resize(cache_size)
+
+    def status(self) -> Dict[str, object]:
+        return {"model": self.model_name, "loaded": self.model is not None, "cached_scores": len(self.cache), **self.stats}
+
+
+_reranker: Optional[Reranker] = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker() -> Optional[Reranker]:
+    """Process-wide reranker when RERANK=1, configured from the RERANK_* settings."""
+    global _reranker
+    settings = get_settings()
+    if not settings.rerank:
+        return None
+    with _reranker_lock:
+        if _reranker is None:
+            _reranker = Reranker(
+                model_name=settings.rerank_model,
+                fetch_k=settings.rerank_fetch_k,
+                batch_size=settings.rerank_batch_size,
+                cache_size=settings.rerank_cache_size,
+                budget=settings.rerank_budget,
+            )
+        return _reranker
+
+
+@on_reload
+def _reconfigure_reranker(old: Settings, new: Settings, changed: List[str]) -> None:
+    """Retune the live reranker; only a new RERANK_MODEL rebuilds it."""
+    global _reranker
+    with _reranker_lock:
+        if _reranker is None:
+            return
+        if new.rerank_model != _reranker.model_name:
+            # Built with the new model on next use
+            _reranker = None
+            return
+        _reranker.configure(
+            fetch_k=new.rerank_fetch_k,
+            batch_size=new.rerank_batch_size,
+            cache_size=new.rerank_cache_size,
+            budget=new.rerank_budget,
+        )
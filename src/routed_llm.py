@@ -0,0 +1,62 @@
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from src.settings import get_settings
+
+ROLES = {"human": "user", "ai": "assistant", "system": "system"}
+
+
+def to_openai_messages(messages: List[BaseMessage]) -> List[Dict[str, str]]:
+    """Convert LangChain messages to OpenAI chat messages."""
+    return [{"role": ROLES.get(m.type, "user"), "content": m.content} for m in messages]
+
+
+class RoutedChatModel(BaseChatModel):
+    """LangChain chat model backed by a ProviderRouter.
+
+    Lets the existing ConversationChain spread load over several
+    OpenAI-compatible backends with fallback before the first token.
+    """
+
+    router: Any
+    # None reads TEMPERATURE from the current settings on every request
+    temperature: Optional[float] = None
+    reads_settings_per_request: bool = True
+    # stream()/invoke() accept a ``cancel_token`` keyword (src/cancellation.py)
+    supports_cancel_token: bool = True
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed-openai-compatible"
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        cancel_token = kwargs.pop("cancel_token", None)
+        temperature = self.temperature if self.temperature is not None else get_settings().temperature
+        params = {"temperature": temperature, **kwargs}
+        if stop:
+            params["stop"] = stop
+        for token in self.router.stream_chat(to_openai_messages(messages), cancel_token=cancel_token, **params):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        text = "".join(chunk.text for chunk in self._stream(messages, stop, run_manager, **kwargs))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
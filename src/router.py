@@ -0,0 +1,258 @@
+import json
+import time
+import logging
+import threading
+from typing import Dict, Iterator, List, Optional
+
+from pydantic import BaseModel, Field
+
+from src.exceptions import GenerationCancelled, UpstreamUnavailableError
+from src.health import HealthMonitor
+from src.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Statuses that mean "busy, try elsewhere" rather than "broken"
+OVERLOAD_STATUSES = {429, 503}
+
+
+class BackendConfig(BaseModel):
+    """Configuration for one OpenAI-compatible model backend."""
+    name: str
+    base_url: str
+    model: str = Field(default="deepseek-r1:1.5b")
+    api_key: str = Field(default="sk-no-key-required")
+    weight: float = Field(default=1.0, gt=0)
+    max_concurrency: int = Field(default=4, ge=1)
+    timeout: float = Field(default=120.0)
+
+
+class BackendOverloaded(Exception):
+    """The backend answered but refused the request because it is busy."""
+
+
+class Backend:
+    """Runtime state of a backend: in-flight requests, latency and health."""
+
+    def __init__(self, config: BackendConfig, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.config = config
+        self.in_flight = 0
+        self.ewma_ttft: Optional[float] = None
+        self.health = HealthMonitor(
+            probe=self.probe,
+            name=f"backend {config.name}",
+            failure_threshold=failure_threshold,
+            reset_timeout=reset_timeout,
+        )
+
+    @property
+    def name(self) -> str:
+        return self.config.name
+
+    def load(self) -> float:
+        """Weighted load once this request is added, for least-loaded selection.
+
+        Counting the new request means weights still decide between idle
+        backends, where ``in_flight / weight`` would be 0 for all of them.
+        """
+        return (self.in_flight + 1) / self.config.weight
+
+    def observe_ttft(self, seconds: float, alpha: float = 0.3) -> None:
+        self.ewma_ttft = seconds if self.ewma_ttft is None else alpha * seconds + (1 - alpha) * self.ewma_ttft
+
+    def headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.config.api_key}"}
+
+    def probe(self) -> bool:
+        import requests
+
+        response = requests.get(f"{self.config.base_url.rstrip('/')}/models", headers=self.headers(), timeout=2)
+        return response.status_code == 200
+
+    def stream_chat(self, messages: List[Dict[str, str]], cancel_token=None, **params) -> Iterator[str]:
+        """Stream content tokens from the backend's /chat/completions endpoint.
+
+        When ``cancel_token`` is cancelled the upstream connection is closed
+        right away, which also stops the generation on the server.
+        """
+        import requests
+
+        payload = {"model": self.config.model, "messages": messages, "stream": True, **params}
+        with requests.post(
+            f"{self.config.base_url.rstrip('/')}/chat/completions",
+            json=payload,
+            headers=self.headers(),
+            stream=True,
+            timeout=self.config.timeout,
+        ) as response:
+            if cancel_token is not None:
+                cancel_token.on_cancel(response.close)
+            if response.status_code in OVERLOAD_STATUSES:
+                raise BackendOverloaded(f"{self.name} returned {response.status_code}")
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or [{}]
+                content = (choices[0].get("delta") or {}).get("content")
+                if content:
+                    yield content
+
+
+class ProviderRouter:
+    """Routes chat requests across several OpenAI-compatible backends.
+
+    Backends are ranked by weighted in-flight load, then by their moving
+    average time-to-first-token. A request that fails or is refused for
+    overload before its first token is retried on the next backend; once a
+    token has been emitted errors propagate to the caller.
+
+    The backends' circuit breakers are passive: nothing probes them in the
+    background (probing paid APIs would cost requests). An open circuit
+    recovers through traffic, when the first request after
+    ``reset_timeout`` is let through as the half-open trial.
+    """
+
+    def __init__(self, backends: List[BackendConfig], failure_threshold: int = 3, reset_timeout: float = 30.0):
+        if not backends:
+            raise ValueError("At least one backend is required")
+        self.backends = [Backend(config, failure_threshold, reset_timeout) for config in backends]
+        self._lock = threading.Lock()
+
+    def ranked(self) -> List[Backend]:
+        """Backends in preference order (least loaded, then fastest)."""
+        with self._lock:
+            return sorted(
+                self.backends,
+                key=lambda b: (b.load(), b.ewma_ttft if b.ewma_ttft is not None else 0.0),
+            )
+
+    def _acquire(self, backend: Backend) -> bool:
+        with self._lock:
+            if backend.in_flight >= backend.config.max_concurrency:
+                return False
+            backend.in_flight += 1
+            return True
+
+    def _release(self, backend: Backend) -> None:
+        with self._lock:
+            backend.in_flight -= 1
+
+    def stream_chat(self, messages: List[Dict[str, str]], cancel_token=None, **params) -> Iterator[str]:
+        """Stream a chat completion, falling back between backends.
+
+        Raises:
+            UpstreamUnavailableError: If every backend is down or saturated
+            GenerationCancelled: If ``cancel_token`` is cancelled
+        """
+        errors = []
+        for backend in self.ranked():
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            if not self._acquire(backend):
+                errors.append(f"{backend.name}: at max concurrency")
+                continue
+            if not backend.health.allow_request():
+                self._release(backend)
+                errors.append(f"{backend.name}: circuit open")
+                continue
+            emitted = False
+            recorded = False
+            start = time.perf_counter()
+            try:
+                for token in backend.stream_chat(messages, cancel_token=cancel_token, **params):
+                    if not emitted:
+                        emitted = True
+                        backend.observe_ttft(time.perf_counter() - start)
+                    yield token
+                if cancel_token is not None:
+                    # A closed connection can end the stream without an error
+                    cancel_token.raise_if_cancelled()
+                backend.health.record_success()
+                recorded = True
+                return
+            except BackendOverloaded as e:
+                # Reachable, just busy: don't count it against the circuit
+                backend.health.record_success()
+                recorded = True
+                errors.append(str(e))
+                if emitted:
+                    raise
+            except Exception as e:
+                if cancel_token is not None and cancel_token.cancelled:
+                    # The connection was closed on purpose, not a backend fault
+                    raise GenerationCancelled(cancel_token.reason) from e
+                backend.health.record_failure()
+                recorded = True
+                if emitted:
+                    raise
+                logger.warning(f"Backend {backend.name} failed before first token, falling back: {str(e)}")
+                errors.append(f"{backend.name}: {str(e)}")
+            finally:
+                if not recorded:
+                    # Cancelled or abandoned by the consumer: free a half-open trial
+                    backend.health.release_probe()
+                self._release(backend)
+        raise UpstreamUnavailableError(f"No model backend available ({'; '.join(errors)})")
+
+    def chat(self, messages: List[Dict[str, str]], **params) -> str:
+        """Non-streaming convenience wrapper around ``stream_chat``."""
+        return "".join(self.stream_chat(messages, **params))
+
+    def status(self) -> List[Dict[str, object]]:
+        with self._lock:
+            return [
+                {
+                    "name": b.name,
+                    "in_flight": b.in_flight,
+                    "max_concurrency": b.config.max_concurrency,
+                    "weight": b.config.weight,
+                    "ewma_ttft": b.ewma_ttft,
+                    "state": b.health.state,
+                }
+                for b in self.backends
+            ]
+
+
+def load_backend_configs() -> List[BackendConfig]:
+    """Read backends from MODEL_BACKENDS (JSON list), else the single Ollama host.
+
+    Each entry's ``api_key`` may be given directly or as ``api_key_env``, the
+    name of an environment variable holding the key.
+    """
+    settings = get_settings()
+    if not settings.model_backends:
+        return [BackendConfig(
+            name="ollama",
+            base_url=settings.openai_base_url,
+            model=settings.ollama_model,
+        )]
+    configs = []
+    for entry in settings.model_backends:
+        entry = dict(entry)
+        key_env = entry.pop("api_key_env", None)
+        if key_env:
+            entry["api_key"] = settings.get(key_env, "")
+        configs.append(BackendConfig(**entry))
+    return configs
+
+
+_router: Optional[ProviderRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_provider_router() -> ProviderRouter:
+    """Return the process-wide provider router."""
+    global _router
+    with _router_lock:
+        if _router is None:
+            settings = get_settings()
+            _router = ProviderRouter(
+                load_backend_configs(),
+                failure_threshold=settings.ollama_circuit_failures,
+                reset_timeout=settings.ollama_circuit_reset,
+            )
+        return _router
@@ -0,0 +1,319 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# State keys written to the spill file; everything else (the agent and its
+# model client) is rebuilt on rehydration
+SPILLED_KEYS = ("chat_history", "total_tokens", "last_turn_stats")
+
+
+def deep_sizeof(obj: Any, seen: Optional[set] = None) -> int:
+    """Approximate retained size of ``obj`` in bytes.
+
+    Follows containers and instance attributes; classes, modules and
+    functions are shared between sessions and not counted.
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen or isinstance(obj, (type, type(sys), type(deep_sizeof))):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj, 0)
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool)) or obj is None:
+        return size
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    if hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+
+def dump_memory(agent) -> List[dict]:
+    """Serialize an agent's conversation memory."""
+    from langchain_core.messages import messages_to_dict
+
+    return messages_to_dict(agent.memory.chat_memory.messages)
+
+
+def load_memory(agent, messages: List[dict]) -> None:
+    """Restore conversation memory saved with ``dump_memory``."""
+    from langchain_core.messages import messages_from_dict
+
+    agent.memory.chat_memory.messages = messages_from_dict(messages)
+
+
+class SessionData:
+    """Evictable state of one browser session.
+
+    ``state`` holds the chat history, the agent (with its conversation
+    memory) and per-session counters. The Streamlit session keeps only its
+    id and a reference to this dict, so eviction clears it in place.
+    """
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.state: Dict[str, Any] = {}
+        self.last_seen = time.monotonic()
+        self.pins = 0
+
+    def size(self) -> int:
+        """Retained bytes of this session's state (agent memory, not the model client)."""
+        seen = set()
+        total = 0
+        for key, value in list(self.state.items()):
+            if key == "agent":
+                value = getattr(value, "memory", None)
+            total += deep_sizeof(value, seen)
+        return total
+
+    def message_count(self) -> int:
+        return len(self.state.get("chat_history") or [])
+
+
+class SessionManager:
+    """Caps live session state and spills idle sessions to encrypted files.
+
+    Sessions idle for ``idle_timeout`` seconds are evicted by a background
+    sweep; above ``max_sessions`` live sessions or ``max_bytes`` retained
+    bytes the least recently used ones go first. Evicted state is written to
+    ``spill_dir`` as one encrypted record per session and read back
+    transparently by ``acquire`` when the session returns. Sessions pinned
+    by a running turn are never evicted.
+    """
+
+    def __init__(
+        self,
+        cipher_suite,
+        spill_dir: str = "./session_store",
+        max_sessions: int = 50,
+        max_bytes: Optional[int] = None,
+        idle_timeout: float = 900.0,
+        interval: float = 60.0,
+        spill_ttl: float = 7 * 24 * 3600,
+    ):
+        self.cipher_suite = cipher_suite
+        self.spill_dir = spill_dir
+        self.max_sessions = max(1, max_sessions)
+        self.max_bytes = max_bytes
+        self.idle_timeout = idle_timeout
+        self.interval = interval
+        self.spill_ttl = spill_ttl
+        self.evictions = 0
+        self.rehydrations = 0
+        self._sessions: Dict[str, SessionData] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        os.makedirs(spill_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> "SessionManager":
+        """Build a manager from the SESSION_* settings.
+
+        The spill files are encrypted with ENCRYPTION_KEY when set (so they
+        survive restarts), else with a key that lives as long as the process.
+        """
+        from cryptography.fernet import Fernet
+        from src.records import get_cipher
+        from src.settings import get_settings
+
+        settings = get_settings()
+        return cls(
+            get_cipher(settings.encryption_key or Fernet.generate_key()),
+            spill_dir=settings.session_spill_dir,
+            max_sessions=settings.session_max_active,
+            max_bytes=settings.session_max_bytes,
+            idle_timeout=settings.session_idle_timeout,
+            interval=settings.session_sweep_interval,
+        )
+
+    def configure(self, max_sessions: int, max_bytes: Optional[int], idle_timeout: float, interval: float) -> None:
+        """Apply new limits; they take effect at the next sweep."""
+        with self._lock:
+            self.max_sessions = max(1, max_sessions)
+            self.max_bytes = max_bytes
+            self.idle_timeout = idle_timeout
+            self.interval = interval
+
+    # ------------------------------------------------------------------
+    # Session access
+    # ------------------------------------------------------------------
+    def acquire(self, session_id: str) -> SessionData:
+        """Return the live state of a session, rehydrating it if it was evicted."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = SessionData(session_id)
+                self._sessions[session_id] = session
+                self._rehydrate(session)
+            session.last_seen = time.monotonic()
+            over_capacity = len(self._sessions) > self.max_sessions
+        if over_capacity:
+            self.sweep()
+        return session
+
+    def pin(self, session: SessionData) -> None:
+        """Protect a session from eviction while a turn is running."""
+        with self._lock:
+            session.pins += 1
+            session.last_seen = time.monotonic()
+
+    def unpin(self, session: SessionData) -> None:
+        with self._lock:
+            session.pins = max(0, session.pins - 1)
+            session.last_seen = time.monotonic()
+
+    def discard(self, session_id: str) -> None:
+        """Forget a session and its spill file (e.g. after clearing history)."""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None:
+                session.state.clear()
+        try:
+            os.remove(self._spill_path(session_id))
+        except FileNotFoundError:
+            pass
+
+    # ------------------------------------------------------------------
+    # Eviction
+    # ------------------------------------------------------------------
+    def _spill_path(self, session_id: str) -> str:
+        # Hashed so raw session ids never appear on disk
+        return os.path.join(self.spill_dir, hashlib.sha256(session_id.encode()).hexdigest() + ".bin")
+
+    def _evict(self, session: SessionData) -> None:
+        """Write a session's state to its spill file and free it (lock held)."""
+        snapshot = {key: session.state[key] for key in SPILLED_KEYS if key in session.state}
+        agent = session.state.get("agent")
+        if agent is not None:
+            snapshot["memory"] = dump_memory(agent)
+        elif "memory" in session.state:
+            snapshot["memory"] = session.state["memory"]
+        data = json.dumps(snapshot, default=str).encode()
+        # Spill files are binary, so skip the text encoding when available
+        encrypt = getattr(self.cipher_suite, "encrypt_binary", self.cipher_suite.encrypt)
+        token = encrypt(data)
+        path = self._spill_path(session.session_id)
+        with open(path + ".tmp", "wb") as f:
+            f.write(token)
+        os.replace(path + ".tmp", path)
+        # Cleared in place: the Streamlit session may still hold the dict
+        session.state.clear()
+        del self._sessions[session.session_id]
+        self.evictions += 1
+
+    def _rehydrate(self, session: SessionData) -> None:
+        """Load a spilled session back into ``session.state`` (lock held)."""
+        path = self._spill_path(session.session_id)
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, "rb") as f:
+                snapshot = json.loads(self.cipher_suite.decrypt(f.read()))
+            # The agent is rebuilt on first use and picks up "memory"
+            session.state.update(snapshot)
+            self.rehydrations += 1
+            logger.info(f"Rehydrated session {session.session_id[:8]} ({session.message_count()} messages)")
+        except Exception as e:
+            logger.warning(f"Could not rehydrate session {session.session_id[:8]}: {str(e)}")
+        finally:
+            os.remove(path)
+
+    def sweep(self) -> int:
+        """Evict idle sessions, then LRU sessions until within the caps.
+
+        Returns:
+            int: Number of sessions evicted
+        """
+        now = time.monotonic()
+        evicted = 0
+        with self._lock:
+            candidates = sorted(
+                (s for s in self._sessions.values() if not s.pins),
+                key=lambda s: s.last_seen,
+            )
+            sizes = {s.session_id: s.size() for s in self._sessions.values()} if self.max_bytes else {}
+            total_bytes = sum(sizes.values())
+            for session in candidates:
+                idle = now - session.last_seen >= self.idle_timeout
+                over_count = len(self._sessions) > self.max_sessions
+                over_bytes = self.max_bytes is not None and total_bytes > self.max_bytes
+                if not (idle or over_count or over_bytes):
+                    break
+                try:
+                    self._evict(session)
+                    total_bytes -= sizes.get(session.session_id, 0)
+                    evicted += 1
+                except Exception as e:
+                    logger.error(f"Failed to evict session {session.session_id[:8]}: {str(e)}")
+        if evicted:
+            logger.info(f"Evicted {evicted} sessions, {len(self._sessions)} live")
+        self._expire_spill_files()
+        return evicted
+
+    def _expire_spill_files(self) -> None:
+        """Delete spill files of sessions that never came back."""
+        cutoff = time.time() - self.spill_ttl
+        for name in os.listdir(self.spill_dir):
+            path = os.path.join(self.spill_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+    def report(self, top: int = 10) -> Dict[str, Any]:
+        """Totals and the largest live sessions by retained bytes."""
+        now = time.monotonic()
+        with self._lock:
+            rows = [
+                {
+                    "session": s.session_id[:8],
+                    "bytes": s.size(),
+                    "messages": s.message_count(),
+                    "idle_seconds": round(now - s.last_seen, 1),
+                    "pinned": bool(s.pins),
+                }
+                for s in self._sessions.values()
+            ]
+        rows.sort(key=lambda row: row["bytes"], reverse=True)
+        return {
+            "live_sessions": len(rows),
+            "live_bytes": sum(row["bytes"] for row in rows),
+            "spilled_sessions": len(os.listdir(self.spill_dir)),
+            "evictions": self.evictions,
+            "rehydrations": self.rehydrations,
+            "largest": rows[:top],
+        }
+
+    # ------------------------------------------------------------------
+    # Background sweeping
+    # ------------------------------------------------------------------
+    def start(self) -> "SessionManager":
+        """Start the background sweep thread (idempotent)."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="session-sweeper", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Session sweep failed: {str(e)}")
@@ -0,0 +1,361 @@
+"""Application settings: one validated, immutable snapshot.
+
+Values come from ``db/config.json``, then ``.env``, then the process
+environment, each overriding the one before. ``get_settings()`` builds the
+snapshot once per process and is cheap enough to call per turn, so tunables
+are read where they are used rather than copied into long-lived objects.
+
+``SettingsWatcher`` polls both files and swaps in a new snapshot when they
+change:
+
+- Tunables read per turn apply on the next turn. These include k,
+  temperature (on every chat model path, see stream_process_message),
+  flush intervals and deadlines.
+- Components that keep settings (reranker, group-commit batching)
+  register with ``on_reload`` and reconfigure in place.
+- Keys in RESTART_REQUIRED only apply to components built after the
+  change, and a warning is logged.
+- A file that fails to parse or validate is logged, and the previous
+  snapshot stays active.
+
+Every knob the application reads has a typed field here, so a bad value
+fails validation instead of surfacing as an error deep in a request. The
+file values are also exported to ``os.environ``, but never over variables
+the process was started with, for libraries that read their own variables.
+"""
+import os
+import json
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Literal, Optional, Tuple
+
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr, ValidationError, field_validator
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENV_FILE = os.path.join(ROOT, ".env")
+CONFIG_FILE = os.path.join(ROOT, "db", "config.json")
+
+# Keys read once when a component is built (clients, stores, models, keys)
+RESTART_REQUIRED = (
+    "OLLAMA_HOST", "OLLAMA_HOSTS", "OLLAMA_MODEL", "OLLAMA_NATIVE_CHAT", "OLLAMA_KEEP_ALIVE",
+    "MODEL_BACKENDS", "TOKENIZER_NAME", "OLLAMA_HEALTH_TTL", "OLLAMA_HEALTH_INTERVAL",
+    "OLLAMA_HEALTH_TIMEOUT", "OLLAMA_CIRCUIT_FAILURES", "OLLAMA_CIRCUIT_RESET", "VECTOR_DB_PATH", "VECTOR_DB_SHARDING", "KNOWLEDGE_COLLECTION",
+    "CHROMA_BACKEND", "CHROMA_SERVER_HOST", "CHROMA_SERVER_PORT", "CHROMA_POOL_SIZE",
+    "ENCRYPTION_KEY", "RECORD_FORMAT", "RECORD_CODEC", "PIPELINE_WORKERS", "SESSION_SPILL_DIR",
+)
+
+
+class Settings(BaseModel):
+    """Validated configuration; each field is read from the variable in its alias.
+
+    Keys without a field are still available through ``get``.
+    """
+
+    model_config = ConfigDict(frozen=True, populate_by_name=True, extra="ignore")
+
+    # Model server
+    ollama_host: str = Field("http://localhost:11434", alias="OLLAMA_HOST")
+    ollama_model: str = Field("deepseek-r1:1.5b", alias="OLLAMA_MODEL")
+    temperature: float = Field(0.7, ge=0.0, le=2.0, alias="TEMPERATURE")
+    ollama_num_ctx: int = Field(2048, gt=0, alias="OLLAMA_NUM_CTX")
+    max_completion_tokens: int = Field(512, gt=0, alias="MAX_COMPLETION_TOKENS")
+    # Comma-separated hosts sessions are pinned to; unset uses OLLAMA_HOST
+    ollama_hosts: Optional[str] = Field(None, alias="OLLAMA_HOSTS")
+    ollama_native_chat: bool = Field(True, alias="OLLAMA_NATIVE_CHAT")
+    ollama_keep_alive: str = Field("30m", alias="OLLAMA_KEEP_ALIVE")
+    ollama_prefix_metrics: bool = Field(False, alias="OLLAMA_PREFIX_METRICS")
+    # Hugging Face repo of the tokenizer; unset looks up OLLAMA_MODEL
+    tokenizer_name: Optional[str] = Field(None, alias="TOKENIZER_NAME")
+    # OpenAI-compatible backends to route across (see src/router.py)
+    model_backends: Optional[List[Dict[str, Any]]] = Field(None, alias="MODEL_BACKENDS")
+
+    # Upstream health monitor and circuit breaker (see src/health.py)
+    ollama_health_ttl: float = Field(5, ge=0, alias="OLLAMA_HEALTH_TTL")
+    ollama_health_interval: float = Field(5, gt=0, alias="OLLAMA_HEALTH_INTERVAL")
+    ollama_health_timeout: float = Field(2, gt=0, alias="OLLAMA_HEALTH_TIMEOUT")
+    ollama_circuit_failures: int = Field(3, ge=1, alias="OLLAMA_CIRCUIT_FAILURES")
+    ollama_circuit_reset: float = Field(30, ge=0, alias="OLLAMA_CIRCUIT_RESET")
+
+    # Start-up warm-up (see src/warmup.py)
+    warmup_timeout: float = Field(300, ge=0, alias="WARMUP_TIMEOUT")
+    readiness_file: str = Field("/tmp/sec-convagent.ready", alias="READINESS_FILE")
+
+    # Storage
+    vector_db_path: str = Field("./vector_db", alias="VECTOR_DB_PATH")
+    knowledge_collection: str = Field("knowledge_base", alias="KNOWLEDGE_COLLECTION")
+    encryption_key: Optional[str] = Field(None, alias="ENCRYPTION_KEY", repr=False)
+    record_format: Literal["v1", "fernet"] = Field("v1", alias="RECORD_FORMAT")
+    # Unset: zstd when zstandard is installed, else zlib
+    record_codec: Optional[Literal["zstd", "zlib", "none"]] = Field(None, alias="RECORD_CODEC")
+    chroma_write_batch: int = Field(64, ge=1, alias="CHROMA_WRITE_BATCH")
+    chroma_write_delay_ms: float = Field(20, ge=0, alias="CHROMA_WRITE_DELAY_MS")
+    chroma_retries: int = Field(3, ge=1, alias="CHROMA_RETRIES")
+    # Unset: embedded on VECTOR_DB_PATH, or "http" when CHROMA_SERVER_HOST is set
+    chroma_backend: Optional[Literal["persistent", "http", "memory"]] = Field(None, alias="CHROMA_BACKEND")
+    chroma_server_host: Optional[str] = Field(None, alias="CHROMA_SERVER_HOST")
+    chroma_server_port: int = Field(8000, gt=0, le=65535, alias="CHROMA_SERVER_PORT")
+    chroma_server_ssl: bool = Field(False, alias="CHROMA_SERVER_SSL")
+    chroma_server_token: Optional[str] = Field(None, alias="CHROMA_SERVER_TOKEN", repr=False)
+    chroma_pool_size: int = Field(4, ge=1, alias="CHROMA_POOL_SIZE")
+
+    # Sharding (see db/sharding.py); unset keeps one unsharded collection
+    vector_db_sharding: Optional[Literal["tenant", "time", "tenant_time"]] = Field(None, alias="VECTOR_DB_SHARDING")
+    vector_db_shard_bucket: Literal["day", "week", "month"] = Field("month", alias="VECTOR_DB_SHARD_BUCKET")
+    vector_db_cold_path: Optional[str] = Field(None, alias="VECTOR_DB_COLD_PATH")
+    vector_db_max_open_shards: int = Field(16, ge=1, alias="VECTOR_DB_MAX_OPEN_SHARDS")
+    vector_db_shard_workers: int = Field(4, ge=1, alias="VECTOR_DB_SHARD_WORKERS")
+    # Shard tenant of sessions without a signed-in user (see app.get_tenant_id)
+    tenant_id: str = Field("default", min_length=1, alias="TENANT_ID")
+
+    # Retrieval
+    retrieval_k: int = Field(5, ge=1, alias="RETRIEVAL_K")
+    knowledge_k: int = Field(3, ge=0, alias="KNOWLEDGE_K")
+    rerank: bool = Field(False, alias="RERANK")
+    rerank_model: str = Field("cross-encoder/ms-marco-MiniLM-L-6-v2", alias="RERANK_MODEL")
+    rerank_fetch_k: int = Field(50, ge=1, alias="RERANK_FETCH_K")
+    rerank_batch_size: int = Field(16, ge=1, alias="RERANK_BATCH_SIZE")
+    rerank_cache_size: int = Field(10000, ge=1, alias="RERANK_CACHE_SIZE")
+    rerank_budget_ms: float = Field(300, ge=0, alias="RERANK_BUDGET_MS")
+
+    # Ingestion
+    ingest_chunk_chars: int = Field(1000, gt=0, alias="INGEST_CHUNK_CHARS")
+    ingest_chunk_overlap: int = Field(200, ge=0, alias="INGEST_CHUNK_OVERLAP")
+    ingest_batch_size: int = Field(64, ge=1, alias="INGEST_BATCH_SIZE")
+
+    # Sessions
+    session_max_active: int = Field(50, ge=1, alias="SESSION_MAX_ACTIVE")
+    session_max_mb: Optional[float] = Field(None, gt=0, alias="SESSION_MAX_MB")
+    session_idle_timeout: float = Field(900, gt=0, alias="SESSION_IDLE_TIMEOUT")
+    session_sweep_interval: float = Field(60, gt=0, alias="SESSION_SWEEP_INTERVAL")
+    session_spill_dir: str = Field("./session_store", alias="SESSION_SPILL_DIR")
+
+    # Chat turn and UI
+    pipeline_workers: int = Field(4, ge=1, alias="PIPELINE_WORKERS")
+    stream_flush_ms: float = Field(50, ge=0, alias="STREAM_FLUSH_MS")
+    stream_flush_chunks: int = Field(64, ge=1, alias="STREAM_FLUSH_CHUNKS")
+    generation_deadline: float = Field(120, gt=0, alias="GENERATION_DEADLINE")
+    reasoning_display: Literal["collapsed", "hidden"] = Field("collapsed", alias="REASONING_DISPLAY")
+    session_report: bool = Field(False, alias="SESSION_REPORT")
+    settings_reload_interval: float = Field(2.0, ge=0, alias="SETTINGS_RELOAD_INTERVAL")
+
+    # Rerun profiling (see utils/profiling.py)
+    profile_reruns: Optional[Literal["sample", "cprofile"]] = Field(None, alias="PROFILE_RERUNS")
+    profile_query: bool = Field(False, alias="PROFILE_QUERY")
+    profile_token: Optional[str] = Field(None, alias="PROFILE_TOKEN", repr=False)
+    profile_dir: str = Field("./profiles", alias="PROFILE_DIR")
+    profile_sample_ms: float = Field(5, gt=0, alias="PROFILE_SAMPLE_MS")
+    profile_keep: int = Field(500, ge=1, alias="PROFILE_KEEP")
+
+    _values: Dict[str, str] = PrivateAttr(default_factory=dict)
+
+    @field_validator("ollama_host")
+    @classmethod
+    def _native_root(cls, value: str) -> str:
+        # Accept the native root or the OpenAI-compatible ".../v1" URL. The
+        # suffix is removed as a path segment, not with rstrip('/v1'), which
+        # strips characters and mangles hosts such as "http://gpu1:11431"
+        value = value.strip().rstrip("/")
+        return value[:-len("/v1")] if value.endswith("/v1") else value
+
+    @field_validator("model_backends", mode="before")
+    @classmethod
+    def _parse_backends(cls, value):
+        # Files and the environment hold the list as JSON text
+        return json.loads(value) if isinstance(value, str) else value
+
+    @property
+    def openai_base_url(self) -> str:
+        """OpenAI-compatible endpoint of OLLAMA_HOST."""
+        return f"{self.ollama_host}/v1"
+
+    @property
+    def session_max_bytes(self) -> Optional[int]:
+        return int(self.session_max_mb * 1024 * 1024) if self.session_max_mb else None
+
+    @property
+    def rerank_budget(self) -> Optional[float]:
+        """Reranking budget in seconds, None when RERANK_BUDGET_MS is 0."""
+        return self.rerank_budget_ms / 1000 if self.rerank_budget_ms > 0 else None
+
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        """Raw value of any key, including those without a typed field."""
+        value = self._values.get(key)
+        return value if value not in (None, "") else default
+
+    def changed(self, other: "Settings") -> List[str]:
+        """Keys whose value differs between two snapshots."""
+        keys = set(self._values) | set(other._values)
+        return sorted(key for key in keys if self._values.get(key) != other._values.get(key))
+
+
+# Values this module wrote to os.environ, to tell them from the real environment
+_exported: Dict[str, str] = {}
+
+
+def _process_env() -> Dict[str, str]:
+    return {key: value for key, value in os.environ.items() if _exported.get(key) != value}
+
+
+def read_files(env_file: Optional[str] = None, config_file: Optional[str] = None) -> Dict[str, str]:
+    """Values of db/config.json overridden by .env, as strings."""
+    from dotenv import dotenv_values
+
+    env_file = env_file or ENV_FILE
+    config_file = config_file or CONFIG_FILE
+    values: Dict[str, str] = {}
+    if os.path.exists(config_file):
+        with open(config_file) as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError(f"{config_file} must contain a JSON object")
+        for key, value in data.items():
+            if value is not None:
+                values[key] = json.dumps(value) if isinstance(value, (dict, list)) else str(value)
+    if os.path.exists(env_file):
+        values.update({key: value for key, value in dotenv_values(env_file).items() if value is not None})
+    return values
+
+
+def load_settings(env_file: Optional[str] = None, config_file: Optional[str] = None) -> Tuple[Settings, Dict[str, str]]:
+    """Build a validated snapshot without installing it.
+
+    Returns:
+        tuple: The settings and the file values to export to os.environ
+
+    Raises:
+        ValidationError: If a value has the wrong type or is out of range
+        ValueError: If db/config.json is not a JSON object
+    """
+    files = read_files(env_file, config_file)
+    values = {**files, **_process_env()}
+    # Empty assignments ("KEY=") mean unset, as with os.getenv(KEY) or default
+    settings = Settings.model_validate({key: value for key, value in values.items() if value != ""})
+    settings._values = values
+    return settings, files
+
+
+def _export(files: Dict[str, str]) -> None:
+    global _exported
+    process_env = _process_env()
+    for key, value in _exported.items():
+        if key not in files and os.environ.get(key) == value:
+            del os.environ[key]
+    exported = {}
+    for key, value in files.items():
+        if key not in process_env:
+            os.environ[key] = value
+            exported[key] = value
+    _exported = exported
+
+
+_settings: Optional[Settings] = None
+_settings_lock = threading.Lock()
+_listeners: List[Callable[[Settings, Settings, List[str]], None]] = []
+
+
+def get_settings() -> Settings:
+    """The current settings snapshot, loaded on first use."""
+    global _settings
+    if _settings is None:
+        with _settings_lock:
+            if _settings is None:
+                settings, files = load_settings()
+                _export(files)
+                _settings = settings
+    return _settings
+
+
+def on_reload(callback: Callable[[Settings, Settings, List[str]], None]) -> Callable:
+    """Call ``callback(old, new, changed_keys)`` after each reload that changed something."""
+    _listeners.append(callback)
+    return callback
+
+
+def reload_settings() -> Settings:
+    """Re-read the files and install the new snapshot if it is valid.
+
+    Returns:
+        Settings: The active snapshot (the previous one if loading failed)
+    """
+    global _settings
+    old = get_settings()
+    try:
+        new, files = load_settings()
+    except (ValidationError, ValueError) as e:
+        logger.error(f"Invalid settings, keeping the previous configuration: {str(e)}")
+        return old
+    changed = old.changed(new)
+    if not changed:
+        return old
+    with _settings_lock:
+        _export(files)
+        _settings = new
+    # Values are not logged: the files hold keys and secrets
+    logger.info(f"Settings reloaded, changed: {', '.join(changed)}")
+    restart = [key for key in changed if key in RESTART_REQUIRED]
+    if restart:
+        logger.warning(f"{', '.join(restart)} changed; only components built from now on use the new value")
+    for callback in list(_listeners):
+        try:
+            callback(old, new, changed)
+        except Exception as e:
+            logger.error(f"Settings reload hook {getattr(callback, '__name__', callback)} failed: {str(e)}")
+    return new
+
+
+class SettingsWatcher:
+    """Reloads the settings when .env or db/config.json changes.
+
+    Polls the files' modification time and size every ``interval`` seconds;
+    an interval of 0 disables watching.
+    """
+
+    def __init__(self, paths: Optional[Tuple[str, ...]] = None, interval: float = 2.0):
+        self.paths = paths or (ENV_FILE, CONFIG_FILE)
+        self.interval = interval
+        self._signature = self._stat()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_env(cls) -> "SettingsWatcher":
+        return cls(interval=get_settings().settings_reload_interval)
+
+    def _stat(self) -> Tuple:
+        signature = []
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def check(self) -> bool:
+        """Reload if a watched file changed; returns True when it did."""
+        signature = self._stat()
+        if signature == self._signature:
+            return False
+        self._signature = signature
+        reload_settings()
+        return True
+
+    def start(self) -> "SettingsWatcher":
+        """Start the polling thread (idempotent, no-op when interval is 0)."""
+        if self.interval > 0 and (self._thread is None or not self._thread.is_alive()):
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="settings-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Settings watcher failed: {str(e)}")
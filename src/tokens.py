@@ -0,0 +1,208 @@
+import time
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from src.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Ollama model tags -> Hugging Face tokenizer repos
+TOKENIZER_REPOS = {
+    "deepseek-r1:1.5b": "deepseek-ai/DeepSeek-R1-Distill-Qwen-1.5B",
+    "deepseek-r1:7b": "deepseek-ai/DeepSeek-R1-Distill-Qwen-7B",
+    "deepseek-r1:8b": "deepseek-ai/DeepSeek-R1-Distill-Llama-8B",
+}
+
+# Rough fallback when no tokenizer can be loaded
+CHARS_PER_TOKEN = 4
+# Per-message overhead of role markers in chat templates
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class Tokenizer:
+    """Counts tokens with a Hugging Face tokenizer, or a char heuristic."""
+
+    def __init__(self, name: Optional[str] = None, backend=None):
+        self.name = name or "heuristic"
+        self.backend = backend
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.backend is not None:
+            return len(self.backend.encode(text, add_special_tokens=False))
+        return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+
+_tokenizers: Dict[str, Tokenizer] = {}
+_tokenizers_lock = threading.Lock()
+
+
+def load_tokenizer(model: str) -> Tokenizer:
+    """Load the tokenizer for a model from the local Hugging Face cache.
+
+    TOKENIZER_NAME overrides the repo lookup. Nothing is downloaded, so an
+    offline deployment never reaches out to the Hub; fetch the repo once
+    with ``huggingface-cli download <repo>``. Without ``transformers`` (it
+    ships with sentence-transformers) or a cached copy, counts fall back to
+    a characters-per-token estimate.
+    """
+    repo = get_settings().tokenizer_name or TOKENIZER_REPOS.get(model)
+    if repo:
+        try:
+            from transformers import AutoTokenizer
+
+            return Tokenizer(repo, AutoTokenizer.from_pretrained(repo, local_files_only=True))
+        except Exception as e:
+            logger.warning(f"Tokenizer {repo} unavailable, estimating token counts: {str(e)}")
+    return Tokenizer()
+
+
+def get_tokenizer(model: str) -> Tokenizer:
+    """Return the tokenizer for a model, loading it on first use."""
+    with _tokenizers_lock:
+        tokenizer = _tokenizers.get(model)
+        if tokenizer is None:
+            tokenizer = _tokenizers[model] = load_tokenizer(model)
+        return tokenizer
+
+
+def preload_tokenizer(model: str) -> threading.Thread:
+    """Load a model's tokenizer in the background at start-up.
+
+    A turn that needs it before the load has finished waits for it instead
+    of loading it again.
+    """
+    thread = threading.Thread(target=get_tokenizer, args=(model,), name="tokenizer-load", daemon=True)
+    thread.start()
+    return thread
+
+
+def count_message_tokens(messages, tokenizer: Tokenizer) -> int:
+    """Count tokens of a list of chat messages (or a plain string)."""
+    if isinstance(messages, str):
+        return tokenizer.count(messages)
+    return sum(tokenizer.count(getattr(m, "content", str(m))) + MESSAGE_OVERHEAD_TOKENS for m in messages or [])
+
+
+def get_context_budget() -> int:
+    """Prompt token budget: context window minus reserved completion tokens."""
+    settings = get_settings()
+    return max(0, settings.ollama_num_ctx - settings.max_completion_tokens)
+
+
+def fit_history(
+    history,
+    fixed_tokens: int,
+    tokenizer: Tokenizer,
+    budget: Optional[int] = None,
+):
+    """Trim the oldest history so the whole prompt fits the context budget.
+
+    Args:
+        history: Memory messages (list) or a buffer string
+        fixed_tokens: Tokens of everything else in the prompt (template + input)
+        tokenizer: Tokenizer to count with
+        budget: Prompt token budget, defaults to get_context_budget()
+
+    Returns:
+        The history that fits, of the same type as ``history``
+    """
+    budget = get_context_budget() if budget is None else budget
+    available = budget - fixed_tokens
+    if available < 0:
+        # The template and input alone overflow; send them without history
+        # and let the server truncate rather than fail the turn
+        logger.warning(f"Prompt without history needs {fixed_tokens} tokens, over the {budget} token budget")
+        available = 0
+    if isinstance(history, str):
+        if tokenizer.count(history) <= available:
+            return history
+        # Keep the tail of the buffer
+        keep = available * CHARS_PER_TOKEN
+        return history[-keep:] if keep else ""
+
+    messages = list(history or [])
+    counts = [count_message_tokens([m], tokenizer) for m in messages]
+    total = sum(counts)
+    start = 0
+    while start < len(messages) and total > available:
+        total -= counts[start]
+        start += 1
+    if start == 0:
+        return messages
+    logger.info(f"Trimmed {start} history messages to fit {budget} prompt tokens")
+    return messages[start:]
+
+
+@dataclass
+class TurnStats:
+    """Token and timing accounting of one turn."""
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    trimmed_messages: int = 0
+    cached_prompt_tokens: int = 0
+    prefill_seconds_saved: float = 0.0
+    started: float = 0.0
+    first_token: float = 0.0
+    finished: float = 0.0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def prefill_seconds(self) -> float:
+        return max(0.0, self.first_token - self.started) if self.first_token else 0.0
+
+    @property
+    def decode_seconds(self) -> float:
+        return max(0.0, self.finished - self.first_token) if self.first_token else 0.0
+
+    @property
+    def prefill_tokens_per_second(self) -> float:
+        return self.prompt_tokens / self.prefill_seconds if self.prefill_seconds else 0.0
+
+    @property
+    def decode_tokens_per_second(self) -> float:
+        # The first token is produced by the prefill step
+        decoded = max(0, self.completion_tokens - 1)
+        return decoded / self.decode_seconds if self.decode_seconds else 0.0
+
+    def start(self) -> None:
+        self.started = time.perf_counter()
+
+    def mark_token(self) -> None:
+        if not self.first_token:
+            self.first_token = time.perf_counter()
+
+    def finish(self) -> None:
+        self.finished = time.perf_counter()
+
+    def record_server_metrics(self, metrics: Optional[dict]) -> None:
+        """Estimate prefix-cache reuse from the server's evaluated prompt tokens.
+
+        Ollama only counts prompt tokens it actually evaluated, so the gap to
+        the full prompt size was served from its KV cache.
+        """
+        evaluated = (metrics or {}).get("prompt_eval_count")
+        if not evaluated:
+            return
+        self.cached_prompt_tokens = max(0, self.prompt_tokens - evaluated)
+        seconds_per_token = metrics.get("prompt_eval_seconds", 0.0) / evaluated
+        self.prefill_seconds_saved = self.cached_prompt_tokens * seconds_per_token
+
+    def as_dict(self) -> dict:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "trimmed_messages": self.trimmed_messages,
+            "cached_prompt_tokens": self.cached_prompt_tokens,
+            "prefill_seconds_saved": round(self.prefill_seconds_saved, 3),
+            "prefill_seconds": round(self.prefill_seconds, 3),
+            "decode_seconds": round(self.decode_seconds, 3),
+            "prefill_tokens_per_second": round(self.prefill_tokens_per_second, 1),
+            "decode_tokens_per_second": round(self.decode_tokens_per_second, 1),
+        }
@@ -0,0 +1,130 @@
+"""Container start-up warm-up and readiness marker.
+
+Run next to Streamlit (see Dockerfile)::
+
+    python -m src.warmup & exec streamlit run app.py
+
+The warm-up waits for Ollama, then loads the chat model with a one-token
+generation pinned by ``keep_alive`` and writes the readiness file the
+orchestrator gates traffic on. Only state that lives in Ollama outlasts this
+process: the Chroma index and the cross-encoder are loaded by the app process
+itself, which caches them (``get_vector_store``, ``get_reranker``). Streamlit
+starts whether or not the warm-up succeeds, so the app can serve in degraded
+mode while the health check reports it not ready.
+"""
+import os
+import sys
+import time
+import logging
+from typing import Dict, Optional
+
+from src.agent import get_chat_options
+from src.settings import get_settings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def get_readiness_file() -> str:
+    """Path of the readiness marker file."""
+    return get_settings().readiness_file
+
+
+def is_ready() -> bool:
+    """Return True once the warm-up has completed."""
+    return os.path.exists(get_readiness_file())
+
+
+def mark_ready(timings: Dict[str, float]) -> None:
+    """Write the readiness file with the warm-up timings."""
+    path = get_readiness_file()
+    with open(path, "w") as f:
+        for step, elapsed in timings.items():
+            f.write(f"{step}={elapsed:.3f}\n")
+    logger.info(f"Readiness file written to {path}")
+
+
+def clear_ready() -> None:
+    """Remove a stale readiness file left by a previous container run."""
+    try:
+        os.remove(get_readiness_file())
+    except FileNotFoundError:
+        pass
+
+
+def wait_for_ollama(base_url: str, timeout: float) -> None:
+    """Block until the Ollama server answers or ``timeout`` seconds pass."""
+    import requests
+
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            response = requests.get(f"{base_url}/api/tags", timeout=5)
+            if response.status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        if time.monotonic() >= deadline:
+            raise ConnectionError(f"Ollama at {base_url} did not come up within {timeout:.0f}s")
+        time.sleep(1)
+
+
+def warm_generation(base_url: str, model: str, keep_alive: str) -> None:
+    """Load the chat model with a one-token generation and pin it in memory."""
+    import requests
+
+    response = requests.post(
+        f"{base_url}/api/generate",
+        json={
+            "model": model,
+            "prompt": "ping",
+            "stream": False,
+            "keep_alive": keep_alive,
+            # Same options as chat requests so the model is not reloaded
+            "options": {**get_chat_options(get_settings().temperature), "num_predict": 1},
+        },
+        timeout=600,
+    )
+    response.raise_for_status()
+
+
+def warm_up(timeout: Optional[float] = None) -> Dict[str, float]:
+    """Run every warm-up step and return the time each one took.
+
+    Args:
+        timeout (float): Seconds to wait for Ollama, defaults to WARMUP_TIMEOUT
+
+    Returns:
+        dict: Elapsed seconds per warm-up step
+    """
+    settings = get_settings()
+    base_url = settings.ollama_host
+    model = settings.ollama_model
+    keep_alive = settings.ollama_keep_alive
+    timeout = timeout if timeout is not None else settings.warmup_timeout
+
+    timings = {}
+    steps = (
+        ("ollama_up", lambda: wait_for_ollama(base_url, timeout)),
+        ("generation", lambda: warm_generation(base_url, model, keep_alive)),
+    )
+    for name, step in steps:
+        start = time.perf_counter()
+        step()
+        timings[name] = time.perf_counter() - start
+        logger.info(f"Warm-up step '{name}' took {timings[name]:.2f}s")
+    return timings
+
+
+def main() -> int:
+    clear_ready()
+    try:
+        timings = warm_up()
+    except Exception as e:
+        logger.error(f"Warm-up failed: {str(e)}")
+        return 1
+    mark_ready(timings)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
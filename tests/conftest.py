@@ -0,0 +1,75 @@
+"""Performance regression suite.
+
+Runs offline against fake model, embedding and vector-store backends. The
+tests carry the ``perf`` marker and are deselected by default::
+
+    python -m pytest -m perf                        # compare with baselines.json
+    python -m pytest -m perf --perf-update          # record new baselines
+    python -m pytest -m perf --perf-report run.json # also save this run
+
+A test fails when its best time per call exceeds the baseline by more
+than PERF_MAX_SLOWDOWN (default 30%) or its peak memory by more than
+PERF_MAX_MEMORY_GROWTH (default 25%), after up to PERF_RETRIES (default
+2) re-measurements. Baselines are machine-specific:
+record them on the machine (or CI runner class) that checks them.
+"""
+import pytest
+
+from tests.perf import harness
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("perf")
+    group.addoption("--perf-update", action="store_true", help="Write the measured results to baselines.json")
+    group.addoption("--perf-report", default=None, help="Also save this run's results to the given JSON file")
+    group.addoption("--perf-baseline", default=harness.BASELINE_FILE, help="Baseline file to compare with")
+
+
+class PerfRecorder:
+    def __init__(self, config):
+        self.update = config.getoption("--perf-update")
+        self.report_path = config.getoption("--perf-report")
+        self.baseline_path = config.getoption("--perf-baseline")
+        self.baselines = harness.load_results(self.baseline_path)
+        self.results = {}
+        self.rows = []
+
+    def check(self, name: str, fn, iterations: int = 50, rounds: int = 7) -> dict:
+        """Measure ``fn`` and fail the test on a regression against its baseline."""
+        baseline = None if self.update else self.baselines.get(name)
+        result = harness.measure(fn, iterations=iterations, rounds=rounds)
+        row = harness.compare(name, result, baseline)
+        for _ in range(harness.retries()):
+            if not row["failures"]:
+                break
+            # A real regression persists across runs; scheduler noise doesn't
+            retry = harness.measure(fn, iterations=iterations, rounds=rounds)
+            result = {key: min(result[key], retry[key]) for key in result}
+            row = harness.compare(name, result, baseline)
+        self.results[name] = result
+        self.rows.append(row)
+        if row["failures"]:
+            pytest.fail(f"{name} regressed: " + "; ".join(row["failures"]), pytrace=False)
+        return result
+
+
+@pytest.fixture(scope="session")
+def perf(request):
+    recorder = PerfRecorder(request.config)
+    request.config._perf_recorder = recorder
+    return recorder
+
+
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    recorder = getattr(config, "_perf_recorder", None)
+    if recorder is None or not recorder.rows:
+        return
+    terminalreporter.section("performance")
+    terminalreporter.write_line(harness.format_report(recorder.rows))
+    if recorder.update:
+        results = {**recorder.baselines, **recorder.results}
+        harness.save_results(recorder.baseline_path, results)
+        terminalreporter.write_line(f"Baselines written to {recorder.baseline_path}")
+    if recorder.report_path:
+        harness.save_results(recorder.report_path, recorder.results)
+        terminalreporter.write_line(f"Results written to {recorder.report_path}")
@@ -0,0 +1,158 @@
+"""Offline stand-ins for the model, embedding and vector-store backends.
+
+They implement only the attributes the hot paths touch, do constant work
+per call and never hit the network, so the timings measure this repo's
+code rather than Ollama or Chroma.
+"""
+import hashlib
+from dataclasses import dataclass
+from typing import Dict, List
+
+from utils.stub_server import stub_embedding
+
+REPLY = "<think>The user wants a short answer.</think>Rotate the key and re-encrypt the stored records."
+
+
+class FakeEmbeddings:
+    def __init__(self, dim: int = 32):
+        self.dim = dim
+
+    def embed_query(self, text: str) -> List[float]:
+        return stub_embedding(text, self.dim)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [stub_embedding(text, self.dim) for text in texts]
+
+
+@dataclass
+class FakeDocument:
+    page_content: str
+
+
+class FakeCollection:
+    def __init__(self):
+        self.records: Dict[str, str] = {}
+        self.metadatas: Dict[str, dict] = {}
+
+    def upsert(self, ids, embeddings=None, metadatas=None, documents=None):
+        self.records.update(zip(ids, documents or [None] * len(ids)))
+        self.metadatas.update(zip(ids, metadatas or [None] * len(ids)))
+
+
+class FakeVectorStore:
+    """Keeps the newest ``capacity`` texts; search returns the first ``k``."""
+
+    def __init__(self, documents: List[str] = (), capacity: int = 256):
+        self.documents = list(documents)
+        self.metadatas = [{} for _ in self.documents]
+        self.capacity = capacity
+        self._collection = FakeCollection()
+
+    def add_texts(self, texts, embeddings=None, metadatas=None):
+        self.documents.extend(texts)
+        self.metadatas.extend(metadatas or [{} for _ in texts])
+        del self.documents[:-self.capacity]
+        del self.metadatas[:-self.capacity]
+        return [hashlib.sha256(text.encode()).hexdigest()[:16] for text in texts]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, filter=None):
+        matches = (
+            text for text, metadata in zip(self.documents, self.metadatas)
+            if not filter or all(metadata.get(key) == value for key, value in filter.items())
+        )
+        return [FakeDocument(text) for _, text in zip(range(k), matches)]
+
+
+@dataclass
+class FakeMessage:
+    type: str
+    content: str
+
+
+class FakeChatMemory:
+    def __init__(self):
+        self.messages: List[FakeMessage] = []
+
+
+class FakeMemory:
+    memory_key = "history"
+
+    def __init__(self, max_messages: int = 20):
+        self.chat_memory = FakeChatMemory()
+        self.max_messages = max_messages
+
+    def load_memory_variables(self, inputs) -> Dict[str, str]:
+        return {self.memory_key: "\n".join(f"{m.type}: {m.content}" for m in self.chat_memory.messages)}
+
+    def save_context(self, inputs, outputs) -> None:
+        messages = self.chat_memory.messages
+        messages.append(FakeMessage("human", inputs["input"]))
+        messages.append(FakeMessage("ai", outputs["response"]))
+        del messages[:-self.max_messages]
+
+
+class FakePromptValue:
+    def __init__(self, text: str):
+        self.text = text
+
+    def to_string(self) -> str:
+        return self.text
+
+
+class FakePrompt:
+    template = "System: {system}\n\nCurrent conversation:\n{history}\nHuman: {input}\nAssistant:"
+    input_variables = ["history", "input"]
+
+    def format_prompt(self, **kwargs) -> FakePromptValue:
+        return FakePromptValue(self.template.format(system="You are a helpful AI assistant.", **kwargs))
+
+
+class FakeLLM:
+    """Streams ``reply`` in fixed-size chunks, like a token stream."""
+
+    supports_chat_messages = False
+    last_metrics = None
+
+    def __init__(self, reply: str = REPLY, chunk_size: int = 4):
+        self.reply = reply
+        self.chunk_size = chunk_size
+
+    def stream(self, prompt, **kwargs):
+        for i in range(0, len(self.reply), self.chunk_size):
+            yield self.reply[i:i + self.chunk_size]
+
+
+class FakeAgent:
+    """Just enough of a ConversationChain for process_message and stream_process_message."""
+
+    def __init__(self, llm: FakeLLM = None):
+        self.llm = llm or FakeLLM()
+        self.memory = FakeMemory()
+        self.prompt = FakePrompt()
+
+    def prep_inputs(self, inputs) -> Dict[str, str]:
+        return {**inputs, **self.memory.load_memory_variables(inputs)}
+
+    def predict(self, input: str) -> str:
+        response = self.llm.reply
+        self.memory.save_context({"input": input}, {"response": response})
+        return response
+
+
+class FakePlaceholder:
+    def __init__(self):
+        self.renders = 0
+
+    def write(self, text: str) -> None:
+        self.renders += 1
+
+    markdown = write
+
+
+def chat_history(turns: int = 50) -> List[Dict[str, str]]:
+    """A chat history of ``turns`` user/assistant pairs."""
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"How do I rotate encryption key number {i}?", "timestamp": f"2024-01-01T00:{i % 60:02d}:00"})
+        history.append({"role": "assistant", "content": "Generate a new key, re-encrypt the stored records and revoke the old key. " * 3, "timestamp": f"2024-01-01T00:{i % 60:02d}:30"})
+    return history
@@ -0,0 +1,155 @@
+"""Timing/memory measurement and baseline comparison for the perf suite.
+
+Results are stored as JSON::
+
+    {"meta": {...}, "results": {"<test>": {"seconds_per_call": ..., "peak_kib": ...}}}
+
+Compare two result files (e.g. from ``--perf-report``) with::
+
+    python -m tests.perf.harness old.json new.json
+"""
+import os
+import sys
+import json
+import time
+import platform
+import statistics
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "baselines.json")
+
+
+def max_slowdown() -> float:
+    """Allowed relative slowdown before a test fails (PERF_MAX_SLOWDOWN, default 0.3)."""
+    return float(os.getenv("PERF_MAX_SLOWDOWN", "0.3"))
+
+
+def max_memory_growth() -> float:
+    """Allowed relative peak-memory growth (PERF_MAX_MEMORY_GROWTH, default 0.25)."""
+    return float(os.getenv("PERF_MAX_MEMORY_GROWTH", "0.25"))
+
+
+def retries() -> int:
+    """Re-measurements of a regressed test before it fails (PERF_RETRIES, default 2)."""
+    return int(os.getenv("PERF_RETRIES", "2"))
+
+
+# Rounds are lengthened to at least this long so scheduler noise averages out
+MIN_ROUND_SECONDS = float(os.getenv("PERF_MIN_ROUND_SECONDS", "0.05"))
+
+# Absolute slack so sub-microsecond noise and small allocator jitter on very
+# cheap calls never fail a run
+MIN_TIME_SLACK = 2e-6
+MIN_MEMORY_SLACK_KIB = 16.0
+
+
+def measure(fn: Callable[[], object], iterations: int = 50, rounds: int = 7, warmup: int = 3) -> Dict[str, float]:
+    """Per-call wall time and peak traced memory of ``fn``.
+
+    ``seconds_per_call`` is the best of ``rounds`` (as timeit recommends:
+    slower rounds measure other load on the machine, not the code), the
+    median is kept for the report. ``iterations`` is a lower bound: it is
+    doubled until one round takes MIN_ROUND_SECONDS.
+    """
+    for _ in range(warmup):
+        fn()
+    while True:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        if time.perf_counter() - start >= MIN_ROUND_SECONDS:
+            break
+        iterations *= 2
+    per_call = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        per_call.append((time.perf_counter() - start) / iterations)
+    tracemalloc.start()
+    try:
+        for _ in range(iterations):
+            fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "seconds_per_call": min(per_call),
+        "median_seconds_per_call": statistics.median(per_call),
+        "peak_kib": round(peak / 1024, 1),
+        "iterations": iterations,
+    }
+
+
+def compare(name: str, current: Dict[str, float], baseline: Optional[Dict[str, float]]) -> Dict[str, object]:
+    """Compare one result with its baseline.
+
+    Returns:
+        dict: Relative time/memory change and a list of threshold violations
+    """
+    row = {"name": name, "current": current, "baseline": baseline, "time_change": None, "memory_change": None, "failures": []}
+    if not baseline:
+        return row
+    base_time, base_peak = baseline["seconds_per_call"], baseline["peak_kib"]
+    row["time_change"] = current["seconds_per_call"] / base_time - 1 if base_time else 0.0
+    row["memory_change"] = current["peak_kib"] / base_peak - 1 if base_peak else 0.0
+    if current["seconds_per_call"] > base_time * (1 + max_slowdown()) + MIN_TIME_SLACK:
+        row["failures"].append(f"{row['time_change']:+.0%} time (limit {max_slowdown():+.0%})")
+    if current["peak_kib"] > base_peak * (1 + max_memory_growth()) + MIN_MEMORY_SLACK_KIB:
+        row["failures"].append(f"{row['memory_change']:+.0%} peak memory (limit {max_memory_growth():+.0%})")
+    return row
+
+
+def load_results(path: str) -> Dict[str, Dict[str, float]]:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f).get("results", {})
+
+
+def save_results(path: str, results: Dict[str, Dict[str, float]]) -> None:
+    payload = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "updated": datetime.now().isoformat(timespec="seconds"),
+        },
+        "results": dict(sorted(results.items())),
+    }
+    with open(path, "w") as f:
+        json.dump(payload, f, indent=2)
+        f.write("\n")
+
+
+def format_report(rows: List[Dict[str, object]]) -> str:
+    """Table of current vs baseline per test."""
+    lines = [f"{'test':<40} {'baseline':>11} {'current':>11} {'time':>7} {'peak KiB':>9} {'mem':>7}  status"]
+    for row in sorted(rows, key=lambda r: r["name"]):
+        current, baseline = row["current"], row["baseline"]
+        base = f"{baseline['seconds_per_call'] * 1e6:9.1f}us" if baseline else "       new"
+        time_change = f"{row['time_change']:+6.0%}" if row["time_change"] is not None else "      "
+        memory_change = f"{row['memory_change']:+6.0%}" if row["memory_change"] is not None else "      "
+        status = "FAIL " + "; ".join(row["failures"]) if row["failures"] else "ok"
+        lines.append(
+            f"{row['name']:<40} {base:>11} {current['seconds_per_call'] * 1e6:9.1f}us "
+            f"{time_change:>7} {current['peak_kib']:9.1f} {memory_change:>7}  {status}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2:
+        print("usage: python -m tests.perf.harness OLD.json NEW.json")
+        return 2
+    old, new = load_results(argv[0]), load_results(argv[1])
+    rows = [compare(name, result, old.get(name)) for name, result in new.items()]
+    print(format_report(rows))
+    return 1 if any(row["failures"] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+"""Performance regression tests for the per-turn hot paths."""
+import logging
+
+import pytest
+
+from tests.perf import fakes
+
+pytestmark = pytest.mark.perf
+
+MESSAGE = "How should I rotate the encryption key of the vector store without downtime?"
+
+
+@pytest.fixture(autouse=True)
+def quiet_logging():
+    # The hot paths log at INFO; pytest's log capture would keep every record
+    # and turn the memory measurements into a measure of the log buffer
+    logging.disable(logging.INFO)
+    yield
+    logging.disable(logging.NOTSET)
+
+
+@pytest.fixture(scope="module")
+def key():
+    from cryptography.fernet import Fernet
+
+    return Fernet.generate_key()
+
+
+@pytest.fixture(scope="module")
+def fernet(key):
+    from cryptography.fernet import Fernet
+
+    return Fernet(key)
+
+
+@pytest.fixture(scope="module")
+def record_cipher(key):
+    from src.records import RecordCipher
+
+    return RecordCipher(key)
+
+
+@pytest.fixture
+def heuristic_tokenizer(monkeypatch):
+    """Never download a Hugging Face tokenizer during the run."""
+    from src import agent
+    from src.tokens import Tokenizer
+
+    monkeypatch.setattr(agent, "get_tokenizer", lambda model: Tokenizer())
+
+
+# ----------------------------------------------------------------------
+# Encryption helpers
+# ----------------------------------------------------------------------
+def test_encrypt_message(perf, key):
+    from src.encypt import encrypt_message
+
+    perf.check("encrypt_message", lambda: encrypt_message(MESSAGE, key), iterations=500)
+
+
+def test_decrypt_message(perf, key):
+    from src.encypt import encrypt_message
+    from src.decypt import decrypt_message
+
+    token = encrypt_message(MESSAGE, key)
+    assert decrypt_message(token, key) == MESSAGE
+    perf.check("decrypt_message", lambda: decrypt_message(token, key), iterations=500)
+
+
+def test_encrypt_record(perf, key):
+    from src.encypt import encrypt_record
+
+    perf.check("encrypt_record", lambda: encrypt_record(MESSAGE, key), iterations=500)
+
+
+def test_decrypt_message_record(perf, key):
+    from src.encypt import encrypt_record
+    from src.decypt import decrypt_message
+
+    record = encrypt_record(MESSAGE, key)
+    assert decrypt_message(record, key) == MESSAGE
+    perf.check("decrypt_message_record", lambda: decrypt_message(record, key), iterations=500)
+
+
+def test_record_cipher_round_trip(perf, record_cipher):
+    text = (MESSAGE + " ") * 50
+
+    def round_trip():
+        assert record_cipher.decrypt(record_cipher.encrypt(text.encode())).decode() == text
+
+    perf.check("record_cipher_round_trip", round_trip, iterations=500)
+
+
+# ----------------------------------------------------------------------
+# Agent
+# ----------------------------------------------------------------------
+def test_process_message(perf, fernet):
+    from src.agent import process_message
+
+    agent = fakes.FakeAgent()
+
+    def run():
+        response, encrypted = process_message(agent, MESSAGE, fernet)
+        assert response and encrypted
+        assert "<think>" not in agent.memory.chat_memory.messages[-1].content
+
+    perf.check("process_message", run, iterations=200)
+
+
+def test_stream_process_message(perf, heuristic_tokenizer):
+    from src.agent import ANSWER, stream_process_message
+    from utils.utils import StreamRenderer
+
+    agent = fakes.FakeAgent(fakes.FakeLLM(fakes.REPLY * 20))
+
+    def run():
+        renderer = StreamRenderer(fakes.FakePlaceholder(), interval=0.05, max_pending=64)
+        for kind, text in stream_process_message(agent, MESSAGE):
+            if kind == ANSWER:
+                renderer.add(text)
+        assert renderer.finalize()
+
+    perf.check("stream_process_message", run, iterations=50)
+
+
+def test_stream_renderer(perf):
+    from utils.utils import StreamRenderer
+
+    chunks = [f"token{i} " for i in range(2000)]
+
+    def run():
+        renderer = StreamRenderer(fakes.FakePlaceholder(), interval=0.05, max_pending=64)
+        for chunk in chunks:
+            renderer.add(chunk)
+        renderer.finalize()
+
+    perf.check("stream_renderer_2000_chunks", run, iterations=20)
+
+
+# ----------------------------------------------------------------------
+# Vector store
+# ----------------------------------------------------------------------
+def test_save_message_to_vectorstore(perf, fernet):
+    from db.model import save_message_to_vectorstore
+
+    vectorstore, embeddings = fakes.FakeVectorStore(), fakes.FakeEmbeddings()
+    perf.check(
+        "save_message_to_vectorstore",
+        lambda: save_message_to_vectorstore(vectorstore, embeddings, MESSAGE, fernet),
+        iterations=500,
+    )
+
+
+def test_save_messages_to_vectorstore(perf, fernet):
+    from db.model import save_messages_to_vectorstore
+
+    vectorstore, embeddings = fakes.FakeVectorStore(), fakes.FakeEmbeddings()
+    batch = [f"{MESSAGE} ({i})" for i in range(64)]
+    ids = [str(i) for i in range(64)]
+    perf.check(
+        "save_messages_to_vectorstore_64",
+        lambda: save_messages_to_vectorstore(vectorstore, embeddings, batch, fernet, ids=ids),
+        iterations=20,
+    )
+
+
+def test_retrieve_messages(perf, fernet):
+    from db.model import retrieve_messages
+
+    documents = [fernet.encrypt(f"{MESSAGE} ({i})".encode()).decode() for i in range(20)]
+    vectorstore, embeddings = fakes.FakeVectorStore(documents), fakes.FakeEmbeddings()
+    assert len(retrieve_messages(vectorstore, embeddings, MESSAGE, fernet, k=5)) == 5
+    perf.check(
+        "retrieve_messages_k5",
+        lambda: retrieve_messages(vectorstore, embeddings, MESSAGE, fernet, k=5),
+        iterations=200,
+    )
+
+
+# ----------------------------------------------------------------------
+# Chat UI
+# ----------------------------------------------------------------------
+@pytest.fixture
+def chat_ui(fernet):
+    st = pytest.importorskip("streamlit")
+    from utils.utils import ChatUI
+
+    ui = ChatUI()
+    ui.bind({"chat_history": fakes.chat_history(50)})
+    st.session_state["cipher_suite"] = fernet
+    yield ui
+    del st.session_state["cipher_suite"]
+
+
+def test_get_chat_stats(perf, chat_ui):
+    from utils.utils import ChatUI
+
+    messages = chat_ui.load_chat_history()
+    assert ChatUI.get_chat_stats(messages)["total_messages"] == 100
+    perf.check("get_chat_stats_100", lambda: ChatUI.get_chat_stats(messages), iterations=100)
+
+
+def test_export_chat_history(perf, chat_ui):
+    import json
+
+    assert len(json.loads(chat_ui.export_chat_history())) == 100
+    perf.check("export_chat_history_100", chat_ui.export_chat_history, iterations=20)
@@ -0,0 +1,206 @@
+"""Tests for streaming, cancellation and circuit breaking in src/agent.py and src/ollama_chat.py."""
+import pytest
+
+from src.agent import stream_process_message
+from src.cancellation import CancelToken
+from src.exceptions import GenerationCancelled
+from tests.perf import fakes
+
+
+class DroppedConnectionLLM(fakes.FakeLLM):
+    """Streams one chunk, then fails like a connection closed underneath it."""
+
+    supports_cancel_token = True
+
+    def __init__(self, cancel_first: bool):
+        super().__init__()
+        self.cancel_first = cancel_first
+
+    def stream(self, prompt, cancel_token=None, **kwargs):
+        yield "Hello"
+        if self.cancel_first:
+            cancel_token.cancel("user stopped")
+        raise ConnectionError("connection closed")
+
+
+def test_transport_error_after_cancel_becomes_generation_cancelled():
+    agent = fakes.FakeAgent(DroppedConnectionLLM(cancel_first=True))
+    token = CancelToken()
+    with pytest.raises(GenerationCancelled, match="user stopped"):
+        list(stream_process_message(agent, "hi", cancel_token=token))
+    assert agent.memory.chat_memory.messages == []
+
+
+def test_transport_error_without_cancel_propagates():
+    agent = fakes.FakeAgent(DroppedConnectionLLM(cancel_first=False))
+    with pytest.raises(ConnectionError):
+        list(stream_process_message(agent, "hi", cancel_token=CancelToken()))
+
+
+class FakeResponse:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def close(self):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+    def iter_lines(self):
+        yield b'{"message": {"content": "ok"}, "done": true}'
+
+
+def test_native_chat_bounds_header_wait_by_deadline(monkeypatch):
+    requests = pytest.importorskip("requests")
+    from langchain_core.messages import HumanMessage
+    from src.ollama_chat import OllamaChatModel
+
+    seen = {}
+
+    def fake_post(url, **kwargs):
+        seen["timeout"] = kwargs["timeout"]
+        return FakeResponse()
+
+    monkeypatch.setattr(requests, "post", fake_post)
+    model = OllamaChatModel(hosts=["http://stub"], model="m", temperature=0.0, timeout=300.0)
+    token = CancelToken(deadline=5.0)
+    try:
+        chunks = list(model._stream([HumanMessage(content="hi")], cancel_token=token))
+    finally:
+        token.finish()
+    assert "".join(c.text for c in chunks) == "ok"
+    connect, read = seen["timeout"]
+    assert connect == model.connect_timeout
+    assert 0 < read <= 5.0
+
+
+@pytest.fixture
+def monitor_factory():
+    from src.health import HealthMonitor
+
+    return lambda: HealthMonitor(probe=lambda: True, failure_threshold=1, reset_timeout=30.0)
+
+
+@pytest.fixture
+def native_model(monitor_factory, monkeypatch):
+    from src import ollama_chat
+
+    monitor = monitor_factory()
+    monkeypatch.setattr(ollama_chat, "get_ollama_monitor", lambda url: monitor)
+    model = ollama_chat.OllamaChatModel(hosts=["http://stub"], model="m", temperature=0.0, circuit_breaker=True)
+    return model, monitor
+
+
+def stub_post(monkeypatch, response=None, error=None):
+    requests = pytest.importorskip("requests")
+    calls = []
+
+    def fake_post(url, **kwargs):
+        calls.append(url)
+        if error is not None:
+            raise error
+        return response
+
+    monkeypatch.setattr(requests, "post", fake_post)
+    return calls
+
+
+def test_native_chat_records_failure_and_fails_fast(native_model, monkeypatch):
+    from langchain_core.messages import HumanMessage
+    from src.exceptions import UpstreamUnavailableError
+    from src.health import OPEN
+
+    model, monitor = native_model
+    calls = stub_post(monkeypatch, error=ConnectionError("refused"))
+    with pytest.raises(ConnectionError):
+        list(model._stream([HumanMessage(content="hi")]))
+    assert monitor.state == OPEN
+    with pytest.raises(UpstreamUnavailableError):
+        list(model._stream([HumanMessage(content="hi")]))
+    assert len(calls) == 1
+
+
+def test_native_chat_success_closes_half_open_circuit(native_model, monkeypatch):
+    from langchain_core.messages import HumanMessage
+    from src.health import CLOSED
+
+    model, monitor = native_model
+    monitor.record_failure()
+    monitor.opened_at -= monitor.reset_timeout + 1
+    stub_post(monkeypatch, response=FakeResponse())
+    assert "".join(c.text for c in model._stream([HumanMessage(content="hi")])) == "ok"
+    assert monitor.state == CLOSED
+
+
+def test_native_chat_cancel_releases_half_open_trial(native_model, monkeypatch):
+    from langchain_core.messages import HumanMessage
+    from src.health import OPEN
+
+    model, monitor = native_model
+    monitor.record_failure()
+    monitor.opened_at -= monitor.reset_timeout + 1
+    token = CancelToken()
+
+    def cancel_then_fail(url, **kwargs):
+        token.cancel("user stopped")
+        raise ConnectionError("closed")
+
+    requests = pytest.importorskip("requests")
+    monkeypatch.setattr(requests, "post", cancel_then_fail)
+    with pytest.raises(ConnectionError):
+        list(model._stream([HumanMessage(content="hi")], cancel_token=token))
+    assert monitor.state == OPEN and monitor.consecutive_failures == 1
+
+
+def test_native_chat_breaker_is_per_host(monitor_factory, monkeypatch):
+    from langchain_core.messages import HumanMessage
+    from src import ollama_chat
+    from src.health import CLOSED, OPEN
+
+    monitors = {}
+    monkeypatch.setattr(ollama_chat, "get_ollama_monitor", lambda url: monitors.setdefault(url, monitor_factory()))
+    requests = pytest.importorskip("requests")
+
+    def fake_post(url, **kwargs):
+        if url.startswith("http://down"):
+            raise ConnectionError("refused")
+        return FakeResponse()
+
+    monkeypatch.setattr(requests, "post", fake_post)
+    hosts = ["http://up", "http://down"]
+    sessions = {ollama_chat.pick_host(hosts, f"s{i}"): f"s{i}" for i in range(20)}
+    up = ollama_chat.OllamaChatModel(hosts=hosts, model="m", temperature=0.0, circuit_breaker=True, session_id=sessions["http://up"])
+    down = ollama_chat.OllamaChatModel(hosts=hosts, model="m", temperature=0.0, circuit_breaker=True, session_id=sessions["http://down"])
+
+    with pytest.raises(ConnectionError):
+        list(down._stream([HumanMessage(content="hi")]))
+    assert "".join(c.text for c in up._stream([HumanMessage(content="hi")])) == "ok"
+    assert monitors["http://down/v1"].state == OPEN
+    assert monitors["http://up/v1"].state == CLOSED
+
+
+def test_health_callback_gates_and_records(monitor_factory, monkeypatch):
+    from src import ollama_chat
+    from src.exceptions import UpstreamUnavailableError
+    from src.health import CLOSED, OPEN
+
+    monitor = monitor_factory()
+    monkeypatch.setattr(ollama_chat, "get_ollama_monitor", lambda url: monitor)
+    handler = ollama_chat.HealthCallbackHandler("http://stub/v1")
+    handler.on_chat_model_start({}, [])
+    handler.on_llm_error(ConnectionError("refused"))
+    assert monitor.state == OPEN
+    with pytest.raises(UpstreamUnavailableError):
+        handler.on_chat_model_start({}, [])
+    monitor.opened_at -= monitor.reset_timeout + 1
+    handler.on_chat_model_start({}, [])
+    handler.on_llm_error(GeneratorExit())
+    assert monitor.state == OPEN
+    monitor.opened_at -= monitor.reset_timeout + 1
+    handler.on_chat_model_start({}, [])
+    handler.on_llm_end(None)
+    assert monitor.state == CLOSED
@@ -0,0 +1,89 @@
+"""Tests for the batch question answering command (cli.py ask)."""
+import argparse
+import json
+
+import pytest
+
+pytest.importorskip("cryptography")
+
+from cryptography.fernet import Fernet
+
+import cli
+from db import model
+from src import agent as agent_module
+from tests.perf import fakes
+
+
+class FlakyLLM(fakes.FakeLLM):
+    """Fails on prompts containing "fail", answers everything else."""
+
+    def stream(self, prompt, **kwargs):
+        if "fail" in prompt.to_string():
+            raise ConnectionError("model server went away")
+        yield from super().stream(prompt, **kwargs)
+
+
+@pytest.fixture
+def ask(tmp_path, monkeypatch):
+    key_file = tmp_path / "key"
+    key_file.write_bytes(Fernet.generate_key())
+    monkeypatch.setattr(model, "init_chat_stores", lambda: (None, None, None))
+    monkeypatch.setattr(agent_module, "create_ollama_agent", lambda retriever, session_id=None: fakes.FakeAgent(FlakyLLM()))
+
+    def run(rows, save_to_store=False):
+        source = tmp_path / "prompts.jsonl"
+        source.write_text("".join(json.dumps(row) + "\n" for row in rows))
+        args = argparse.Namespace(
+            key_file=str(key_file), input=str(source), output=str(tmp_path / "answers.enc"),
+            checkpoint=None, workers=2, save_to_store=save_to_store,
+        )
+        return cli.cmd_ask(args), cli.Checkpoint(args.output + ".ckpt").done
+
+    def output():
+        cipher = cli.load_cipher(str(key_file))
+        lines = (tmp_path / "answers.enc").read_bytes().splitlines()
+        return [json.loads(cipher.decrypt(line)) for line in lines]
+
+    run.output = output
+
+    return run
+
+
+def test_ask_checkpoints_only_successful_conversations(ask):
+    code, done = ask([
+        {"id": "1", "conversation_id": "good", "content": "How do I rotate keys?"},
+        {"id": "2", "conversation_id": "bad", "content": "Hello"},
+        {"id": "3", "conversation_id": "bad", "content": "please fail"},
+    ])
+    assert code == 1
+    assert done == {"good", "good#0", "bad#0"}
+
+
+def test_ask_retry_writes_and_saves_each_answer_once(ask, monkeypatch):
+    store = fakes.FakeVectorStore()
+    monkeypatch.setattr(model, "init_chat_stores", lambda: (store, fakes.FakeEmbeddings(), None))
+    rows = [
+        {"id": "1", "conversation_id": "c", "content": "Hello"},
+        {"id": "2", "conversation_id": "c", "content": "please fail"},
+    ]
+    assert ask(rows, save_to_store=True)[0] == 1
+    assert ask(rows, save_to_store=True)[0] == 1
+    # The answered turn is written and stored once; the failed one per attempt
+    assert [(r["id"], r["ok"]) for r in ask.output()] == [("1", True), ("2", False), ("2", False)]
+    assert list(store._collection.records) == [cli.turn_store_id("c", 0)]
+
+
+def test_ask_answers_through_prepare_turn(ask, monkeypatch):
+    from src import pipeline
+
+    prepared = []
+    original = pipeline.prepare_turn
+
+    def spy(*args, **kwargs):
+        prepared.append(args[1])
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(pipeline, "prepare_turn", spy)
+    code, done = ask([{"id": "1", "conversation_id": "c", "content": "How do I rotate keys?"}])
+    assert code == 0 and done == {"c", "c#0"}
+    assert prepared == ["How do I rotate keys?"]
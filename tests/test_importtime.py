@@ -0,0 +1,25 @@
+"""Cold-start guard: heavy packages stay out of the app's import chain."""
+import pytest
+
+from utils.importtime import DEFERRED_PACKAGES, measure_imports, parse_importtime
+
+
+@pytest.mark.parametrize("module", ["src.agent", "db.model", "app"])
+def test_heavy_packages_are_not_imported_eagerly(module, tmp_path):
+    if module == "app":
+        pytest.importorskip("streamlit")
+    # Run elsewhere so files the app creates on import (app.log) stay out of the tree
+    timings = measure_imports(module, cwd=str(tmp_path))
+    eager = {timing.module.split(".")[0] for timing in timings} & set(DEFERRED_PACKAGES)
+    assert not eager, f"import {module} loads {sorted(eager)} eagerly"
+
+
+def test_parse_importtime():
+    output = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |   json.decoder\n"
+        "import time:        80 |        200 | json\n"
+        "some unrelated line\n"
+    )
+    timings = parse_importtime(output)
+    assert [(t.module, t.self_us, t.cumulative_us) for t in timings] == [("json.decoder", 120, 120), ("json", 80, 200)]
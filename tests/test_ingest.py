@@ -0,0 +1,121 @@
+"""Tests for document ingestion (db/ingest.py)."""
+import sys
+import types
+
+import pytest
+
+pytest.importorskip("cryptography")
+
+from cryptography.fernet import Fernet
+
+from db import ingest as ingest_module
+from db.ingest import Manifest, chunk_text, ingest, under_roots
+from tests.perf import fakes
+
+
+class RecordingCollection:
+    def __init__(self):
+        self.rows = {}
+        self.metadatas = {}
+
+    def upsert(self, ids, embeddings=None, metadatas=None, documents=None):
+        self.rows.update(dict(zip(ids, documents)))
+        self.metadatas.update(dict(zip(ids, metadatas)))
+
+    def delete(self, ids):
+        for row_id in ids:
+            self.rows.pop(row_id, None)
+
+
+class RecordingStore:
+    def __init__(self):
+        self._collection = RecordingCollection()
+
+
+def run_ingest(paths, store, manifest, **kwargs):
+    return ingest(
+        [str(path) for path in paths],
+        store,
+        fakes.FakeEmbeddings(),
+        Fernet(Fernet.generate_key()),
+        manifest,
+        chunk_size=200,
+        overlap=20,
+        workers=1,
+        **kwargs,
+    )
+
+
+@pytest.fixture(autouse=True)
+def thread_pool(monkeypatch):
+    # Forking a process pool from the multi-threaded test process can deadlock
+    from concurrent.futures import ThreadPoolExecutor
+
+    monkeypatch.setattr(ingest_module, "ProcessPoolExecutor", ThreadPoolExecutor)
+
+
+def test_prune_only_touches_the_roots_being_ingested(tmp_path):
+    first, second = tmp_path / "first", tmp_path / "second"
+    first.mkdir()
+    second.mkdir()
+    (first / "a.md").write_text("Rotate the key every quarter. " * 5)
+    (second / "b.md").write_text("Revoke the old key after re-encryption. " * 5)
+    store = RecordingStore()
+    manifest = Manifest(str(tmp_path / "manifest.json"))
+
+    run_ingest([first], store, manifest)
+    stats = run_ingest([second], store, manifest, prune=True)
+    assert stats["removed"] == 0
+    assert len(manifest.files) == 2
+
+    (first / "a.md").unlink()
+    stats = run_ingest([first], store, manifest, prune=True)
+    assert stats["removed"] == 1
+    assert list(manifest.files) == [str((second / "b.md").resolve())]
+    assert len(store._collection.rows) == manifest.files[str((second / "b.md").resolve())]["chunks"]
+
+
+def test_metadata_does_not_reveal_file_names(tmp_path):
+    (tmp_path / "incident-acme-breach.md").write_text("Rotate the key every quarter. " * 5)
+    store = RecordingStore()
+    run_ingest([tmp_path], store, Manifest(str(tmp_path / "manifest.json")))
+    metadatas = list(store._collection.metadatas.values())
+    assert metadatas and all("acme" not in str(metadata) for metadata in metadatas)
+    assert {metadata["chunk"] for metadata in metadatas} == set(range(len(metadatas)))
+
+
+def test_under_roots(tmp_path):
+    root = str(tmp_path / "docs")
+    assert under_roots(f"{root}/a.md", [root])
+    assert under_roots(f"{root}/a.md", [f"{root}/a.md"])
+    assert not under_roots(f"{root}-old/a.md", [root])
+
+
+def test_pdf_converter_is_built_once(monkeypatch):
+    built = []
+
+    class FakeConverter:
+        def __init__(self):
+            built.append(self)
+
+        def convert(self, path):
+            document = types.SimpleNamespace(export_to_markdown=lambda: f"# {path}")
+            return types.SimpleNamespace(document=document)
+
+    docling = types.ModuleType("docling")
+    converter_module = types.ModuleType("docling.document_converter")
+    converter_module.DocumentConverter = FakeConverter
+    monkeypatch.setitem(sys.modules, "docling", docling)
+    monkeypatch.setitem(sys.modules, "docling.document_converter", converter_module)
+    monkeypatch.setattr(ingest_module, "_pdf_converter", None)
+
+    assert ingest_module.parse_pdf("a.pdf") == "# a.pdf"
+    assert ingest_module.parse_pdf("b.pdf") == "# b.pdf"
+    assert len(built) == 1
+
+
+def test_chunks_respect_size_and_overlap():
+    text = "Sentence number one. " * 100
+    chunks = chunk_text(text, chunk_size=200, overlap=20)
+    assert all(len(chunk) <= 200 for chunk in chunks)
+    assert chunks[0].endswith(".")
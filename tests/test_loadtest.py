@@ -0,0 +1,71 @@
+"""Tests for trace replay (utils/loadtest.py)."""
+import json
+
+import pytest
+
+from utils.loadtest import HttpTarget, load_traces, percentiles, replay
+from utils.stub_server import StubServer
+
+
+def write_trace(tmp_path, rows):
+    path = tmp_path / "trace.jsonl"
+    path.write_text("".join((json.dumps(row) if not isinstance(row, str) else row) + "\n" for row in rows))
+    return str(path)
+
+
+def test_load_traces_groups_messages_into_conversations(tmp_path):
+    path = write_trace(tmp_path, [
+        {"conversation_id": "b", "content": "second user, first turn", "timestamp": 110.0},
+        {"conversation_id": "a", "content": "hello", "timestamp": 100.0},
+        "",
+        {"conversation_id": "a", "message": "and again", "timestamp": 104.5},
+        {"conversation_id": "a", "prompt": "explicit think time", "timestamp": 200.0, "think_time": 1.0},
+        {"conversation_id": "a", "no_text": True},
+    ])
+    conversations = load_traces(path)
+    assert [c["id"] for c in conversations] == ["a", "b"]
+    a, b = conversations
+    assert a["start"] == 0.0 and b["start"] == 10.0
+    assert [t["content"] for t in a["turns"]] == ["hello", "and again", "explicit think time"]
+    assert [t["think_time"] for t in a["turns"]] == [0.0, 4.5, 1.0]
+
+
+def test_load_traces_reads_whole_conversations_and_backlog_files(tmp_path):
+    path = write_trace(tmp_path, [
+        {"conversation_id": "late", "start": 5.0, "turns": [{"content": "hi", "think_time": 2.0}, {"content": "bye"}]},
+        {"request_id": "user-001", "title": "Speed up retrieval"},
+        {"request_id": "user-002", "body": "Cache embeddings"},
+    ])
+    conversations = load_traces(path, default_think_time=0.5)
+    assert [c["id"] for c in conversations] == ["user-001", "user-002", "late"]
+    assert conversations[0]["turns"] == [{"content": "Speed up retrieval", "think_time": 0.5}]
+    late = conversations[-1]
+    assert late["start"] == 5.0
+    assert [t["think_time"] for t in late["turns"]] == [2.0, 0.5]
+
+
+def test_percentiles_use_nearest_rank():
+    stats = percentiles([float(v) for v in range(1, 101)])
+    assert (stats["p50"], stats["p90"], stats["p99"], stats["max"]) == (50.0, 90.0, 99.0, 100.0)
+    assert stats["mean"] == 50.5
+    assert percentiles([0.25]) == {"p50": 0.25, "p90": 0.25, "p95": 0.25, "p99": 0.25, "max": 0.25, "mean": 0.25}
+    assert percentiles([]) == {}
+
+
+@pytest.mark.parametrize("url", ["http://host:11434", "http://host:11434/", "http://host:11434/v1"])
+def test_http_target_accepts_native_root(url):
+    assert HttpTarget(url, "m").url == "http://host:11434/v1"
+
+
+def test_replay_against_stub_server(tmp_path):
+    pytest.importorskip("requests")
+    path = write_trace(tmp_path, [
+        {"conversation_id": "a", "turns": [{"content": "hi"}, {"content": "again"}]},
+        {"conversation_id": "b", "turns": [{"content": "hello"}]},
+    ])
+    with StubServer() as server:
+        # The native root, as OLLAMA_HOST is usually set
+        report = replay(load_traces(path), HttpTarget(server.url, "m"), concurrency=2, time_scale=0, sample_interval=0.05)
+    assert report["turns"] == 3
+    assert report["error_rate"] == 0.0
+    assert set(report["latency"]) == {"p50", "p90", "p95", "p99", "max", "mean"}
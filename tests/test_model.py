@@ -0,0 +1,40 @@
+"""Tests for the encrypted save/retrieve helpers (db/model.py)."""
+import logging
+
+import pytest
+
+pytest.importorskip("cryptography")
+
+from cryptography.fernet import Fernet
+
+from db.model import retrieve_messages, save_message_to_vectorstore, save_messages_to_vectorstore
+from src.records import RecordCipher
+from tests.perf import fakes
+
+
+def test_sessions_only_search_their_own_records(caplog):
+    store, embeddings = fakes.FakeVectorStore(), fakes.FakeEmbeddings()
+    mine, other = RecordCipher(Fernet.generate_key()), RecordCipher(Fernet.generate_key())
+    for i in range(5):
+        save_message_to_vectorstore(store, embeddings, f"other {i}", other)
+    save_message_to_vectorstore(store, embeddings, "mine 0", mine)
+    save_message_to_vectorstore(store, embeddings, "mine 1", mine)
+
+    with caplog.at_level(logging.DEBUG, logger="db.model"):
+        assert retrieve_messages(store, embeddings, "query", mine, k=2) == ["mine 0", "mine 1"]
+    assert not [r for r in caplog.records if r.levelno >= logging.WARNING]
+
+
+def test_batches_are_tagged_with_the_key():
+    store, cipher = fakes.FakeVectorStore(), RecordCipher(Fernet.generate_key())
+    save_messages_to_vectorstore(store, fakes.FakeEmbeddings(), ["a", "b"], cipher, ids=["1", "2"], metadatas=[{"source": "cli"}, None])
+    assert store._collection.metadatas == {"1": {"source": "cli", "key_id": cipher.key_id}, "2": {"key_id": cipher.key_id}}
+
+
+def test_untagged_records_are_skipped_quietly(caplog):
+    fernet = Fernet(Fernet.generate_key())
+    store = fakes.FakeVectorStore([fernet.encrypt(b"legacy").decode(), "not a token"])
+    with caplog.at_level(logging.DEBUG, logger="db.model"):
+        assert retrieve_messages(store, fakes.FakeEmbeddings(), "query", fernet, k=5) == ["legacy"]
+    assert not [r for r in caplog.records if r.levelno >= logging.ERROR]
+    assert "Skipped 1 of 2" in caplog.text
@@ -0,0 +1,51 @@
+"""Tests for how rerun profiling is requested (utils/profiling.py)."""
+import pytest
+
+pytest.importorskip("dotenv")
+
+from pydantic import ValidationError
+
+from src import settings
+from utils.profiling import requested_mode
+
+KEYS = ("PROFILE_RERUNS", "PROFILE_QUERY", "PROFILE_TOKEN")
+
+
+@pytest.fixture(autouse=True)
+def configure(monkeypatch):
+    """Set profiling variables and rebuild the settings snapshot from them."""
+    for key in KEYS:
+        monkeypatch.delenv(key, raising=False)
+    monkeypatch.setattr(settings, "_settings", None)
+
+    def apply(**env):
+        for key, value in env.items():
+            monkeypatch.setenv(key, value)
+        settings._settings = None
+
+    yield apply
+    settings._settings = None
+
+
+def test_query_parameter_is_ignored_by_default():
+    assert requested_mode({"profile": "sample"}) is None
+
+
+def test_query_parameter_needs_a_token(configure):
+    configure(PROFILE_QUERY="1")
+    assert requested_mode({"profile": "sample"}) is None
+    configure(PROFILE_TOKEN="secret")
+    assert requested_mode({"profile": "sample"}) is None
+    assert requested_mode({"profile": "sample", "profile_token": "wrong"}) is None
+    assert requested_mode({"profile": "sample", "profile_token": "secret"}) == "sample"
+
+
+def test_server_setting_profiles_every_rerun(configure):
+    configure(PROFILE_RERUNS="cprofile")
+    assert requested_mode(None) == "cprofile"
+
+
+def test_unknown_server_mode_is_rejected(configure):
+    configure(PROFILE_RERUNS="bogus")
+    with pytest.raises(ValidationError):
+        settings.load_settings()
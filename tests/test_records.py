@@ -0,0 +1,177 @@
+"""Tests for the compact encrypted record format (src/records.py)."""
+import os
+
+import pytest
+
+pytest.importorskip("cryptography")
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from src import records
+from src.records import CODEC_NONE, CODEC_ZLIB, CODEC_ZSTD, HEADER_SIZE, RecordCipher, is_record, migrate_collection
+
+TEXT = "Rotate the key, re-encrypt the stored records and revoke the old key. " * 20
+
+
+@pytest.fixture
+def key():
+    return Fernet.generate_key()
+
+
+@pytest.fixture
+def cipher(key):
+    return RecordCipher(key)
+
+
+def test_text_record_round_trip(cipher):
+    record = cipher.encrypt(TEXT.encode())
+    assert record.startswith(records.TEXT_PREFIX)
+    assert is_record(record)
+    assert cipher.decrypt(record).decode() == TEXT
+    assert cipher.decrypt(record.decode()).decode() == TEXT
+
+
+def test_binary_record_round_trip(cipher):
+    record = cipher.encrypt_binary(TEXT.encode())
+    assert record.startswith(records.MAGIC)
+    assert cipher.decrypt(record).decode() == TEXT
+
+
+def test_compresses_long_text(cipher):
+    assert len(cipher.encrypt(TEXT.encode())) < len(Fernet(Fernet.generate_key()).encrypt(TEXT.encode()))
+
+
+def test_reads_legacy_fernet_tokens(key, cipher):
+    token = Fernet(key).encrypt(b"legacy message")
+    assert not is_record(token)
+    assert cipher.decrypt(token) == b"legacy message"
+
+
+def test_fernet_write_format(key):
+    cipher = RecordCipher(key, write_format="fernet")
+    token = cipher.encrypt(b"message")
+    assert not is_record(token)
+    assert Fernet(key).decrypt(token) == b"message"
+
+
+def test_unknown_write_format(key):
+    with pytest.raises(ValueError):
+        RecordCipher(key, write_format="v2")
+
+
+def test_wrong_key_is_rejected(cipher):
+    record = cipher.encrypt(TEXT.encode())
+    with pytest.raises(InvalidToken):
+        RecordCipher(Fernet.generate_key()).decrypt(record)
+
+
+@pytest.mark.parametrize("index", [2, 3])
+def test_header_tamper_is_rejected(cipher, index):
+    record = bytearray(cipher.encrypt_binary(TEXT.encode()))
+    # Version and codec bytes are authenticated as associated data
+    record[index] ^= 0x01
+    with pytest.raises(InvalidToken):
+        cipher.decrypt(bytes(record))
+
+
+def test_ciphertext_tamper_is_rejected(cipher):
+    record = bytearray(cipher.encrypt_binary(TEXT.encode()))
+    record[-1] ^= 0x01
+    with pytest.raises(InvalidToken):
+        cipher.decrypt(bytes(record))
+
+
+def test_truncated_and_malformed_records_are_rejected(cipher):
+    with pytest.raises(InvalidToken):
+        cipher.decrypt(records.MAGIC + bytes((records.VERSION, CODEC_NONE)) + b"short")
+    with pytest.raises(InvalidToken):
+        cipher.decrypt(records.TEXT_PREFIX + b"not base64!")
+
+
+def test_short_or_incompressible_data_is_stored_uncompressed(cipher):
+    assert cipher.encrypt_binary(b"short")[3] == CODEC_NONE
+    random_bytes = os.urandom(4096)
+    record = cipher.encrypt_binary(random_bytes)
+    assert record[3] == CODEC_NONE
+    assert cipher.decrypt(record) == random_bytes
+
+
+def test_codec_falls_back_to_zlib_without_zstandard(key, monkeypatch):
+    monkeypatch.setattr(records, "zstandard", None)
+    assert records.default_codec() == CODEC_ZLIB
+    cipher = RecordCipher(key)
+    record = cipher.encrypt_binary(TEXT.encode())
+    assert record[3] == CODEC_ZLIB
+    assert cipher.decrypt(record).decode() == TEXT
+
+
+def test_zstd_record_without_zstandard_fails_clearly(key, monkeypatch):
+    pytest.importorskip("zstandard")
+    record = RecordCipher(key, codec=CODEC_ZSTD).encrypt_binary(TEXT.encode())
+    monkeypatch.setattr(records, "zstandard", None)
+    with pytest.raises(ValueError, match="zstandard"):
+        RecordCipher(key, codec=CODEC_ZLIB).decrypt(record)
+
+
+def test_header_size_matches_layout(cipher):
+    record = cipher.encrypt_binary(b"x" * 100)
+    assert record[:2] == records.MAGIC and record[2] == records.VERSION
+    assert len(record) == HEADER_SIZE + records.NONCE_SIZE + len(records.compress(b"x" * 100, record[3])) + 16
+
+
+class FakeCollection:
+    """In-memory Chroma collection with the get/update subset migration uses."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def get(self, include, limit, offset):
+        ids = list(self.rows)[offset:offset + limit]
+        page = {"ids": ids}
+        for field in include:
+            page[field] = [self.rows[i][field] for i in ids]
+        return page
+
+    def update(self, ids, documents, embeddings=None, metadatas=None):
+        for i, row_id in enumerate(ids):
+            row = self.rows[row_id]
+            row["documents"] = documents[i]
+            # Chroma re-embeds documents when no embeddings are passed
+            row["embeddings"] = embeddings[i] if embeddings is not None else [0.0] * len(row["embeddings"])
+            if metadatas is not None:
+                row["metadatas"] = metadatas[i]
+
+
+def test_migration_keeps_embeddings_and_metadata(key, cipher):
+    fernet = Fernet(key)
+    rows = {
+        "a": {"documents": fernet.encrypt(b"first").decode(), "embeddings": [0.1, 0.2, 0.3], "metadatas": {"source": "chat"}},
+        "b": {"documents": cipher.encrypt(b"second").decode(), "embeddings": [0.4, 0.5, 0.6], "metadatas": {"source": "chat"}},
+        "c": {"documents": "not a token", "embeddings": [0.7, 0.8, 0.9], "metadatas": {"source": "chat"}},
+    }
+    collection = FakeCollection(rows)
+
+    stats = migrate_collection(collection, cipher, batch_size=2)
+
+    assert (stats["migrated"], stats["tagged"], stats["skipped"], stats["failed"]) == (1, 1, 0, 1)
+    assert is_record(rows["a"]["documents"])
+    assert cipher.decrypt(rows["a"]["documents"]) == b"first"
+    assert rows["a"]["embeddings"] == [0.1, 0.2, 0.3]
+    assert rows["a"]["metadatas"] == {"source": "chat", records.KEY_ID_FIELD: cipher.key_id}
+    assert rows["b"]["metadatas"][records.KEY_ID_FIELD] == cipher.key_id
+
+    assert migrate_collection(collection, cipher)["skipped"] == 2
+
+
+def test_key_id_is_stable_per_key(key, cipher):
+    assert RecordCipher(key, write_format="fernet").key_id == cipher.key_id
+    assert RecordCipher(Fernet.generate_key()).key_id != cipher.key_id
+    assert key.decode() not in cipher.key_id
+
+
+def test_migration_dry_run_changes_nothing(key, cipher):
+    token = Fernet(key).encrypt(b"first").decode()
+    rows = {"a": {"documents": token, "embeddings": [0.1], "metadatas": {"source": "chat"}}}
+    stats = migrate_collection(FakeCollection(rows), cipher, dry_run=True)
+    assert stats["migrated"] == 1
+    assert rows["a"]["documents"] == token
@@ -0,0 +1,68 @@
+"""Tests for how much retrieval over-fetches for reranking (src/rerank.py, src/pipeline.py)."""
+import time
+
+import pytest
+
+from src import rerank
+from src.rerank import Reranker
+
+
+class SlowModel:
+    """Cross-encoder stand-in scoring by text length, ``delay`` seconds per batch."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+
+    def predict(self, pairs, batch_size=16):
+        time.sleep(self.delay)
+        return [len(text) for _, text in pairs]
+
+
+@pytest.fixture
+def reranker(monkeypatch):
+    reranker = Reranker(fetch_k=50, batch_size=2, budget=0.05)
+    monkeypatch.setattr(reranker, "load_in_background", lambda: None)
+    return reranker
+
+
+def test_fetches_k_while_model_is_loading(reranker):
+    assert reranker.fetch_size(5) == 5
+
+
+def test_over_fetches_once_model_is_loaded(reranker):
+    reranker.model = SlowModel()
+    assert reranker.fetch_size(5) == 50
+    assert reranker.fetch_size(80) == 80
+    assert reranker.rerank("q", ["a", "ccc", "bb"], 2) == ["ccc", "bb"]
+
+
+def test_fetches_k_for_a_while_after_budget_overrun(reranker):
+    reranker.model = SlowModel(delay=0.03)
+    texts = [f"text {i}" for i in range(10)]
+    assert reranker.rerank("q", texts, 3) == texts[:3]
+    assert reranker.stats["passthrough"] == 1
+    sizes = [reranker.fetch_size(5) for _ in range(rerank.BUDGET_COOLDOWN_SEARCHES + 1)]
+    assert sizes == [5] * rerank.BUDGET_COOLDOWN_SEARCHES + [50]
+
+
+def test_pipeline_fetches_top_k_when_reranker_cannot_run(reranker):
+    pytest.importorskip("cryptography")
+    from cryptography.fernet import Fernet
+
+    from src.pipeline import prepare_turn
+    from tests.perf import fakes
+
+    cipher = Fernet(Fernet.generate_key())
+    store = fakes.FakeVectorStore([cipher.encrypt(f"earlier message {i}".encode()).decode() for i in range(60)])
+    requested = []
+    search = store.similarity_search_by_vector
+    store.similarity_search_by_vector = lambda embedding, k=4: requested.append(k) or search(embedding, k)
+
+    prepared = prepare_turn(fakes.FakeAgent(), "hi", store, fakes.FakeEmbeddings(), cipher, k=5,
+                            persist_message=False, reranker=reranker)
+    assert requested == [5] and len(prepared.context) == 5
+
+    reranker.model = SlowModel()
+    prepare_turn(fakes.FakeAgent(), "hi", store, fakes.FakeEmbeddings(), cipher, k=5,
+                 persist_message=False, reranker=reranker)
+    assert requested == [5, 50]
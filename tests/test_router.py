@@ -0,0 +1,159 @@
+"""Tests for the circuit breaker (src/health.py) and provider router (src/router.py)."""
+import pytest
+
+from src.cancellation import CancelToken
+from src.exceptions import GenerationCancelled, UpstreamUnavailableError
+from src.health import CLOSED, HALF_OPEN, OPEN, HealthMonitor
+from src.router import BackendConfig, BackendOverloaded, ProviderRouter
+
+
+def make_monitor(**kwargs):
+    return HealthMonitor(probe=lambda: True, failure_threshold=2, reset_timeout=30.0, **kwargs)
+
+
+def expire_cooldown(monitor):
+    monitor.opened_at -= monitor.reset_timeout + 1
+
+
+def test_breaker_opens_after_threshold():
+    monitor = make_monitor()
+    monitor.record_failure()
+    assert monitor.state == CLOSED and monitor.allow_request()
+    monitor.record_failure()
+    assert monitor.state == OPEN
+    assert not monitor.allow_request()
+
+
+def test_breaker_allows_one_half_open_trial():
+    monitor = make_monitor()
+    monitor.record_failure()
+    monitor.record_failure()
+    expire_cooldown(monitor)
+    assert monitor.allow_request()
+    assert monitor.state == HALF_OPEN
+    assert not monitor.allow_request()
+
+
+def test_half_open_success_closes_and_failure_reopens():
+    monitor = make_monitor()
+    monitor.record_failure()
+    monitor.record_failure()
+    expire_cooldown(monitor)
+    monitor.allow_request()
+    monitor.record_failure()
+    assert monitor.state == OPEN and not monitor.allow_request()
+
+    expire_cooldown(monitor)
+    monitor.allow_request()
+    monitor.record_success()
+    assert monitor.state == CLOSED and monitor.consecutive_failures == 0
+
+
+def test_release_probe_reopens_with_fresh_cooldown():
+    monitor = make_monitor()
+    monitor.record_failure()
+    monitor.record_failure()
+    expire_cooldown(monitor)
+    monitor.allow_request()
+    monitor.release_probe()
+    assert monitor.state == OPEN
+    assert not monitor.allow_request()
+    expire_cooldown(monitor)
+    assert monitor.allow_request()
+
+
+def test_release_probe_leaves_closed_circuit_alone():
+    monitor = make_monitor()
+    monitor.release_probe()
+    assert monitor.state == CLOSED
+
+
+def make_router(*behaviours):
+    """Router whose backends replay ``behaviours`` instead of calling HTTP.
+
+    Each behaviour is a list of tokens to stream or an exception to raise
+    before the first token.
+    """
+    configs = [BackendConfig(name=f"b{i}", base_url="http://stub") for i in range(len(behaviours))]
+    router = ProviderRouter(configs, failure_threshold=1, reset_timeout=30.0)
+    for backend, behaviour in zip(router.backends, behaviours):
+        def stream(messages, cancel_token=None, _behaviour=behaviour, **params):
+            if isinstance(_behaviour, Exception):
+                raise _behaviour
+            yield from _behaviour
+        backend.stream_chat = stream
+    return router
+
+
+def test_weights_rank_idle_and_busy_backends():
+    configs = [BackendConfig(name="small", base_url="http://a", weight=1), BackendConfig(name="big", base_url="http://b", weight=3)]
+    router = ProviderRouter(configs)
+    small, big = router.backends
+    small.observe_ttft(0.1)
+    big.observe_ttft(0.5)
+    # Idle: the heavier backend wins even though the lighter one is faster
+    assert router.ranked()[0] is big
+    big.in_flight = 3
+    assert router.ranked()[0] is small
+
+
+def test_router_streams_and_records_success():
+    router = make_router(["a", "b"])
+    assert router.chat([]) == "ab"
+    backend = router.backends[0]
+    assert backend.health.state == CLOSED and backend.in_flight == 0
+    assert backend.ewma_ttft is not None
+
+
+def test_router_falls_back_and_opens_failed_backend():
+    router = make_router(ConnectionError("down"), ["ok"])
+    assert router.chat([]) == "ok"
+    failed, healthy = router.backends
+    assert failed.health.state == OPEN
+    assert healthy.health.state == CLOSED
+
+
+def test_router_overload_does_not_trip_circuit():
+    router = make_router(BackendOverloaded("busy"), ["ok"])
+    assert router.chat([]) == "ok"
+    assert router.backends[0].health.state == CLOSED
+
+
+def test_router_raises_when_every_backend_is_down():
+    router = make_router(ConnectionError("down"))
+    with pytest.raises(UpstreamUnavailableError):
+        router.chat([])
+    with pytest.raises(UpstreamUnavailableError, match="circuit open"):
+        router.chat([])
+
+
+def open_for_trial(router):
+    backend = router.backends[0]
+    backend.health.record_failure()
+    expire_cooldown(backend.health)
+    return backend
+
+
+def test_abandoned_half_open_stream_releases_probe():
+    router = make_router(["a", "b"])
+    backend = open_for_trial(router)
+    stream = router.stream_chat([])
+    assert next(stream) == "a"
+    assert backend.health.state == HALF_OPEN
+    stream.close()
+    assert backend.health.state == OPEN and backend.in_flight == 0
+    expire_cooldown(backend.health)
+    assert router.chat([]) == "ab"
+    assert backend.health.state == CLOSED
+
+
+def test_cancelled_half_open_stream_releases_probe():
+    router = make_router(["a", "b"])
+    backend = open_for_trial(router)
+    token = CancelToken()
+    stream = router.stream_chat([], cancel_token=token)
+    assert next(stream) == "a"
+    token.cancel()
+    with pytest.raises(GenerationCancelled):
+        list(stream)
+    assert backend.health.state == OPEN and backend.in_flight == 0
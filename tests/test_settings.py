@@ -0,0 +1,177 @@
+"""Tests for the settings snapshot, its reload and export (src/settings.py)."""
+import json
+import os
+
+import pytest
+
+pytest.importorskip("dotenv")
+
+from pydantic import ValidationError
+
+from src import settings
+from src.settings import SettingsWatcher, get_settings, load_settings, on_reload, reload_settings
+
+KEYS = ("TEMPERATURE", "RETRIEVAL_K", "KNOWLEDGE_K", "VECTOR_DB_SHARDING", "CHROMA_BACKEND",
+        "CHROMA_SERVER_HOST", "CHROMA_SERVER_SSL", "CHROMA_POOL_SIZE", "RECORD_CODEC", "RECORD_FORMAT",
+        "MODEL_BACKENDS", "GEMINI_API_KEY")
+
+
+@pytest.fixture
+def files(tmp_path, monkeypatch):
+    """Point the settings at empty temporary files with a fresh snapshot."""
+    env_file, config_file = tmp_path / ".env", tmp_path / "config.json"
+    # Values exported from the repo's own .env would otherwise look like
+    # variables the process was started with
+    for key, value in settings._exported.items():
+        if os.environ.get(key) == value:
+            monkeypatch.delenv(key)
+    for key in KEYS:
+        monkeypatch.delenv(key, raising=False)
+    monkeypatch.setattr(settings, "_exported", {})
+    monkeypatch.setattr(settings, "_settings", None)
+    monkeypatch.setattr(settings, "_listeners", [])
+    monkeypatch.setattr(settings, "ENV_FILE", str(env_file))
+    monkeypatch.setattr(settings, "CONFIG_FILE", str(config_file))
+    yield env_file, config_file
+    for key, value in settings._exported.items():
+        if os.environ.get(key) == value:
+            del os.environ[key]
+
+
+def write(env_file, config_file, env=None, config=None):
+    if env is not None:
+        env_file.write_text("".join(f"{key}={value}\n" for key, value in env.items()))
+    if config is not None:
+        config_file.write_text(json.dumps(config))
+
+
+def test_env_file_overrides_config_and_process_env_overrides_both(files, monkeypatch):
+    env_file, config_file = files
+    write(env_file, config_file, env={"TEMPERATURE": "0.4"}, config={"TEMPERATURE": 0.2, "RETRIEVAL_K": 7})
+    current = get_settings()
+    assert current.temperature == 0.4
+    assert current.retrieval_k == 7
+
+    monkeypatch.setenv("TEMPERATURE", "0.6")
+    assert load_settings()[0].temperature == 0.6
+
+
+def test_empty_value_means_unset(files):
+    env_file, config_file = files
+    write(env_file, config_file, env={"VECTOR_DB_SHARDING": "", "TEMPERATURE": ""})
+    current = get_settings()
+    assert current.vector_db_sharding is None
+    assert current.temperature == 0.7
+
+
+def test_file_values_are_exported_but_never_over_the_environment(files, monkeypatch):
+    env_file, config_file = files
+    monkeypatch.setenv("RETRIEVAL_K", "9")
+    write(env_file, config_file, env={"RETRIEVAL_K": "3", "KNOWLEDGE_K": "2"})
+    get_settings()
+    assert os.environ["KNOWLEDGE_K"] == "2"
+    assert os.environ["RETRIEVAL_K"] == "9"
+
+    write(env_file, config_file, env={"RETRIEVAL_K": "3"})
+    reload_settings()
+    assert "KNOWLEDGE_K" not in os.environ
+    assert os.environ["RETRIEVAL_K"] == "9"
+
+
+def test_reload_swaps_snapshot_and_runs_hooks(files):
+    env_file, config_file = files
+    write(env_file, config_file, env={"TEMPERATURE": "0.2", "RETRIEVAL_K": "5"})
+    old = get_settings()
+    calls = []
+    on_reload(lambda before, after, changed: calls.append((before.temperature, after.temperature, changed)))
+
+    assert reload_settings() is old
+    write(env_file, config_file, env={"TEMPERATURE": "0.9", "RETRIEVAL_K": "5"})
+    new = reload_settings()
+    assert get_settings() is new and new.temperature == 0.9
+    assert calls == [(0.2, 0.9, ["TEMPERATURE"])]
+
+
+def test_invalid_reload_keeps_previous_snapshot(files):
+    env_file, config_file = files
+    write(env_file, config_file, env={"TEMPERATURE": "0.2"})
+    old = get_settings()
+    write(env_file, config_file, env={"TEMPERATURE": "5"})
+    assert reload_settings() is old
+    write(env_file, config_file, config=["not", "an", "object"])
+    assert reload_settings() is old
+
+
+def test_watcher_reloads_on_file_change(files):
+    env_file, config_file = files
+    write(env_file, config_file, env={"TEMPERATURE": "0.2"})
+    get_settings()
+    watcher = SettingsWatcher(paths=(str(env_file), str(config_file)), interval=0)
+    assert not watcher.check()
+    write(env_file, config_file, env={"TEMPERATURE": "0.35"})
+    assert watcher.check()
+    assert get_settings().temperature == 0.35
+
+
+def test_storage_fields_are_typed(files, monkeypatch):
+    from db.backends import get_backend
+
+    env_file, config_file = files
+    write(env_file, config_file, env={"CHROMA_SERVER_HOST": "chroma", "CHROMA_SERVER_SSL": "1", "CHROMA_POOL_SIZE": "8"})
+    current = get_settings()
+    assert (current.chroma_server_ssl, current.chroma_pool_size) == (True, 8)
+    assert get_backend() == "http"
+
+    monkeypatch.setenv("VECTOR_DB_SHARDING", "bogus")
+    with pytest.raises(ValidationError):
+        load_settings()
+    monkeypatch.setenv("VECTOR_DB_SHARDING", "tenant_time")
+    monkeypatch.setenv("CHROMA_BACKEND", "memory")
+    current = load_settings()[0]
+    assert current.vector_db_sharding == "tenant_time" and current.vector_db_shard_bucket == "month"
+    assert current.chroma_backend == "memory"
+
+
+def test_record_and_backend_fields_are_validated(files, monkeypatch):
+    from src.router import load_backend_configs
+
+    env_file, config_file = files
+    backends = [{"name": "local", "base_url": "http://a/v1"}, {"name": "gemini", "base_url": "http://b", "api_key_env": "GEMINI_API_KEY"}]
+    write(env_file, config_file, env={"RECORD_CODEC": "zlib", "GEMINI_API_KEY": "secret"}, config={"MODEL_BACKENDS": backends})
+    current = get_settings()
+    assert (current.record_codec, current.record_format) == ("zlib", "v1")
+    configs = load_backend_configs()
+    assert [c.name for c in configs] == ["local", "gemini"]
+    assert configs[1].api_key == "secret"
+    assert "api_key_env" in current.model_backends[1]
+
+    for key, value in (("RECORD_CODEC", "lz4"), ("RECORD_FORMAT", "v2"), ("MODEL_BACKENDS", "[not json")):
+        monkeypatch.setenv(key, value)
+        with pytest.raises(ValidationError):
+            load_settings()
+        monkeypatch.delenv(key)
+
+
+def test_streamed_turn_passes_current_temperature(files):
+    from src.agent import stream_process_message
+    from tests.perf import fakes
+
+    class RecordingLLM(fakes.FakeLLM):
+        def stream(self, prompt, **kwargs):
+            self.kwargs = kwargs
+            yield from super().stream(prompt)
+
+    env_file, config_file = files
+    write(env_file, config_file, env={"TEMPERATURE": "0.3"})
+    agent = fakes.FakeAgent(RecordingLLM())
+    list(stream_process_message(agent, "hi"))
+    assert agent.llm.kwargs["temperature"] == 0.3
+
+    write(env_file, config_file, env={"TEMPERATURE": "1.1"})
+    reload_settings()
+    list(stream_process_message(agent, "hi"))
+    assert agent.llm.kwargs["temperature"] == 1.1
+
+    agent.llm.reads_settings_per_request = True
+    list(stream_process_message(agent, "hi"))
+    assert "temperature" not in agent.llm.kwargs
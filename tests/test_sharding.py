@@ -0,0 +1,95 @@
+"""Tests for shard naming and discovery (db/sharding.py)."""
+import os
+from datetime import datetime
+
+import pytest
+
+from db import backends, sharding
+from db.sharding import SHARD_KEY_PATTERN, ShardRouter, tenant_shard_id, time_bucket
+
+
+@pytest.mark.parametrize("strategy", ["tenant", "time", "tenant_time"])
+@pytest.mark.parametrize("granularity", ["day", "week", "month"])
+def test_shard_keys_match_pattern(strategy, granularity, tmp_path):
+    router = ShardRouter(None, str(tmp_path), strategy=strategy, granularity=granularity)
+    try:
+        assert SHARD_KEY_PATTERN.match(router.shard_key("alice", datetime(2024, 3, 5)))
+    finally:
+        router._executor.shutdown()
+
+
+def test_list_shards_ignores_unsharded_layout(tmp_path, monkeypatch):
+    monkeypatch.setattr(sharding, "get_backend", lambda: "persistent")
+    hot, cold = tmp_path / "hot", tmp_path / "cold"
+    shard = tenant_shard_id("alice")
+    for path in (hot / shard, hot / "0c6f1e6c-1d1e-4a52-9a43-1b8a3e1f2c3d", cold / tenant_shard_id("bob")):
+        os.makedirs(path)
+    (hot / "chroma.sqlite3").write_text("")
+    router = ShardRouter(None, str(hot), cold_root=str(cold))
+    try:
+        assert router.list_shards() == sorted([shard, tenant_shard_id("bob")])
+    finally:
+        router._executor.shutdown()
+
+
+def test_list_shards_on_server_filters_collection_names(tmp_path, monkeypatch):
+    monkeypatch.setattr(sharding, "get_backend", lambda: "http")
+    bucket = time_bucket(datetime(2024, 3, 5))
+    monkeypatch.setattr(sharding, "list_collections", lambda prefix: [f"{prefix}{bucket}", f"{prefix}backup"])
+    router = ShardRouter(None, str(tmp_path), strategy="time")
+    try:
+        assert router.list_shards() == [bucket]
+    finally:
+        router._executor.shutdown()
+
+
+class FakeSystem:
+    def __init__(self):
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+
+class FakeClient:
+    _identifier_to_system = {}
+
+    def __init__(self, path):
+        self._identifier = path
+        self._system = self._identifier_to_system.setdefault(path, FakeSystem())
+
+
+class FakeStore:
+    def __init__(self, path):
+        self.path = path
+        self._client = FakeClient(path)
+
+
+@pytest.fixture
+def embedded_router(tmp_path, monkeypatch):
+    """Router over fake embedded stores whose clients mimic chromadb's system cache."""
+    monkeypatch.setattr(sharding, "get_backend", lambda: "persistent")
+    monkeypatch.setattr(backends, "get_backend", lambda: "persistent")
+    monkeypatch.setattr(FakeClient, "_identifier_to_system", {})
+    monkeypatch.setattr(sharding, "open_store", lambda name, embeddings, persist_directory: FakeStore(persist_directory))
+    router = ShardRouter(None, str(tmp_path / "hot"), cold_root=str(tmp_path / "cold"), max_open_shards=2)
+    yield router
+    router._executor.shutdown()
+
+
+def test_evicted_shards_release_their_client(embedded_router):
+    stores = [embedded_router.get_store(tenant_shard_id(name)) for name in ("a", "b", "c")]
+    assert stores[0]._client._system.stopped
+    assert not any(store._client._system.stopped for store in stores[1:])
+    assert set(FakeClient._identifier_to_system) == {stores[1].path, stores[2].path}
+
+
+def test_move_to_cold_closes_the_shard_first(embedded_router, monkeypatch):
+    shard = tenant_shard_id("a")
+    store = embedded_router.get_store(shard)
+    os.makedirs(store.path)
+    moves = []
+    monkeypatch.setattr(sharding.shutil, "move", lambda source, target: moves.append(store._client._system.stopped))
+    embedded_router.move_to_cold(shard)
+    assert moves == [True]
+    assert store.path not in FakeClient._identifier_to_system
@@ -0,0 +1,56 @@
+"""Tests for token counting and context-budget trimming (src/tokens.py)."""
+import sys
+import types
+
+import pytest
+
+from src import tokens
+from src.tokens import Tokenizer, fit_history
+
+
+class Message:
+    def __init__(self, content):
+        self.content = content
+
+
+def test_history_is_trimmed_from_the_oldest_message():
+    tokenizer = Tokenizer()
+    history = [Message("a" * 40), Message("b" * 40), Message("c" * 40)]
+    # 10 tokens + 4 overhead per message
+    assert fit_history(history, fixed_tokens=10, tokenizer=tokenizer, budget=40) == history[1:]
+
+
+def test_fixed_prompt_over_budget_drops_all_history(caplog):
+    tokenizer = Tokenizer()
+    history = [Message("a" * 40)]
+    with caplog.at_level("WARNING", logger="src.tokens"):
+        assert fit_history(history, fixed_tokens=50, tokenizer=tokenizer, budget=40) == []
+        assert fit_history("earlier turns", fixed_tokens=50, tokenizer=tokenizer, budget=40) == ""
+    assert "over the 40 token budget" in caplog.text
+
+
+@pytest.fixture
+def fake_transformers(monkeypatch):
+    calls = []
+
+    class AutoTokenizer:
+        @staticmethod
+        def from_pretrained(repo, **kwargs):
+            calls.append((repo, kwargs))
+            raise OSError("not in the local cache")
+
+    monkeypatch.setitem(sys.modules, "transformers", types.SimpleNamespace(AutoTokenizer=AutoTokenizer))
+    monkeypatch.setattr(tokens, "_tokenizers", {})
+    return calls
+
+
+def test_tokenizer_never_downloads_and_falls_back(fake_transformers):
+    tokenizer = tokens.get_tokenizer("deepseek-r1:1.5b")
+    assert tokenizer.name == "heuristic"
+    assert fake_transformers == [(tokens.TOKENIZER_REPOS["deepseek-r1:1.5b"], {"local_files_only": True})]
+
+
+def test_preload_shares_the_cached_tokenizer(fake_transformers):
+    tokens.preload_tokenizer("deepseek-r1:1.5b").join()
+    assert tokens.get_tokenizer("deepseek-r1:1.5b") is tokens.get_tokenizer("deepseek-r1:1.5b")
+    assert len(fake_transformers) == 1
@@ -0,0 +1,30 @@
+"""Tests for the streamed chat rendering in utils/utils.py."""
+import pytest
+
+pytest.importorskip("streamlit")
+
+from utils.utils import ChatUI
+
+
+@pytest.fixture
+def chat_ui():
+    ui = ChatUI()
+    ui.bind({})
+    return ui
+
+
+def test_complete_answer_is_saved(chat_ui):
+    events = [("reasoning", "thinking"), ("answer", "Rotate "), ("answer", "the key.")]
+    assert chat_ui.stream_reasoned_message("assistant", iter(events)) == "Rotate the key."
+    assert [m["content"] for m in chat_ui.load_chat_history()] == ["Rotate the key."]
+
+
+def test_answer_cut_off_midway_is_not_saved(chat_ui):
+    def events():
+        yield "answer", "Rotate "
+        raise ConnectionError("model server went away")
+
+    with pytest.raises(ConnectionError):
+        chat_ui.stream_reasoned_message("assistant", events())
+    assert chat_ui.load_chat_history() == []
+    assert chat_ui.last_render_stats["chunks"] == 1
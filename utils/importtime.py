@@ -0,0 +1,117 @@
+"""Cold-start import profiler.
+
+Runs ``python -X importtime -c "import <module>"`` in a fresh interpreter and
+reports the slowest imports, so regressions in app start-up time are easy to
+spot. Exits non-zero when the total exceeds ``--budget-ms``.
+
+Usage:
+    python -m utils.importtime --module app --top 20 --budget-ms 1500
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, NamedTuple
+
+
+# Loaded on first use only (model, vector store, ingestion); importing app or
+# src.agent must not pull them in (checked by tests/test_importtime.py)
+DEFERRED_PACKAGES = (
+    "langchain", "langchain_community", "langchain_core", "langgraph", "chromadb",
+    "docling", "pypdf", "sentence_transformers", "torch", "transformers",
+)
+
+
+class ImportTiming(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+
+
+def measure_imports(module: str = "app", python: str = sys.executable, cwd: str = None) -> List[ImportTiming]:
+    """Import ``module`` in a fresh interpreter and parse its -X importtime output.
+
+    Args:
+        module (str): Dotted module name to import
+        python (str): Interpreter to run
+        cwd (str): Working directory, defaults to the repository root; the
+            repository stays importable from anywhere else
+
+    Returns:
+        list: One ImportTiming per imported module, in import order
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, (root, env.get("PYTHONPATH"))))
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd or root,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def parse_importtime(output: str) -> List[ImportTiming]:
+    """Parse the stderr of ``python -X importtime``."""
+    timings = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        try:
+            self_part, cumulative_part, name = line[len("import time:"):].split("|", 2)
+            self_us, cumulative_us = int(self_part), int(cumulative_part)
+        except ValueError:
+            continue
+        timings.append(ImportTiming(name.strip(), self_us, cumulative_us))
+    return timings
+
+
+def total_ms(timings: List[ImportTiming]) -> float:
+    """Total import time in milliseconds (sum of every module's self time)."""
+    return sum(t.self_us for t in timings) / 1000
+
+
+def top_level_packages(timings: List[ImportTiming]) -> Dict[str, float]:
+    """Aggregate self time per top-level package, in milliseconds."""
+    packages: Dict[str, float] = {}
+    for timing in timings:
+        package = timing.module.split(".")[0]
+        packages[package] = packages.get(package, 0.0) + timing.self_us / 1000
+    return dict(sorted(packages.items(), key=lambda item: item[1], reverse=True))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Profile cold-start imports")
+    parser.add_argument("--module", default="app", help="Module to import")
+    parser.add_argument("--top", type=int, default=20, help="Number of packages to show")
+    parser.add_argument("--budget-ms", type=float, default=None, help="Fail when total import time exceeds this")
+    parser.add_argument("--forbid", action="append", default=None,
+                        help="Package that must not be imported eagerly (default: DEFERRED_PACKAGES)")
+    args = parser.parse_args(argv)
+    if args.forbid is None:
+        args.forbid = list(DEFERRED_PACKAGES)
+
+    timings = measure_imports(args.module)
+    total = total_ms(timings)
+    print(f"Total import time for '{args.module}': {total:.1f} ms ({len(timings)} modules)")
+    for package, elapsed in list(top_level_packages(timings).items())[:args.top]:
+        print(f"  {elapsed:9.1f} ms  {package}")
+
+    failed = False
+    imported = {timing.module.split(".")[0] for timing in timings}
+    for package in args.forbid:
+        if package in imported:
+            print(f"FAIL: '{package}' is imported eagerly by '{args.module}'")
+            failed = True
+    if args.budget_ms is not None and total > args.budget_ms:
+        print(f"FAIL: import time {total:.1f} ms exceeds budget of {args.budget_ms:.1f} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,388 @@
+"""Replay recorded chat traffic against the chat pipeline.
+
+Traces are JSONL. Each line is either a whole conversation::
+
+    {"conversation_id": "c1", "start": 0.0, "turns": [{"content": "hi", "think_time": 2.5}, ...]}
+
+or a single message, grouped into conversations by ``conversation_id``
+(lines without one become single-turn conversations)::
+
+    {"conversation_id": "c1", "content": "hi", "timestamp": 1712345678.0}
+
+The message text is read from ``content``, ``message``, ``prompt``,
+``body`` or ``title``, so backlog-style files such as ``requests.jsonl``
+replay as-is.
+
+Targets:
+    http        POST to an OpenAI-compatible /chat/completions (default); a
+                URL without ``/v1`` (such as OLLAMA_HOST) gets it appended
+    inprocess   Build the real agent per conversation and run each turn like
+                the app: prepare_turn (memory, retrieval, decryption), then
+                stream_process_message. User messages are only written to
+                the store with --persist-messages
+
+Usage:
+    python -m utils.stub_server --port 11500 &
+    python -m utils.loadtest traces.jsonl --url http://127.0.0.1:11500/v1 --concurrency 8
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+TEXT_FIELDS = ("content", "message", "prompt", "body", "title")
+
+
+# ----------------------------------------------------------------------
+# Trace loading
+# ----------------------------------------------------------------------
+def _text(record: Dict) -> Optional[str]:
+    for name in TEXT_FIELDS:
+        if record.get(name):
+            return str(record[name])
+    return None
+
+
+def load_traces(path: str, default_think_time: float = 0.0) -> List[Dict]:
+    """Load conversations from a JSONL trace file.
+
+    Returns:
+        list: Conversations as {"id", "start", "turns": [{"content", "think_time"}]},
+        sorted by start offset in seconds
+    """
+    conversations: Dict[str, Dict] = {}
+    order = []
+    with open(path) as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if "turns" in record:
+                conv_id = str(record.get("conversation_id", f"line-{line_no}"))
+                turns = [
+                    {"content": _text(turn) or "", "think_time": float(turn.get("think_time", default_think_time))}
+                    for turn in record["turns"]
+                ]
+                conversations[conv_id] = {"id": conv_id, "start": float(record.get("start", 0.0)), "turns": turns}
+                order.append(conv_id)
+                continue
+            text = _text(record)
+            if text is None:
+                continue
+            conv_id = str(record.get("conversation_id") or record.get("request_id") or f"line-{line_no}")
+            timestamp = record.get("timestamp")
+            conversation = conversations.get(conv_id)
+            if conversation is None:
+                conversation = {"id": conv_id, "start": None, "turns": [], "_last": None}
+                conversations[conv_id] = conversation
+                order.append(conv_id)
+            think_time = float(record.get("think_time", default_think_time))
+            if timestamp is not None:
+                timestamp = float(timestamp)
+                if conversation["_last"] is not None and "think_time" not in record:
+                    think_time = max(0.0, timestamp - conversation["_last"])
+                conversation["_last"] = timestamp
+                if conversation["start"] is None:
+                    conversation["start"] = timestamp
+            conversation["turns"].append({"content": text, "think_time": think_time})
+
+    result = [conversations[conv_id] for conv_id in order]
+    # Absolute timestamps become offsets from the first conversation
+    absolute = [c["start"] for c in result if c.get("_last") is not None and c["start"] is not None]
+    origin = min(absolute) if absolute else 0.0
+    for conversation in result:
+        if "_last" in conversation:
+            conversation["start"] = (conversation["start"] - origin) if conversation["start"] is not None else 0.0
+            conversation.pop("_last")
+    return sorted(result, key=lambda c: c["start"])
+
+
+# ----------------------------------------------------------------------
+# Targets
+# ----------------------------------------------------------------------
+class HttpTarget:
+    """Streams each turn from an OpenAI-compatible endpoint, keeping history."""
+
+    def __init__(self, url: str, model: str, api_key: str = "sk-no-key-required", timeout: float = 300.0):
+        # Accept the native Ollama root as well as the OpenAI-compatible URL
+        url = url.strip().rstrip("/")
+        self.url = url if url.endswith("/v1") else f"{url}/v1"
+        self.model = model
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def new_conversation(self, conv_id: str) -> Dict:
+        return {"messages": []}
+
+    def send(self, state: Dict, content: str) -> Dict[str, float]:
+        import requests
+
+        state["messages"].append({"role": "user", "content": content})
+        start = time.perf_counter()
+        ttft = None
+        parts = []
+        with requests.post(
+            f"{self.url}/chat/completions",
+            json={"model": self.model, "messages": state["messages"], "stream": True},
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            stream=True,
+            timeout=self.timeout,
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                delta = (json.loads(data).get("choices") or [{}])[0].get("delta") or {}
+                if delta.get("content"):
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    parts.append(delta["content"])
+        state["messages"].append({"role": "assistant", "content": "".join(parts)})
+        return {"ttft": ttft if ttft is not None else time.perf_counter() - start, "chars": len("".join(parts))}
+
+
+class InProcessTarget:
+    """Runs each conversation through its own agent along the app's turn path."""
+
+    def __init__(self, persist_messages: bool = False):
+        from db.model import init_chat_stores
+        from src.records import get_cipher
+        from src.settings import get_settings
+
+        key = get_settings().encryption_key
+        if key:
+            # Stored history and documents can only be decrypted with the app's key
+            self.cipher_suite = get_cipher(key)
+        else:
+            from cryptography.fernet import Fernet
+
+            self.cipher_suite = Fernet(Fernet.generate_key())
+        self.vectorstore, self.embeddings, self.knowledge_store = init_chat_stores()
+        self.persist_messages = persist_messages
+
+    def new_conversation(self, conv_id: str) -> Dict:
+        from src.agent import create_ollama_agent
+
+        return {"agent": create_ollama_agent(None, session_id=conv_id)}
+
+    def send(self, state: Dict, content: str) -> Dict[str, float]:
+        from src.agent import ANSWER, stream_process_message
+        from src.pipeline import prepare_turn
+
+        start = time.perf_counter()
+        prepared = prepare_turn(
+            state["agent"],
+            content,
+            self.vectorstore,
+            self.embeddings,
+            self.cipher_suite,
+            persist_message=self.persist_messages,
+            knowledge_store=self.knowledge_store,
+        )
+        ttft = None
+        parts = []
+        for kind, text in stream_process_message(state["agent"], content, prepared=prepared):
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            if kind == ANSWER:
+                parts.append(text)
+        if prepared.persist is not None:
+            prepared.persist.result()
+        return {"ttft": ttft if ttft is not None else time.perf_counter() - start, "chars": len("".join(parts))}
+
+
+# ----------------------------------------------------------------------
+# Resource sampling
+# ----------------------------------------------------------------------
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class ResourceSampler:
+    """Samples CPU usage, RSS, threads and in-flight turns at a fixed interval."""
+
+    def __init__(self, interval: float, in_flight):
+        self.interval = interval
+        self.in_flight = in_flight
+        self.samples: List[Dict] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        start = time.perf_counter()
+        last_wall, last_cpu = start, sum(os.times()[:2])
+        while not self._stop.wait(self.interval):
+            now, cpu = time.perf_counter(), sum(os.times()[:2])
+            self.samples.append({
+                "t": round(now - start, 2),
+                "cpu_percent": round(100 * (cpu - last_cpu) / max(now - last_wall, 1e-9), 1),
+                "rss_mb": round(_rss_bytes() / 2 ** 20, 1),
+                "threads": threading.active_count(),
+                "in_flight": self.in_flight(),
+            })
+            last_wall, last_cpu = now, cpu
+
+    def start(self) -> "ResourceSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> List[Dict]:
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+
+# ----------------------------------------------------------------------
+# Replay
+# ----------------------------------------------------------------------
+def percentiles(values: List[float], points=(50, 90, 95, 99)) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+    result = {}
+    for p in points:
+        # Nearest-rank percentile
+        index = min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))
+        result[f"p{p}"] = round(ordered[index], 4)
+    result["max"] = round(ordered[-1], 4)
+    result["mean"] = round(sum(ordered) / len(ordered), 4)
+    return result
+
+
+def replay(
+    conversations: List[Dict],
+    target,
+    concurrency: int = 4,
+    time_scale: float = 1.0,
+    sample_interval: float = 1.0,
+) -> Dict:
+    """Replay conversations against ``target`` and return the report.
+
+    Conversations arrive at their trace start offsets (scaled by
+    ``time_scale``; 0 replays as fast as possible). Each occupies one of
+    ``concurrency`` workers for its whole duration, including think time, like
+    a user session. Queueing delay is the time between a conversation's
+    arrival and a worker picking it up.
+    """
+    lock = threading.Lock()
+    results = []
+    in_flight = [0]
+
+    def run_conversation(conversation: Dict, arrival: float) -> None:
+        queue_delay = time.perf_counter() - arrival
+        state = None
+        for turn_no, turn in enumerate(conversation["turns"]):
+            if turn_no and turn["think_time"] and time_scale:
+                time.sleep(turn["think_time"] * time_scale)
+            record = {"conversation": conversation["id"], "turn": turn_no, "queue_delay": queue_delay if turn_no == 0 else 0.0}
+            with lock:
+                in_flight[0] += 1
+            start = time.perf_counter()
+            try:
+                if state is None:
+                    state = target.new_conversation(conversation["id"])
+                record.update(target.send(state, turn["content"]))
+                record["ok"] = True
+            except Exception as e:
+                record["ok"] = False
+                record["error"] = f"{type(e).__name__}: {str(e)[:200]}"
+            record["latency"] = time.perf_counter() - start
+            record["finished_at"] = time.perf_counter()
+            with lock:
+                in_flight[0] -= 1
+                results.append(record)
+
+    sampler = ResourceSampler(sample_interval, lambda: in_flight[0]).start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="replay") as pool:
+        for conversation in conversations:
+            arrival = started + conversation["start"] * time_scale
+            delay = arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(run_conversation, conversation, arrival)
+    elapsed = time.perf_counter() - started
+    timeline = sampler.stop()
+
+    ok = [r for r in results if r["ok"]]
+    errors = [r for r in results if not r["ok"]]
+    error_kinds: Dict[str, int] = {}
+    for record in errors:
+        kind = record["error"].split(":", 1)[0]
+        error_kinds[kind] = error_kinds.get(kind, 0) + 1
+    return {
+        "conversations": len(conversations),
+        "turns": len(results),
+        "duration_seconds": round(elapsed, 3),
+        "throughput_turns_per_second": round(len(results) / elapsed, 3) if elapsed else 0.0,
+        "error_rate": round(len(errors) / len(results), 4) if results else 0.0,
+        "errors": error_kinds,
+        "latency": percentiles([r["latency"] for r in ok]),
+        "ttft": percentiles([r["ttft"] for r in ok if "ttft" in r]),
+        "queue_delay": percentiles([r["queue_delay"] for r in results if r["turn"] == 0]),
+        "timeline": timeline,
+    }
+
+
+def print_report(report: Dict) -> None:
+    print(f"Conversations: {report['conversations']}  turns: {report['turns']}  "
+          f"duration: {report['duration_seconds']}s  throughput: {report['throughput_turns_per_second']} turns/s")
+    print(f"Error rate: {report['error_rate']:.2%}  {report['errors'] or ''}")
+    for name in ("latency", "ttft", "queue_delay"):
+        stats = report[name]
+        if stats:
+            print(f"{name:>12}: " + "  ".join(f"{k}={v * 1000:.0f}ms" for k, v in stats.items()))
+    if report["timeline"]:
+        peak_rss = max(s["rss_mb"] for s in report["timeline"])
+        peak_cpu = max(s["cpu_percent"] for s in report["timeline"])
+        print(f"   resources: peak RSS {peak_rss} MB, peak CPU {peak_cpu}%, {len(report['timeline'])} samples")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Replay JSONL chat traces against the chat pipeline")
+    parser.add_argument("trace", help="JSONL trace file")
+    parser.add_argument("--target", choices=("http", "inprocess"), default="http")
+    parser.add_argument("--url", default=os.getenv("LOADTEST_URL", "http://127.0.0.1:11500/v1"),
+                        help="Base URL for the http target (default: the stub server, or LOADTEST_URL)")
+    parser.add_argument("--model", default=os.getenv("OLLAMA_MODEL", "deepseek-r1:1.5b"))
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent conversations")
+    parser.add_argument("--time-scale", type=float, default=1.0,
+                        help="Multiplier for arrival offsets and think times (0 = no waiting)")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Default think time between turns")
+    parser.add_argument("--limit", type=int, default=None, help="Replay only the first N conversations")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="Resource sampling interval")
+    parser.add_argument("--output", help="Write the full JSON report here")
+    parser.add_argument("--persist-messages", action="store_true",
+                        help="inprocess: also store the replayed user messages, as the app does")
+    args = parser.parse_args(argv)
+
+    conversations = load_traces(args.trace, args.think_time)[:args.limit]
+    if args.target == "http":
+        target = HttpTarget(args.url, args.model)
+    else:
+        target = InProcessTarget(persist_messages=args.persist_messages)
+    report = replay(conversations, target, args.concurrency, args.time_scale, args.sample_interval)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if report["error_rate"] < 1.0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
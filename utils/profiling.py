@@ -0,0 +1,234 @@
+"""Opt-in profiling of Streamlit reruns.
+
+Enable for every rerun with ``PROFILE_RERUNS=sample`` (or ``cprofile``), or
+for one browser session by opening the app with
+``?profile=sample&profile_token=...``. The query parameter is only honored
+with PROFILE_QUERY=1 and a PROFILE_TOKEN that the ``profile_token`` matches,
+so visitors can't switch on profiling and fill PROFILE_DIR.
+
+Each profiled rerun writes to PROFILE_DIR (default ``./profiles``):
+
+- ``<run>.json``: wall time of every ``phase()`` block
+- ``<run>.collapsed``: collapsed stacks for flamegraph.pl / speedscope
+  (sample mode)
+- ``<run>.prof``: pstats dump for snakeviz (cprofile mode)
+- ``<run>.txt``: the functions ranked by time
+
+The sampler is a pure-Python thread reading the script thread's stack every
+PROFILE_SAMPLE_MS milliseconds, so nothing extra needs to be installed.
+"""
+import os
+import io
+import hmac
+import sys
+import json
+import time
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from src.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+MODES = ("sample", "cprofile")
+
+_local = threading.local()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Samples one thread's Python stack on a background thread."""
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._loop, name="rerun-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        """Stacks in the collapsed format ``root;...;leaf count``."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def ranked(self, top: int = 40) -> str:
+        """Functions ranked by inclusive samples, with their self samples."""
+        total = sum(self.stacks.values()) or 1
+        inclusive: Counter = Counter()
+        own: Counter = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for label in set(frames):
+                inclusive[label] += count
+        lines = [f"{sum(self.stacks.values())} samples every {self.interval * 1000:.1f}ms",
+                 f"{'total%':>7} {'self%':>7}  function"]
+        for label, count in inclusive.most_common(top):
+            lines.append(f"{100 * count / total:6.1f}% {100 * own[label] / total:6.1f}%  {label}")
+        return "\n".join(lines) + "\n"
+
+
+class RerunProfiler:
+    """Profiles one script run and writes its reports on exit."""
+
+    def __init__(self, mode: str, out_dir: str, label: str = "rerun", sample_interval: float = 0.005):
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode {mode!r}, expected one of {MODES}")
+        self.mode = mode
+        self.out_dir = out_dir
+        self.label = label
+        self.sample_interval = sample_interval
+        self.phases: List[Dict] = []
+        self._stack: List[str] = []
+        self._profiler = None
+        self._sampler: Optional[StackSampler] = None
+        self._started = 0.0
+
+    def __enter__(self) -> "RerunProfiler":
+        _local.profiler = self
+        self._started = time.perf_counter()
+        if self.mode == "cprofile":
+            import cProfile
+
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            self._sampler = StackSampler(threading.get_ident(), self.sample_interval)
+            self._sampler.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        # Also runs when Streamlit stops the script with st.rerun()/st.stop()
+        elapsed = time.perf_counter() - self._started
+        if self._profiler is not None:
+            self._profiler.disable()
+        if self._sampler is not None:
+            self._sampler.stop()
+        _local.profiler = None
+        try:
+            self.write(elapsed)
+        except Exception as e:
+            logger.error(f"Failed to write rerun profile: {str(e)}")
+
+    @contextmanager
+    def phase(self, name: str):
+        self._stack.append(name)
+        path = "/".join(self._stack)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append({"phase": path, "seconds": round(time.perf_counter() - start, 6)})
+            self._stack.pop()
+
+    def write(self, elapsed: float) -> str:
+        """Write the reports and return their common path prefix."""
+        os.makedirs(self.out_dir, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        prefix = os.path.join(self.out_dir, f"{stamp}_{self.label}")
+        with open(prefix + ".json", "w") as f:
+            json.dump({"mode": self.mode, "seconds": round(elapsed, 6), "phases": self.phases}, f, indent=2)
+        if self._sampler is not None:
+            with open(prefix + ".collapsed", "w") as f:
+                f.write(self._sampler.collapsed())
+            table = self._sampler.ranked()
+        else:
+            import pstats
+
+            self._profiler.dump_stats(prefix + ".prof")
+            buffer = io.StringIO()
+            pstats.Stats(self._profiler, stream=buffer).sort_stats("cumulative").print_stats(40)
+            table = buffer.getvalue()
+        with open(prefix + ".txt", "w") as f:
+            f.write(table)
+        summary = ", ".join(f"{p['phase']}={p['seconds'] * 1000:.0f}ms" for p in self.phases if "/" not in p["phase"])
+        logger.info(f"Rerun profiled in {elapsed * 1000:.0f}ms ({summary}); written to {prefix}.*")
+        prune(self.out_dir, get_settings().profile_keep)
+        return prefix
+
+
+@contextmanager
+def phase(name: str):
+    """Time a block of the current rerun; a no-op unless it is being profiled."""
+    profiler = getattr(_local, "profiler", None)
+    if profiler is None:
+        yield
+        return
+    with profiler.phase(name):
+        yield
+
+
+@contextmanager
+def _disabled():
+    yield None
+
+
+def requested_mode(query_params=None) -> Optional[str]:
+    """Profiling mode for this rerun from PROFILE_RERUNS or the query string."""
+    settings = get_settings()
+    if settings.profile_reruns:
+        return settings.profile_reruns
+    if query_params is None or not settings.profile_query:
+        return None
+    mode = (query_params.get("profile") or "").strip().lower()
+    if mode not in MODES:
+        return None
+    token = settings.profile_token
+    if not token:
+        logger.warning("Ignoring profile request: PROFILE_QUERY=1 needs a PROFILE_TOKEN")
+        return None
+    if not hmac.compare_digest(str(query_params.get("profile_token") or ""), token):
+        logger.warning("Ignoring profile request with a missing or wrong profile_token")
+        return None
+    return mode
+
+
+def profile_rerun(query_params=None, label: str = "rerun"):
+    """Context manager profiling this rerun if requested, else doing nothing."""
+    mode = requested_mode(query_params)
+    if mode is None:
+        return _disabled()
+    settings = get_settings()
+    return RerunProfiler(
+        mode,
+        settings.profile_dir,
+        label=label,
+        sample_interval=settings.profile_sample_ms / 1000,
+    )
+
+
+def prune(out_dir: str, keep: int) -> None:
+    """Delete the oldest report files beyond the newest ``keep`` reruns."""
+    runs = sorted({name.rsplit(".", 1)[0] for name in os.listdir(out_dir)})
+    for run in runs[:max(0, len(runs) - keep)]:
+        for ext in (".json", ".collapsed", ".prof", ".txt"):
+            try:
+                os.remove(os.path.join(out_dir, run + ext))
+            except FileNotFoundError:
+                pass
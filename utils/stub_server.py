@@ -0,0 +1,207 @@
+"""Local stub of an OpenAI-compatible / Ollama model server.
+
+Serves ``GET /v1/models``, streaming and non-streaming
+``POST /v1/chat/completions``, Ollama's ``POST /api/chat`` and
+``POST /api/embeddings`` with canned output
+and configurable latency, so routing, load tests and benchmarks can run
+without a real model host.
+
+Usage:
+    python -m utils.stub_server --port 11500 --ttft 0.2 --token-delay 0.01
+"""
+import argparse
+import json
+import time
+import threading
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+class StubConfig:
+    """Behaviour knobs of a stub server, mutable while it runs."""
+
+    def __init__(
+        self,
+        reply: str = "This is a stub answer from the local test model server.",
+        ttft: float = 0.0,
+        token_delay: float = 0.0,
+        status: int = 200,
+        max_concurrency: Optional[int] = None,
+        embedding_dim: int = 32,
+    ):
+        self.reply = reply
+        self.ttft = ttft
+        self.token_delay = token_delay
+        self.status = status
+        self.max_concurrency = max_concurrency
+        self.embedding_dim = embedding_dim
+        self.requests = 0
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+
+def stub_embedding(text: str, dim: int = 32):
+    """Deterministic pseudo-embedding of ``text``."""
+    digest = hashlib.sha256(text.encode()).digest()
+    return [(digest[i % len(digest)] - 128) / 128 for i in range(dim)]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    config: StubConfig = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path.rstrip("/") in ("/v1/models", "/models", "/api/tags"):
+            self._send_json(200, {"object": "list", "data": [{"id": "stub", "object": "model"}], "models": []})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        config = self.config
+        payload = self._read_json()
+        with config.lock:
+            config.requests += 1
+            busy = config.max_concurrency is not None and config.in_flight >= config.max_concurrency
+            if not busy:
+                config.in_flight += 1
+        if busy:
+            self._send_json(429, {"error": "busy"})
+            return
+        try:
+            if config.status != 200:
+                self._send_json(config.status, {"error": "stub failure"})
+            elif self.path.endswith("/embeddings"):
+                text = payload.get("prompt") or payload.get("input") or ""
+                self._send_json(200, {"embedding": stub_embedding(str(text), config.embedding_dim)})
+            elif self.path.endswith("/chat/completions"):
+                self._chat(payload)
+            elif self.path.rstrip("/") == "/api/chat":
+                self._native_chat(payload)
+            else:
+                self._send_json(404, {"error": "not found"})
+        finally:
+            with config.lock:
+                config.in_flight -= 1
+
+    def _chat(self, payload) -> None:
+        config = self.config
+        tokens = [word + " " for word in config.reply.split()]
+        time.sleep(config.ttft)
+        if not payload.get("stream"):
+            time.sleep(config.token_delay * len(tokens))
+            self._send_json(200, {
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens)},
+            })
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        try:
+            for token in tokens:
+                chunk = {"choices": [{"index": 0, "delta": {"content": token}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+                time.sleep(config.token_delay)
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Client cancelled the stream
+            pass
+
+    def _native_chat(self, payload) -> None:
+        """Ollama /api/chat: newline-delimited JSON chunks, final one with counters."""
+        config = self.config
+        tokens = [word + " " for word in config.reply.split()]
+        prompt_chars = sum(len(m.get("content", "")) for m in payload.get("messages", []))
+        time.sleep(config.ttft)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        try:
+            for token in tokens:
+                chunk = {"message": {"role": "assistant", "content": token}, "done": False}
+                self.wfile.write((json.dumps(chunk) + "\n").encode())
+                self.wfile.flush()
+                time.sleep(config.token_delay)
+            final = {
+                "message": {"role": "assistant", "content": ""},
+                "done": True,
+                "prompt_eval_count": max(1, prompt_chars // 4),
+                "prompt_eval_duration": int(config.ttft * 1e9),
+                "eval_count": len(tokens),
+                "eval_duration": int(config.token_delay * len(tokens) * 1e9),
+            }
+            self.wfile.write((json.dumps(final) + "\n").encode())
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class StubServer:
+    """Run a stub model server on a background thread."""
+
+    def __init__(self, port: int = 0, config: Optional[StubConfig] = None, host: str = "127.0.0.1"):
+        self.config = config or StubConfig()
+        handler = type("BoundStubHandler", (StubHandler,), {"config": self.config})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def openai_url(self) -> str:
+        return f"{self.url}/v1"
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a stub OpenAI-compatible model server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--ttft", type=float, default=0.1, help="Seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="Seconds between tokens")
+    parser.add_argument("--max-concurrency", type=int, default=None, help="Reply 429 above this")
+    args = parser.parse_args()
+    server = StubServer(
+        args.port,
+        StubConfig(ttft=args.ttft, token_delay=args.token_delay, max_concurrency=args.max_concurrency),
+        host=args.host,
+    )
+    print(f"Stub model server listening on {server.openai_url}")
+    server.httpd.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,9 @@ from streamlit import cache_data, cache_resource
 import logging
 from typing import List, Dict, Optional
 from datetime import datetime
+import time
 import streamlit as st
+from src.settings import get_settings
 logger = logging.getLogger(__name__)
 
 @cache_data(ttl=600)
@@ -14,10 +16,69 @@ def get_secret(key: str) -> str:
     """Get a secret from Streamlit's secrets manager with caching."""
     return secrets.get(key)
 
-@cache_data(ttl=600)
-def get_env(key: str) -> str:
-    """Get an environment variable with caching."""
-    return os.getenv(key)
+class StreamRenderer:
+    """Coalesces streamed chunks into rate-limited placeholder updates.
+
+    Chunks are buffered in a list and the placeholder is re-rendered at most
+    every ``interval`` seconds, or sooner once ``max_pending`` chunks are
+    waiting, instead of once per chunk. ``finalize`` renders the full text
+    once more if anything is still pending.
+    """
+
+    def __init__(self, placeholder, interval: float = 0.05, max_pending: int = 64, render: str = "write"):
+        self.placeholder = placeholder
+        self.interval = interval
+        self.max_pending = max_pending
+        self.render = render
+        self.parts: List[str] = []
+        self.pending = 0
+        self.renders = 0
+        self.bytes_sent = 0
+        self.chunks = 0
+        self._last_flush = time.monotonic()
+
+    @classmethod
+    def from_env(cls, placeholder, render: str = "write") -> "StreamRenderer":
+        settings = get_settings()
+        return cls(
+            placeholder,
+            interval=settings.stream_flush_ms / 1000,
+            max_pending=settings.stream_flush_chunks,
+            render=render,
+        )
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def add(self, chunk: str) -> None:
+        if not chunk:
+            return
+        self.parts.append(chunk)
+        self.chunks += 1
+        self.pending += 1
+        if self.pending >= self.max_pending or time.monotonic() - self._last_flush >= self.interval:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.pending:
+            return
+        # Join once per render rather than growing a string per chunk
+        text = "".join(self.parts)
+        self.parts = [text]
+        getattr(self.placeholder, self.render)(text)
+        self.renders += 1
+        self.bytes_sent += len(text.encode())
+        self.pending = 0
+        self._last_flush = time.monotonic()
+
+    def finalize(self) -> str:
+        self.flush()
+        return self.text
+
+    def stats(self) -> Dict[str, int]:
+        return {"chunks": self.chunks, "renders": self.renders, "bytes_sent": self.bytes_sent}
+
 
 class ChatUI:
     """Handles the Streamlit chat interface and message management."""
@@ -27,6 +88,8 @@ class ChatUI:
         self.messages = []
         self.input_placeholder = "Type your message here..."
         self.max_messages = 100
+        self.state = None
+        self.last_render_stats: Dict[str, int] = {}
         self.message_container = st.container()
         self.setup_chat_container()
     
@@ -57,11 +120,17 @@ class ChatUI:
             </style>
         """, unsafe_allow_html=True)
     
+    def bind(self, state: Dict) -> None:
+        """Keep the chat history in ``state`` instead of st.session_state."""
+        self.state = state
+    
+    def _history_store(self):
+        return self.state if self.state is not None else st.session_state
+    
     def load_chat_history(self) -> List[Dict[str, str]]:
         """Load chat history from session state."""
         try:
-            import streamlit as st
-            return st.session_state.get('chat_history', [])
+            return self._history_store().get('chat_history', [])
         except Exception as e:
             logger.error(f"Error loading chat history: {str(e)}")
             return []
@@ -69,10 +138,9 @@ class ChatUI:
     def save_chat_history(self, messages: List[Dict[str, str]]) -> None:
         """Save chat history to session state."""
         try:
-            import streamlit as st
             if len(messages) > self.max_messages:
                 messages = messages[-self.max_messages:]
-            st.session_state['chat_history'] = messages
+            self._history_store()['chat_history'] = messages
         except Exception as e:
             logger.error(f"Error saving chat history: {str(e)}")
     
@@ -148,8 +216,7 @@ class ChatUI:
     def clear_chat_history(self) -> None:
         """Clear the chat history."""
         try:
-            import streamlit as st
-            st.session_state['chat_history'] = []
+            self._history_store()['chat_history'] = []
             self.messages = []
         except Exception as e:
             logger.error(f"Error clearing chat history: {str(e)}")
@@ -237,13 +304,13 @@ class ChatUI:
         """Stream a message with typing effect."""
         try:
             with st.chat_message(role):
-                message_placeholder = st.empty()
-                full_content = ""
+                renderer = StreamRenderer.from_env(st.empty())
                 
-                # Stream the content
+                # Stream the content with coalesced re-renders
                 for content_chunk in content_generator:
-                    full_content += content_chunk
-                    message_placeholder.write(full_content)
+                    renderer.add(content_chunk)
+                full_content = renderer.finalize()
+                self.record_render_stats(renderer)
                 
                 # Save the complete message
                 self.add_message(role, full_content)
@@ -253,6 +320,50 @@ class ChatUI:
             # Fallback to normal display
             self.add_message(role, "".join(content_generator))
 
+    def stream_reasoned_message(self, role: str, events, show_reasoning: bool = True) -> str:
+        """Stream (kind, text) events, rendering reasoning in a collapsed expander.
+
+        Only the answer is saved to the chat history and returned. If the
+        events fail midway, the text that arrived stays on screen and the
+        error is re-raised for the caller to report: a truncated answer is
+        never saved as if it were complete.
+        """
+        with st.chat_message(role):
+            reasoning_renderer = None
+            if show_reasoning:
+                with st.expander("Reasoning", expanded=False):
+                    reasoning_renderer = StreamRenderer.from_env(st.empty(), render="markdown")
+            answer_renderer = StreamRenderer.from_env(st.empty())
+            
+            try:
+                for kind, text in events:
+                    if kind == "reasoning":
+                        if reasoning_renderer is not None:
+                            reasoning_renderer.add(text)
+                    else:
+                        answer_renderer.add(text)
+            finally:
+                # Show whatever was buffered, also when the stream failed
+                if reasoning_renderer is not None:
+                    reasoning_renderer.finalize()
+                answer = answer_renderer.finalize()
+                self.record_render_stats(answer_renderer, reasoning_renderer)
+            
+        answer = answer.strip()
+        if answer:
+            self.add_message(role, answer)
+        return answer
+
+    def record_render_stats(self, *renderers) -> None:
+        """Keep render counts and bytes sent of the last streamed message."""
+        stats = {"chunks": 0, "renders": 0, "bytes_sent": 0}
+        for renderer in renderers:
+            if renderer is not None:
+                for key, value in renderer.stats().items():
+                    stats[key] += value
+        self.last_render_stats = stats
+        logger.debug(f"Streamed {stats['chunks']} chunks in {stats['renders']} renders ({stats['bytes_sent']} bytes)")
+
     def get_recent_messages(self, limit: int = 5) -> List[Dict[str, str]]:
         """Get the most recent messages from chat history."""
         try: